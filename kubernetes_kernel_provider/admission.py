@@ -0,0 +1,231 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Pre-launch admission checks for Kubernetes kernels.
+
+Before any Kubernetes objects are created for a kernel, its resource requests (and limits) are compared
+against the ResourceQuota headroom of the target namespace and the free allocatable capacity of the best-fit
+node.  Node and pod state is taken from a cluster-wide cache that is refreshed (via a single LIST
+per kind) no more often than every EG_KERNEL_ADMISSION_CACHE_TTL seconds so that bursts of launches
+do not each hit the API server.
+
+The node check is intentionally optimistic - node selectors, affinity and taints are not evaluated -
+so a kernel is only turned away when *no* node could possibly host it.  Likewise, the capacity held by
+capacity buffer placeholder pods (see capacity_buffer.py) is treated as free, since kernels preempt them.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+from kubernetes import client
+from traitlets.log import get_logger
+
+from . import capacity_buffer, metrics
+
+# One of 'none' (no admission checks), 'reject' (fail the launch immediately) or 'queue' (wait for capacity).
+admission_policy = os.environ.get('EG_KERNEL_ADMISSION_POLICY', 'none').lower()
+admission_cache_ttl = float(os.environ.get('EG_KERNEL_ADMISSION_CACHE_TTL', '5'))
+admission_queue_interval = float(os.environ.get('EG_KERNEL_ADMISSION_QUEUE_INTERVAL', '2'))
+
+ADMISSION_POLICIES = ['none', 'reject', 'queue']
+
+
+def validate_policy(policy, log):
+    """Returns `policy` if it's a supported admission policy, otherwise reports it and returns 'none'."""
+    if policy in ADMISSION_POLICIES:
+        return policy
+    log.warning("EG_KERNEL_ADMISSION_POLICY '{}' is not one of {} - kernel admission checks are disabled.".
+                format(policy, ADMISSION_POLICIES))
+    return 'none'
+
+
+admission_policy = validate_policy(admission_policy, get_logger())
+
+# Maps the kernel env variables that convey resource requests to the resource names used by the scheduler.
+KERNEL_REQUEST_ENVS = {'cpu': 'KERNEL_CPUS', 'memory': 'KERNEL_MEMORY', 'nvidia.com/gpu': 'KERNEL_GPUS'}
+KERNEL_LIMIT_ENVS = {'cpu': 'KERNEL_CPUS_LIMIT', 'memory': 'KERNEL_MEMORY_LIMIT', 'nvidia.com/gpu': 'KERNEL_GPUS_LIMIT'}
+
+_quantity_suffixes = {
+    'Ki': 2 ** 10, 'Mi': 2 ** 20, 'Gi': 2 ** 30, 'Ti': 2 ** 40, 'Pi': 2 ** 50, 'Ei': 2 ** 60,
+    'n': 1e-9, 'u': 1e-6, 'm': 1e-3, '': 1, 'k': 1e3, 'K': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12, 'P': 1e15, 'E': 1e18,
+}
+_quantity_re = re.compile(r'^([+-]?[0-9.]+(?:[eE][+-]?[0-9]+)?)([a-zA-Z]*)$')
+
+AdmissionResult = namedtuple('AdmissionResult', ['admitted', 'reason', 'headroom'])
+
+
+def parse_quantity(quantity):
+    """Converts a Kubernetes resource quantity (e.g., '500m', '2Gi', 4) to a float."""
+    if quantity is None:
+        return 0.0
+    if isinstance(quantity, (int, float)):
+        return float(quantity)
+    match = _quantity_re.match(str(quantity).strip())
+    if not match or match.group(2) not in _quantity_suffixes:
+        raise ValueError("Invalid resource quantity: '{}'".format(quantity))
+    return float(match.group(1)) * _quantity_suffixes[match.group(2)]
+
+
+def get_kernel_requests(env):
+    """Returns the kernel's resource requests (as floats) derived from the KERNEL_ resource env values.
+
+    Limits are used when the corresponding request has not been provided since Kubernetes will default
+    the request to the limit in that case.
+    """
+    requests = {}
+    for resource, env_name in KERNEL_REQUEST_ENVS.items():
+        value = env.get(env_name) or env.get(KERNEL_LIMIT_ENVS[resource])
+        if value:
+            requests[resource] = parse_quantity(value)
+    return requests
+
+
+def get_kernel_limits(env):
+    """Returns the kernel's resource limits (as floats) derived from the KERNEL_ resource limit env values."""
+    limits = {}
+    for resource, env_name in KERNEL_LIMIT_ENVS.items():
+        value = env.get(env_name)
+        if value:
+            limits[resource] = parse_quantity(value)
+    return limits
+
+
+def _pod_requests(pod):
+    """Sums the container requests of a pod, taking init containers into account like the scheduler does."""
+    totals = {}
+    for container in pod.spec.containers or []:
+        resources = container.resources
+        for resource, value in ((resources and resources.requests) or {}).items():
+            totals[resource] = totals.get(resource, 0.0) + parse_quantity(value)
+    for container in pod.spec.init_containers or []:
+        resources = container.resources
+        for resource, value in ((resources and resources.requests) or {}).items():
+            totals[resource] = max(totals.get(resource, 0.0), parse_quantity(value))
+    return totals
+
+
+class ClusterStateCache(object):
+    """Caches the free allocatable capacity of each schedulable node.
+
+    The cache is refreshed from one LIST of nodes and one LIST of non-terminated pods when its
+    contents are older than `ttl` seconds.  Refreshes are serialized so concurrent launches share
+    the results of a single refresh.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.refreshed = 0.0
+        self.node_free = {}
+        self._lock = threading.Lock()
+
+    def get_node_free(self):
+        with self._lock:
+            if time.time() - self.refreshed > self.ttl:
+                self._refresh()
+            return self.node_free
+
+    def invalidate(self):
+        with self._lock:
+            self.refreshed = 0.0
+
+    def _refresh(self):
+        api = client.CoreV1Api()
+        allocatable = {}
+        for node in api.list_node().items:
+            if node.spec.unschedulable:
+                continue
+            ready = [c for c in (node.status.conditions or []) if c.type == 'Ready' and c.status == 'True']
+            if not ready:
+                continue
+            allocatable[node.metadata.name] = \
+                {resource: parse_quantity(value) for resource, value in (node.status.allocatable or {}).items()}
+
+        pods = api.list_pod_for_all_namespaces(field_selector='status.phase!=Succeeded,status.phase!=Failed')
+        for pod in pods.items:
+            node_free = allocatable.get(pod.spec.node_name)
+            if node_free is None:
+                continue
+            if (pod.metadata.labels or {}).get('component') == capacity_buffer.COMPONENT_LABEL:
+                continue  # placeholders are preempted by kernels, so their capacity is available
+            for resource, value in _pod_requests(pod).items():
+                node_free[resource] = node_free.get(resource, 0.0) - value
+            node_free['pods'] = node_free.get('pods', 0.0) - 1
+
+        self.node_free = allocatable
+        self.refreshed = time.time()
+
+
+cluster_state = ClusterStateCache(admission_cache_ttl)
+
+
+def get_quota_headroom(namespace):
+    """Returns the smallest remaining headroom, per quota resource, across all ResourceQuotas in `namespace`."""
+    headroom = {}
+    for quota in client.CoreV1Api().list_namespaced_resource_quota(namespace=namespace).items:
+        hard = (quota.status and quota.status.hard) or (quota.spec and quota.spec.hard) or {}
+        used = (quota.status and quota.status.used) or {}
+        for resource, value in hard.items():
+            remaining = parse_quantity(value) - parse_quantity(used.get(resource))
+            headroom[resource] = min(remaining, headroom.get(resource, remaining))
+    return headroom
+
+
+def find_best_fit_node(node_free, requests):
+    """Returns the name of the node whose free capacity most tightly fits `requests`, or None if none fit."""
+    best_node, best_score = None, None
+    for node_name, free in node_free.items():
+        if free.get('pods', 1.0) < 1.0:
+            continue
+        if any(free.get(resource, 0.0) < value for resource, value in requests.items()):
+            continue
+        # Score by the fraction of each requested resource that would remain - lower is a tighter fit.
+        score = sum((free.get(resource, 0.0) - value) / max(free.get(resource, 0.0), 1e-9)
+                    for resource, value in requests.items())
+        if best_score is None or score < best_score:
+            best_node, best_score = node_name, score
+    return best_node
+
+
+def check_admission(namespace, requests, limits=None):
+    """Determines if a kernel with the given `requests` (and `limits`) can be admitted into `namespace`.
+
+    `namespace` is None when the kernel's namespace has yet to be created (and therefore has no quotas).
+    The returned AdmissionResult includes the headroom that was computed so callers can report it.
+    This performs blocking API requests, so callers on the event loop should run it in an executor.
+    """
+    headroom = {}
+
+    if namespace:
+        quota_headroom = get_quota_headroom(namespace)
+        for resource, remaining in quota_headroom.items():
+            metrics.set_gauge('kernel_admission_quota_headroom', remaining, namespace=namespace, resource=resource)
+        headroom['quota'] = quota_headroom
+
+        needed = {'pods': 1.0, 'count/pods': 1.0}
+        for resource, value in requests.items():
+            needed[resource] = value
+            needed['requests.' + resource] = value
+        for resource, value in (limits or {}).items():
+            needed['limits.' + resource] = value
+        for resource, value in needed.items():
+            if resource in quota_headroom and quota_headroom[resource] < value:
+                reason = "ResourceQuota in namespace '{}' has insufficient '{}' headroom " \
+                         "({} remaining, {} needed).".format(namespace, resource, quota_headroom[resource], value)
+                return AdmissionResult(False, reason, headroom)
+
+    node_free = cluster_state.get_node_free()
+    for resource in set(requests) | {'cpu', 'memory'}:
+        largest = max([free.get(resource, 0.0) for free in node_free.values()] or [0.0])
+        metrics.set_gauge('kernel_admission_node_headroom', largest, resource=resource)
+    headroom['nodes'] = len(node_free)
+
+    if requests:
+        best_node = find_best_fit_node(node_free, requests)
+        headroom['best_fit_node'] = best_node
+        if best_node is None:
+            reason = "No schedulable node has sufficient free capacity for the kernel's requests: {}.".\
+                format(requests)
+            return AdmissionResult(False, reason, headroom)
+
+    return AdmissionResult(True, None, headroom)
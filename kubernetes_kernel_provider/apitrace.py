@@ -0,0 +1,245 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Recording and replay of the Kubernetes API calls made by the provider.
+
+When K8SKP_API_TRACE_FILE is set, every Kubernetes API request made through the kubernetes client - by
+the provider and by launch_kubernetes.py (which inherits the setting) - is appended to that file as a
+single JSON line of the form:
+
+    {"ts": 1700000000.123, "pid": 42, "src": "provider", "verb": "GET", "resource": "pods",
+     "ns": "kernels", "path": "/api/v1/namespaces/kernels/pods", "status": 200, "latency": 0.0123,
+     "bytes": 5120}
+
+where `ts` is the request's start time, `latency` its duration in seconds and `bytes` the size of the
+response body (null for streamed responses, such as watches).  Requests made over websockets (e.g.,
+exec) are not recorded.
+
+A recorded trace can be replayed (`jupyter k8s-kernelspec replay`) against a local stub API server that
+responds to each request with its recorded status, latency and response size.  Requests are issued at
+their recorded offsets (optionally scaled by `speed`), so the trace's original concurrency is
+reproduced, allowing the provider's API traffic shapes to be benchmarked offline.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode, urlparse
+
+import urllib3
+from kubernetes.client import rest
+
+trace_file = os.getenv('K8SKP_API_TRACE_FILE')
+
+TRACE_INDEX_HEADER = 'X-K8SKP-Trace-Index'
+
+_lock = threading.Lock()
+_trace = None
+_source = None
+_original_request = None
+
+
+def parse_resource(path):
+    """Returns the (resource, namespace) addressed by a Kubernetes API path - e.g., ('pods/exec', 'kernels')."""
+    parts = [part for part in path.split('/') if part]
+    if parts[:1] == ['api']:
+        parts = parts[2:]  # api/<version>
+    elif parts[:1] == ['apis']:
+        parts = parts[3:]  # apis/<group>/<version>
+    else:
+        return path, None
+    namespace = None
+    if len(parts) > 2 and parts[0] == 'namespaces':
+        namespace = parts[1]
+        parts = parts[2:]
+    elif len(parts) == 2 and parts[0] == 'namespaces':
+        namespace = parts[1]
+    resource = parts[0] if parts else ''
+    if len(parts) > 2:
+        resource = "{}/{}".format(resource, parts[2])
+    return resource, namespace
+
+
+def _record(entry):
+    line = json.dumps(entry, separators=(',', ':')) + '\n'
+    with _lock:
+        _trace.write(line)
+        _trace.flush()
+
+
+def _response_bytes(response):
+    """Returns the size of an already-loaded response body, falling back to its Content-Length (None for
+    streamed responses, whose body hasn't been read)."""
+    if not isinstance(response, rest.RESTResponse):
+        return None  # the raw urllib3 response of a streamed request
+    data = getattr(response, 'data', None)
+    if data is not None:
+        return len(data)
+    length = response.getheader('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+def _traced_request(self, method, url, *args, **kwargs):
+    # the arguments are passed through unchanged since request()'s signature differs between client versions
+    parsed = urlparse(url)
+    resource, namespace = parse_resource(parsed.path)
+    entry = {'ts': round(time.time(), 6), 'pid': os.getpid(), 'src': _source, 'verb': method,
+             'resource': resource, 'ns': namespace, 'path': parsed.path}
+    query = parsed.query or urlencode(kwargs.get('query_params') or [])  # older clients pass the query separately
+    if query:
+        entry['query'] = query
+    start = time.time()
+    try:
+        response = _original_request(self, method, url, *args, **kwargs)
+        entry.update({'status': response.status, 'bytes': _response_bytes(response)})
+        return response
+    except rest.ApiException as err:
+        entry.update({'status': err.status, 'bytes': len(err.body or '')})
+        raise
+    except Exception as err:
+        entry.update({'status': 0, 'bytes': 0, 'error': type(err).__name__})
+        raise
+    finally:
+        entry['latency'] = round(time.time() - start, 6)
+        _record(entry)
+
+
+def install(source='provider', path=None):
+    """Records all Kubernetes API requests of this process to `path` (default K8SKP_API_TRACE_FILE).  A no-op
+    if no file is configured or recording is already installed."""
+    global _trace, _original_request, _source
+    path = path or trace_file
+    if not path or _original_request is not None:
+        return False
+    _trace = open(path, 'a')  # appends of single lines keep the traces of concurrent processes intact
+    _source = source
+    _original_request = rest.RESTClientObject.request
+    rest.RESTClientObject.request = _traced_request
+    return True
+
+
+def load_trace(path):
+    """Loads a recorded trace, ordered by start time."""
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return sorted(entries, key=lambda entry: entry['ts'])
+
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _stub_handler(entries):
+    class StubHandler(BaseHTTPRequestHandler):
+        """Responds to replayed requests with their recorded latency, status and response size."""
+        def _respond(self):
+            entry = entries[int(self.headers.get(TRACE_INDEX_HEADER, 0))]
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(entry.get('latency', 0))
+            body = b'x' * (entry.get('bytes') or 0)
+            self.send_response(entry.get('status') or 500)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _respond
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(entries, port=0):
+    """Starts a stub API server for `entries` on a background thread, returning the server."""
+    server = _StubServer(('127.0.0.1', port), _stub_handler(entries))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def max_in_flight(entries):
+    """Returns the maximum number of concurrently outstanding requests in `entries`."""
+    events = sorted([(entry['ts'], 1) for entry in entries] +
+                    [(entry['ts'] + entry.get('latency', 0), -1) for entry in entries], key=lambda e: (e[0], e[1]))
+    current = maximum = 0
+    for _, delta in events:
+        current += delta
+        maximum = max(maximum, current)
+    return maximum
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def replay(entries, target=None, speed=1.0, max_workers=256):
+    """Replays `entries` against `target` (a URL) or, if not specified, a local stub API server.  Requests are
+    issued at their recorded offsets divided by `speed`.  Returns a summary of the replay."""
+    server = None
+    if target is None:
+        server = start_stub_server(entries)
+        target = "http://127.0.0.1:{}".format(server.server_address[1])
+    http = urllib3.PoolManager(maxsize=max_workers)
+    results = [None] * len(entries)
+    in_flight = [0, 0]  # current, maximum
+    counter_lock = threading.Lock()
+
+    def issue(index, entry):
+        with counter_lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        url = target + entry['path'] + ('?' + entry['query'] if entry.get('query') else '')
+        start = time.time()
+        try:
+            response = http.request(entry['verb'], url, headers={TRACE_INDEX_HEADER: str(index)}, retries=False,
+                                    body=b'{}' if entry['verb'] in ('POST', 'PUT', 'PATCH') else None)
+            status = response.status
+        except Exception:  # connection errors, etc.
+            status = 0
+        finally:
+            with counter_lock:
+                in_flight[0] -= 1
+        results[index] = (status, time.time() - start)
+
+    start_time = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for index, entry in enumerate(entries):
+                delay = (entry['ts'] - entries[0]['ts']) / speed - (time.time() - start_time)
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(issue, index, entry)
+        duration = time.time() - start_time
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+
+    calls = {}
+    for entry, (status, latency) in zip(entries, results):
+        call = calls.setdefault("{} {}".format(entry['verb'], entry['resource']),
+                                {'count': 0, 'mismatches': 0, 'latencies': []})
+        call['count'] += 1
+        call['mismatches'] += int(status != entry.get('status'))
+        call['latencies'].append(latency)
+    recorded_duration = max(entry['ts'] + entry.get('latency', 0) for entry in entries) - entries[0]['ts']
+    return {'requests': len(entries), 'duration': duration,
+            'recorded_duration': recorded_duration, 'max_in_flight': in_flight[1],
+            'recorded_max_in_flight': max_in_flight(entries),
+            'calls': {name: {'count': call['count'], 'mismatches': call['mismatches'],
+                             'p50': _percentile(call['latencies'], 50), 'p99': _percentile(call['latencies'], 99)}
+                      for name, call in sorted(calls.items())}}
@@ -0,0 +1,182 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Maintains a buffer of low-priority placeholder pods that keep autoscaled cluster capacity warm.
+
+The buffer is a Deployment of 'pause' pods, sized like a typical kernel, that run under a PriorityClass
+whose value is lower than that of kernel pods.  When a kernel cannot otherwise be scheduled, it preempts
+a placeholder and starts immediately on an already-provisioned node.  The evicted placeholder is
+re-created by its ReplicaSet and, if it no longer fits, triggers the cluster autoscaler to add a node
+in the background.
+
+The number of placeholders can vary by time of day using K8SKP_CAPACITY_BUFFER_SCHEDULE, a
+semicolon-separated list of '[<days> ]<HH:MM>-<HH:MM>=<count>' entries, the first matching entry
+winning.  For example: 'Mon-Fri 08:00-18:00=10; 18:00-22:00=4'.  Windows may span midnight (e.g.,
+'Fri 22:00-02:00=6').  When no entry matches, K8SKP_CAPACITY_BUFFER_SIZE is used.
+"""
+
+import asyncio
+import os
+import re
+from datetime import datetime
+
+from kubernetes import client
+
+buffer_size = int(os.getenv('K8SKP_CAPACITY_BUFFER_SIZE', '0'))
+buffer_schedule = os.getenv('K8SKP_CAPACITY_BUFFER_SCHEDULE', '')
+buffer_namespace = os.getenv('K8SKP_CAPACITY_BUFFER_NAMESPACE', os.getenv('EG_NAMESPACE', 'default'))
+buffer_name = os.getenv('K8SKP_CAPACITY_BUFFER_NAME', 'kernel-capacity-buffer')
+buffer_cpu = os.getenv('K8SKP_CAPACITY_BUFFER_CPU', '500m')
+buffer_memory = os.getenv('K8SKP_CAPACITY_BUFFER_MEMORY', '1Gi')
+buffer_image = os.getenv('K8SKP_CAPACITY_BUFFER_IMAGE', 'registry.k8s.io/pause:3.9')
+buffer_priority_class = os.getenv('K8SKP_CAPACITY_BUFFER_PRIORITY_CLASS', 'kernel-capacity-buffer')
+buffer_priority_value = int(os.getenv('K8SKP_CAPACITY_BUFFER_PRIORITY_VALUE', '-10'))
+buffer_interval = float(os.getenv('K8SKP_CAPACITY_BUFFER_INTERVAL_SECS', '60'))
+
+DAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+COMPONENT_LABEL = 'kernel-capacity-buffer'  # the 'component' label value of the placeholder pods
+
+_schedule_entry_re = re.compile(r'^(?:(?P<days>[A-Za-z,\-]+)\s+)?(?P<start>\d{1,2}:\d{2})-(?P<end>\d{1,2}:\d{2})\s*='
+                                r'\s*(?P<count>\d+)$')
+
+
+def _parse_day(day):
+    if day[:3] not in DAYS:
+        raise ValueError("Invalid capacity buffer schedule day: '{}'".format(day))
+    return DAYS.index(day[:3])
+
+
+def _parse_days(days):
+    """Converts a day specification (e.g., 'Mon-Fri' or 'Sat,Sun') to a set of weekday numbers."""
+    if not days:
+        return set(range(7))
+    result = set()
+    for part in days.lower().split(','):
+        if '-' in part:
+            first, last = part.split('-', 1)
+            first, last = _parse_day(first), _parse_day(last)
+            result.update(range(first, last + 1) if first <= last else list(range(first, 7)) + list(range(last + 1)))
+        else:
+            result.add(_parse_day(part))
+    return result
+
+
+def _parse_minutes(hhmm):
+    hours, minutes = hhmm.split(':')
+    if int(hours) > 24 or int(minutes) > 59 or (int(hours) == 24 and int(minutes)):
+        raise ValueError("Invalid capacity buffer schedule time: '{}'".format(hhmm))
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_schedule(schedule):
+    """Parses a buffer schedule string into a list of (days, start_minute, end_minute, count) tuples."""
+    entries = []
+    for entry in schedule.split(';'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        match = _schedule_entry_re.match(entry)
+        if not match:
+            raise ValueError("Invalid capacity buffer schedule entry: '{}'".format(entry))
+        entries.append((_parse_days(match.group('days')), _parse_minutes(match.group('start')),
+                        _parse_minutes(match.group('end')), int(match.group('count'))))
+    return entries
+
+
+def desired_size(entries, default_size, now=None):
+    """Returns the placeholder count for the time `now` (defaults to the current local time).
+
+    Windows that end before they start span midnight, with the hours after midnight belonging to the
+    day on which the window started (e.g., 'Fri 22:00-02:00' includes Saturday 01:00).
+    """
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    weekday = now.weekday()
+    for days, start, end, count in entries:
+        if start <= end:
+            in_window = weekday in days and start <= minute < end
+        else:
+            in_window = (weekday in days and minute >= start) or ((weekday - 1) % 7 in days and minute < end)
+        if in_window:
+            return count
+    return default_size
+
+
+def is_enabled():
+    return buffer_size > 0 or bool(buffer_schedule.strip())
+
+
+class CapacityBuffer(object):
+    """Reconciles the placeholder Deployment (and its PriorityClass) with the scheduled buffer size."""
+    def __init__(self, log):
+        self.log = log
+        self.schedule = parse_schedule(buffer_schedule)
+        self.current_size = None
+        self.labels = {'app': 'enterprise-gateway', 'component': COMPONENT_LABEL}
+
+    def reconcile(self):
+        # The scale is applied on every pass (not just on change) so that an externally deleted or
+        # rescaled Deployment is restored.
+        size = desired_size(self.schedule, buffer_size)
+        if self.current_size is None:
+            self._ensure_priority_class()
+        try:
+            client.AppsV1Api().patch_namespaced_deployment_scale(
+                name=buffer_name, namespace=buffer_namespace, body={'spec': {'replicas': size}})
+        except client.rest.ApiException as err:
+            if err.status != 404:
+                raise
+            client.AppsV1Api().create_namespaced_deployment(namespace=buffer_namespace,
+                                                            body=self._build_deployment(size))
+        if size != self.current_size:
+            self.log.info("Kernel capacity buffer '{}' in namespace '{}' set to {} placeholder pod(s).".
+                          format(buffer_name, buffer_namespace, size))
+        self.current_size = size
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, self.reconcile)
+            except Exception as err:
+                self.log.warning("Error occurred reconciling kernel capacity buffer: {}".format(err))
+            await asyncio.sleep(buffer_interval)
+
+    def _ensure_priority_class(self):
+        body = client.V1PriorityClass(
+            metadata=client.V1ObjectMeta(name=buffer_priority_class, labels=self.labels),
+            value=buffer_priority_value, global_default=False,
+            description="Placeholder pods that are preempted by Jupyter kernel pods.")
+        try:
+            client.SchedulingV1Api().create_priority_class(body=body)
+        except client.rest.ApiException as err:
+            if err.status != 409:  # okay if it already exists
+                raise
+
+    def _build_deployment(self, size):
+        resources = client.V1ResourceRequirements(requests={'cpu': buffer_cpu, 'memory': buffer_memory},
+                                                  limits={'cpu': buffer_cpu, 'memory': buffer_memory})
+        container = client.V1Container(name='placeholder', image=buffer_image, resources=resources)
+        pod_spec = client.V1PodSpec(containers=[container], priority_class_name=buffer_priority_class,
+                                    termination_grace_period_seconds=0)
+        template = client.V1PodTemplateSpec(metadata=client.V1ObjectMeta(labels=self.labels), spec=pod_spec)
+        spec = client.V1DeploymentSpec(replicas=size, template=template,
+                                       selector=client.V1LabelSelector(match_labels=self.labels))
+        return client.V1Deployment(metadata=client.V1ObjectMeta(name=buffer_name, labels=self.labels), spec=spec)
+
+
+_buffer_task = None
+_invalid_schedule = False
+
+
+def start(log):
+    """Starts the background reconciliation of the capacity buffer, if enabled and not already started.  An
+    invalid schedule disables the buffer (reported once) rather than failing the caller."""
+    global _buffer_task, _invalid_schedule
+    if _buffer_task is None and not _invalid_schedule and is_enabled():
+        try:
+            buffer = CapacityBuffer(log)
+        except ValueError as ve:
+            _invalid_schedule = True
+            log.error("Kernel capacity buffer disabled due to invalid K8SKP_CAPACITY_BUFFER_SCHEDULE: {}".format(ve))
+            return None
+        _buffer_task = asyncio.ensure_future(buffer.run())
+    return _buffer_task
@@ -0,0 +1,171 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Hibernation of idle kernels to a per-user PersistentVolumeClaim.
+
+Kernels that opt in (via KERNEL_HIBERNATION=true) have their user's snapshot PVC (created on demand in
+the kernel's namespace and named '<K8SKP_HIBERNATION_PVC_PREFIX>-<username>') mounted at
+K8SKP_HIBERNATION_MOUNT_PATH.  Hibernating such a kernel asks it to serialize its user namespace to a
+snapshot file on that volume, after which its pod is deleted - freeing its cluster resources.  The
+snapshot is recorded in the kernel manager's env (KERNEL_SNAPSHOT), so when the kernel is next launched -
+either relaunched in place upon its next activity (see KubernetesKernelLifecycleManager.wake()) or
+restarted by the hosting application - the snapshot is restored into the new kernel's user namespace and
+then removed.
+
+Snapshots are supported for Python (IPython) kernels, whose picklable variables (using dill, when available
+in the kernel image) and imported modules are saved, and R kernels, whose global environment and attached
+packages are saved.  Objects that cannot be serialized (open files, connections, etc.) are not retained.
+
+Since the namespace (and the PVC within it) must outlive the kernel's pod, KERNEL_NAMESPACE must be provided
+or EG_SHARED_NAMESPACE enabled.  With the default 'ReadWriteOnce' access mode (K8SKP_HIBERNATION_ACCESS_MODE),
+a user's concurrent hibernation-enabled kernels must be scheduled to the same node.
+"""
+
+import asyncio
+import json
+import os
+import re
+from string import Template
+
+from jupyter_kernel_mgmt.client import IOLoopKernelClient
+from kubernetes import client
+
+pvc_prefix = os.getenv('K8SKP_HIBERNATION_PVC_PREFIX', 'kernel-snapshots')
+storage_class = os.getenv('K8SKP_HIBERNATION_STORAGE_CLASS')
+storage_size = os.getenv('K8SKP_HIBERNATION_STORAGE_SIZE', '10Gi')
+access_mode = os.getenv('K8SKP_HIBERNATION_ACCESS_MODE', 'ReadWriteOnce')
+mount_path = os.getenv('K8SKP_HIBERNATION_MOUNT_PATH', '/var/lib/kernel-snapshots')
+execute_timeout = float(os.getenv('K8SKP_HIBERNATION_TIMEOUT_SECS', '300'))
+
+VOLUME_NAME = 'kernel-snapshots'
+
+# Snapshot code, per kernel language, executed silently within the kernel.  Each variable is serialized
+# individually so that one that cannot be restored does not prevent the restoration of the others.
+PYTHON_SAVE = Template('''
+def __k8skp_save(path):
+    import os, pickle, types
+    try:
+        import dill as pickler
+    except ImportError:
+        pickler = pickle
+    shell = get_ipython()
+    variables, modules = dict(), dict()
+    for name, value in list(shell.user_ns.items()):
+        if name.startswith('_') or name in shell.user_ns_hidden:
+            continue
+        if isinstance(value, types.ModuleType):
+            modules[name] = value.__name__
+            continue
+        try:
+            variables[name] = pickler.dumps(value)
+        except Exception:
+            pass
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(dict(modules=modules, variables=variables), f)
+    os.replace(path + '.tmp', path)
+try:
+    __k8skp_save(${path})
+finally:
+    del __k8skp_save
+''')
+
+PYTHON_RESTORE = Template('''
+def __k8skp_restore(path):
+    import importlib, os, pickle
+    try:
+        import dill as pickler
+    except ImportError:
+        pickler = pickle
+    shell = get_ipython()
+    with open(path, 'rb') as f:
+        snapshot = pickle.load(f)
+    for name, module in snapshot['modules'].items():
+        try:
+            shell.user_ns[name] = importlib.import_module(module)
+        except Exception:
+            pass
+    for name, data in snapshot['variables'].items():
+        try:
+            shell.user_ns[name] = pickler.loads(data)
+        except Exception:
+            pass
+    os.remove(path)
+try:
+    __k8skp_restore(${path})
+finally:
+    del __k8skp_restore
+''')
+
+R_SAVE = Template('''
+local({
+    env <- list2env(mget(ls(envir = .GlobalEnv), envir = .GlobalEnv))
+    assign(".k8skp_packages", .packages(), envir = env)
+    save(list = ls(env, all.names = TRUE), envir = env, file = paste0(${path}, ".tmp"))
+    file.rename(paste0(${path}, ".tmp"), ${path})
+})
+''')
+
+R_RESTORE = Template('''
+local({
+    env <- new.env()
+    load(${path}, envir = env)
+    for (package in rev(get(".k8skp_packages", envir = env))) {
+        try(suppressMessages(library(package, character.only = TRUE)), silent = TRUE)
+    }
+    rm(".k8skp_packages", envir = env)
+    for (name in ls(env, all.names = TRUE)) assign(name, get(name, envir = env), envir = .GlobalEnv)
+    unlink(${path})
+})
+''')
+
+SNAPSHOT_CODE = {'python': ('pickle', PYTHON_SAVE, PYTHON_RESTORE),
+                 'r': ('RData', R_SAVE, R_RESTORE)}
+
+
+def is_supported(language):
+    return (language or '').lower() in SNAPSHOT_CODE
+
+
+def pvc_name(username):
+    name = re.sub('[^0-9a-z]+', '-', "{}-{}".format(pvc_prefix, username).lower()).strip('-')
+    return name[:253]
+
+
+def snapshot_path(kernel_id, language):
+    """Returns the path, within the kernel's pod, of the kernel's snapshot file."""
+    extension = SNAPSHOT_CODE[language.lower()][0]
+    return "{}/{}.{}".format(mount_path.rstrip('/'), kernel_id, extension)
+
+
+def save_code(language, path):
+    return SNAPSHOT_CODE[language.lower()][1].substitute(path=json.dumps(path))
+
+
+def restore_code(language, path):
+    return SNAPSHOT_CODE[language.lower()][2].substitute(path=json.dumps(path))
+
+
+def ensure_pvc(namespace, username):
+    """Creates the user's snapshot PVC in `namespace` if it does not already exist.  Returns its name."""
+    name = pvc_name(username)
+    body = client.V1PersistentVolumeClaim(
+        metadata=client.V1ObjectMeta(name=name, labels={'app': 'enterprise-gateway', 'component': 'kernel-snapshots'}),
+        spec=client.V1PersistentVolumeClaimSpec(access_modes=[access_mode], storage_class_name=storage_class,
+                                                resources=client.V1ResourceRequirements(
+                                                    requests={'storage': storage_size})))
+    try:
+        client.CoreV1Api().create_namespaced_persistent_volume_claim(namespace=namespace, body=body)
+    except client.rest.ApiException as err:
+        if err.status != 409:  # already exists
+            raise
+    return name
+
+
+async def execute(connection_info, code, timeout=None):
+    """Executes `code` silently within the kernel, returning the content of its execute_reply."""
+    kernel_client = IOLoopKernelClient(connection_info)
+    try:
+        reply = await asyncio.wait_for(kernel_client.execute(code, silent=True, store_history=False),
+                                       timeout or execute_timeout)
+    finally:
+        kernel_client.close()
+    return reply.content
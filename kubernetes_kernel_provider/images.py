@@ -0,0 +1,111 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Resolution of kernel image references to content digests (used when pinning images at install time).
+
+Digests are taken from a digest map - a JSON or YAML file mapping image references (as given to the
+installer) to their 'sha256:...' digests, allowing pinning without registry access - or else are
+resolved from the image's registry via the Docker Registry HTTP API v2 (using anonymous bearer tokens
+where the registry requires them).  Images in registries requiring credentials should be pinned using a
+digest map.  Registries on localhost are accessed over http.
+"""
+
+import json
+import re
+
+import urllib3
+import yaml
+
+DEFAULT_REGISTRY = 'docker.io'
+DOCKER_HUB_REGISTRY = 'registry-1.docker.io'
+MANIFEST_MEDIA_TYPES = ', '.join(['application/vnd.oci.image.index.v1+json',
+                                  'application/vnd.docker.distribution.manifest.list.v2+json',
+                                  'application/vnd.oci.image.manifest.v1+json',
+                                  'application/vnd.docker.distribution.manifest.v2+json'])
+DIGEST_PATTERN = re.compile(r'^sha256:[0-9a-f]{64}$')
+
+_resolved = {}  # image reference -> digest, shared by the kernelspecs of an installation
+
+
+def parse_image_reference(image):
+    """Splits `image` into its (registry, repository, tag, digest) - defaulting the registry and tag."""
+    name, _, digest = image.partition('@')
+    registry, _, remainder = name.partition('/')
+    if not remainder or ('.' not in registry and ':' not in registry and registry != 'localhost'):
+        registry, remainder = DEFAULT_REGISTRY, name
+    repository, _, tag = remainder.partition(':') if ':' in remainder.rsplit('/', 1)[-1] else (remainder, '', '')
+    if registry == DEFAULT_REGISTRY and '/' not in repository:
+        repository = 'library/' + repository
+    return registry, repository, tag or 'latest', digest or None
+
+
+def pin_image_reference(image, digest):
+    """Returns `image` pinned to `digest` (retaining its tag, if any, for readability)."""
+    return "{}@{}".format(image.partition('@')[0], digest)
+
+
+def load_digest_map(path):
+    """Loads a digest map (JSON or YAML) of image references to digests."""
+    with open(path) as f:
+        digest_map = yaml.safe_load(f) or {}
+    if not isinstance(digest_map, dict):
+        raise ValueError("Digest map '{}' must map image references to digests.".format(path))
+    return {str(image): str(digest) for image, digest in digest_map.items()}
+
+
+def _registry_url(registry):
+    host = DOCKER_HUB_REGISTRY if registry == DEFAULT_REGISTRY else registry
+    scheme = 'http' if host.split(':')[0] in ('localhost', '127.0.0.1') else 'https'
+    return "{}://{}".format(scheme, host)
+
+
+def _fetch_token(http, challenge, repository):
+    # Obtains an anonymous pull token using the parameters of the registry's bearer challenge.
+    params = dict(re.findall(r'(\w+)="([^"]*)"', challenge or ''))
+    if not challenge or not challenge.lower().startswith('bearer') or 'realm' not in params:
+        raise ValueError("registry requires unsupported authentication - use a digest map")
+    fields = {'service': params.get('service', ''),
+              'scope': params.get('scope', "repository:{}:pull".format(repository))}
+    response = http.request('GET', params['realm'], fields=fields, retries=False)
+    if response.status != 200:
+        raise ValueError("token request failed with status {}".format(response.status))
+    body = json.loads(response.data.decode('utf-8'))
+    return body.get('token') or body.get('access_token')
+
+
+def fetch_digest(image, http=None, timeout=30.0):
+    """Retrieves the digest of `image`'s manifest (or manifest list) from its registry."""
+    registry, repository, tag, digest = parse_image_reference(image)
+    if digest:
+        return digest
+    http = http or urllib3.PoolManager(timeout=timeout)
+    url = "{}/v2/{}/manifests/{}".format(_registry_url(registry), repository, tag)
+    headers = {'Accept': MANIFEST_MEDIA_TYPES}
+    response = http.request('HEAD', url, headers=headers, retries=False)
+    if response.status == 401:
+        token = _fetch_token(http, response.headers.get('WWW-Authenticate'), repository)
+        headers['Authorization'] = "Bearer {}".format(token)
+        response = http.request('HEAD', url, headers=headers, retries=False)
+    if response.status != 200:
+        raise ValueError("registry '{}' returned status {}".format(registry, response.status))
+    digest = response.headers.get('Docker-Content-Digest')
+    if not digest or not DIGEST_PATTERN.match(digest):
+        raise ValueError("registry '{}' did not return a sha256 digest".format(registry))
+    return digest
+
+
+def resolve_digest(image, digest_map=None):
+    """Returns the digest of `image` from `digest_map`, if provided, otherwise from its registry."""
+    digest = parse_image_reference(image)[3]
+    if digest:
+        return digest
+    if image not in _resolved:
+        if digest_map is not None:
+            if image not in digest_map:
+                raise ValueError("image is not in the digest map")
+            digest = digest_map[image].rpartition('@')[2]  # allow pinned references as values
+        else:
+            digest = fetch_digest(image)
+        if not DIGEST_PATTERN.match(digest):
+            raise ValueError("'{}' is not a sha256 digest".format(digest))
+        _resolved[image] = digest
+    return _resolved[image]
@@ -2,15 +2,31 @@
 # Distributed under the terms of the Modified BSD License.
 """Code related to managing kernels running in Kubernetes clusters."""
 
+import asyncio
+import json
 import os
 import logging
 import re
+import signal
+import time
 
 import urllib3
+import yaml
 from kubernetes import client, config
 
 from remote_kernel_provider.container import ContainerKernelLifecycleManager
 
+from . import admission
+from . import apitrace
+from . import hibernation
+from . import kernel_host
+from . import launch_latency
+from . import metrics
+from . import pvc_pool
+from . import scheduler
+from . import sharding
+from . import spark_local_dirs
+
 urllib3.disable_warnings()
 
 # Default logging level of kubernetes produces too much noise - raise to warning only.
@@ -18,7 +34,12 @@ logging.getLogger('kubernetes').setLevel(os.environ.get('EG_KUBERNETES_LOG_LEVEL
 
 enterprise_gateway_namespace = os.environ.get('EG_NAMESPACE', 'default')
 default_kernel_service_account_name = os.environ.get('EG_DEFAULT_KERNEL_SERVICE_ACCOUNT_NAME', 'default')
+default_kernel_priority_class_name = os.environ.get('EG_DEFAULT_KERNEL_PRIORITY_CLASS_NAME')
 kernel_cluster_role = os.environ.get('EG_KERNEL_CLUSTER_ROLE', 'cluster-admin')
+# Administrator-imposed maximums for kernel resources (requests and limits) applied to in-place resizes.
+max_kernel_cpus = os.environ.get('EG_KERNEL_MAX_CPUS')
+max_kernel_memory = os.environ.get('EG_KERNEL_MAX_MEMORY')
+kernel_host_status_interval = float(os.environ.get('EG_KERNEL_HOST_STATUS_INTERVAL_SECS', '5'))
 
 # TODO: The default for this value should probably flip for single-user/Notebook scenarios (True) vs.
 # multi-tenant/Gateway scenarios (False).  The app config will be available from `kernel_manager.app_config`
@@ -26,6 +47,7 @@ kernel_cluster_role = os.environ.get('EG_KERNEL_CLUSTER_ROLE', 'cluster-admin')
 shared_namespace = bool(os.environ.get('EG_SHARED_NAMESPACE', 'False').lower() == 'true')
 
 config.load_incluster_config()
+apitrace.install()  # no-op unless K8SKP_API_TRACE_FILE is set
 
 
 class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
@@ -34,8 +56,25 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
         super(KubernetesKernelLifecycleManager, self).__init__(kernel_manager, lifecycle_config)
 
         self.kernel_pod_name = None
+        self.kernel_generation = 0
         self.kernel_namespace = None
         self.delete_kernel_namespace = False
+        self.kernel_pvc_pool = None
+        self.kernel_pvc_name = None
+        self.kernel_shard = None
+        self.kernel_host = None
+        self.kernel_process_status = None
+        self.kernel_process_checked = 0.0
+        self.kernel_process_check = None  # in-flight check of a packed kernel's process
+        self.launch_latency_key = None
+        self.launch_start_time = None
+        self.launch_deadline = None  # the launch timeout covers the entire launch, including any queueing
+        self.kernel_snapshot_pvc = None
+        self.kernel_snapshot = None
+        self.hibernated = False
+        self.wake_future = None  # in-flight relaunch of the hibernated kernel
+        self.wake_error = None
+        self.launch_objects = []  # (kind, namespace, name) of the objects created by the in-flight launch
 
     async def launch_process(self, kernel_cmd, **kwargs):
         """Launches the specified process within a Kubernetes environment."""
@@ -44,10 +83,266 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
         # Kubernetes relies on many internal env variables.  Since EG is running in a k8s pod, we will
         # transfer its env to each launched kernel.
         kwargs['env'] = dict(os.environ, **kwargs['env'])  # FIXME: Should probably use process-whitelist in JKG #280
+
+        # Launches are bounded overall and per user, with waiting launches served fairly across users.
+        username = kwargs['env'].get('KERNEL_USERNAME', self.kernel_manager.kernel_username)
+        timeout = float(kwargs['env'].get('KERNEL_LAUNCH_TIMEOUT', self.kernel_launch_timeout))
+        self.launch_deadline = time.time() + timeout
+        try:
+            await scheduler.launch_scheduler.acquire(username, timeout)
+        except asyncio.TimeoutError:
+            self.log_and_raise(http_status_code=503, reason="Kernel {} not launched: timed out after {} seconds "
+                                                            "waiting for a launch slot.".format(self.kernel_id,
+                                                                                                timeout))
+        try:
+            return await self._launch_process(kernel_cmd, **kwargs)
+        except (asyncio.CancelledError, Exception):
+            # The launch was cancelled (e.g., the client went away) or has failed (e.g., timed out), so stop the
+            # launcher and delete whatever it has created so far rather than leaving those objects to consume
+            # node (and registry) resources.
+            self._cancel_launch()
+            raise
+        finally:
+            scheduler.launch_scheduler.release(username)
+
+    async def _launch_process(self, kernel_cmd, **kwargs):
+        self.launch_objects = []
         self.kernel_pod_name = self._determine_kernel_pod_name(**kwargs)
+        KubernetesKernelLifecycleManager._determine_kernel_priority_class_name(**kwargs)
+        await self._admit_kernel(**kwargs)  # ensure capacity exists before creating any objects
+        self._assign_kernel_shard(**kwargs)
+        packed = self._is_packed(kernel_cmd, **kwargs)
         self.kernel_namespace = self._determine_kernel_namespace(**kwargs)  # will create namespace if not provided
+        if packed:
+            self.kernel_host = self._assign_kernel_host(**kwargs)
+            kernel_cmd = list(kernel_cmd) + ['--kernel-host', self.kernel_host]
+        else:
+            self.kernel_pod_name = self._determine_kernel_generation(**kwargs)
+            self._claim_kernel_pvc(**kwargs)
+            self._mount_snapshot_pvc(**kwargs)
+            self._determine_spark_local_dirs(**kwargs)
+
+        self._determine_launch_timeout(**kwargs)
+        if not packed:
+            # The pod (and the objects owned by it) created by the launcher, or by Spark, for this generation.
+            self.launch_objects.append(('pods', self.kernel_namespace, "kernel_id={},kernel_generation={}".
+                                        format(self.kernel_id, self.kernel_generation)))
+        result = await super(KubernetesKernelLifecycleManager, self).launch_process(kernel_cmd, **kwargs)
+        self.launch_objects = []
+        if self.kernel_snapshot:
+            await self._restore_snapshot()
+        return result
+
+    def _determine_launch_timeout(self, **kwargs):
+        # Launches not specifying KERNEL_LAUNCH_TIMEOUT use the timeout learned from the startup latencies of
+        # previous launches of the same kernelspec and image (see launch_latency.py), when available.
+        kernel_name = os.path.basename(os.path.normpath(self.kernel_manager.kernel_spec.resource_dir or '')) or \
+            self.kernel_manager.kernel_spec.display_name
+        self.launch_latency_key = launch_latency.latency_key(kernel_name, self.kernel_image)
+        self.launch_start_time = time.time()
+        if kwargs['env'].get('KERNEL_LAUNCH_TIMEOUT'):
+            return
+        try:
+            timeout = launch_latency.get_timeout(self.launch_latency_key)
+        except Exception as err:
+            self.log.warning("Unable to determine adaptive launch timeout for kernel {}: {}".
+                             format(self.kernel_id, err))
+            return
+        if timeout is not None:
+            self.log.debug("Kernel {} using adaptive launch timeout of {} seconds.".format(self.kernel_id, timeout))
+            self.kernel_launch_timeout = timeout
+
+    def _record_launch_latency(self, timed_out=False):
+        # Records the time from launch until the kernel's pod was running, or that the launch timed out.
+        if self.launch_start_time is None:
+            return
+        latency = time.time() - self.launch_start_time
+        self.launch_start_time = None
+        try:
+            if timed_out:
+                launch_latency.record_timeout(self.launch_latency_key)
+            else:
+                launch_latency.record(self.launch_latency_key, latency)
+        except Exception as err:
+            self.log.warning("Unable to record launch latency of kernel {}: {}".format(self.kernel_id, err))
+
+    async def handle_timeout(self):
+        # The superclass times the kernel's startup from when the launcher was started, so the time already
+        # spent waiting for a launch slot and admission is deducted from the launch timeout.
+        if self.launch_deadline is not None and self.start_time is not None:
+            remaining = self.launch_deadline - self.start_time / 1000.0
+            self.kernel_launch_timeout = max(min(self.kernel_launch_timeout, remaining), 0.0)
+        try:
+            await super(KubernetesKernelLifecycleManager, self).handle_timeout()
+        except Exception:
+            self._record_launch_latency(timed_out=True)
+            raise
+
+    def _determine_spark_local_dirs(self, **kwargs):
+        # Spark kernels reference KERNEL_SPARK_LOCAL_DIR_OPTS in their SPARK_OPTS (or __TOREE_SPARK_OPTS__) - the
+        # Spark options mounting the local dir volumes selected by KERNEL_SPARK_LOCAL_DIRS (see spark_local_dirs.py).
+        # It is always set for Spark kernels so that the reference is expanded even when no volumes are selected.
+        if 'SPARK_OPTS' not in kwargs['env'] and '__TOREE_SPARK_OPTS__' not in kwargs['env']:
+            return
+        try:
+            opts = spark_local_dirs.spark_opts(kwargs['env'].get('KERNEL_SPARK_LOCAL_DIRS'))
+        except ValueError as ve:
+            self.log_and_raise(http_status_code=400, reason="Invalid KERNEL_SPARK_LOCAL_DIRS for kernel {}: {}".
+                               format(self.kernel_id, ve))
+        kwargs['env']['KERNEL_SPARK_LOCAL_DIR_OPTS'] = opts
+
+    def _cancel_launch(self):
+        # Stops the launcher (and its children, such as spark-submit) so that no further objects are created, then
+        # deletes the objects created so far by this launch in a single pass.  Objects within a namespace created
+        # by the launch are deleted along with it, while those owned by the kernel's pod (e.g., its services and
+        # Spark executors) are garbage collected with the pod.
+        self._stop_launcher()
+        sharding.unregister_kernel(self.kernel_id)
+        if not self.launch_objects:
+            return
+
+        launch_objects, self.launch_objects = self.launch_objects, []
+        body = client.V1DeleteOptions(grace_period_seconds=0, propagation_policy='Background')
+        deleted_namespaces = set()
+        for kind, namespace, name in sorted(launch_objects, key=lambda obj: obj[0] != 'namespace'):
+            if namespace in deleted_namespaces:
+                continue
+            try:
+                if kind == 'namespace':
+                    client.CoreV1Api().delete_namespace(name=name, body=body)
+                    deleted_namespaces.add(name)
+                elif kind == 'rolebinding':
+                    client.RbacAuthorizationV1Api().delete_namespaced_role_binding(name=name, namespace=namespace,
+                                                                                   body=body)
+                elif kind == 'pods':
+                    client.CoreV1Api().delete_collection_namespaced_pod(namespace=namespace, label_selector=name,
+                                                                        grace_period_seconds=0,
+                                                                        propagation_policy='Background')
+                elif kind == 'pvc_claim':
+                    self._release_kernel_pvc()
+                elif kind == 'kernel_host':
+                    kernel_host.terminate_kernel(namespace, name, self.kernel_id, signal='KILL')
+                    kernel_host.release(self.kernel_id, namespace, name)
+            except Exception as err:
+                if isinstance(err, client.rest.ApiException) and err.status == 404:  # okay if its not found
+                    if kind == 'namespace':
+                        deleted_namespaces.add(name)
+                else:
+                    self.log.warning("Error occurred deleting {} '{}' of cancelled launch of kernel {}: {}".
+                                     format(kind, name, self.kernel_id, err))
+
+        self.container_name = None
+        metrics.inc_counter('kernel_launches_cancelled')
+        self.log.info("Launch of kernel {} did not complete - cleaned up its launch objects: {}".
+                      format(self.kernel_id, ', '.join("{} '{}'".format(kind, name)
+                                                       for kind, _, name in launch_objects)))
+
+    def _stop_launcher(self):
+        # The launcher is started in its own session, so signal its process group to include its children.
+        if self.local_proc is None or self.local_proc.poll() is not None:
+            return
+        try:
+            os.killpg(self.local_proc.pid, signal.SIGKILL)
+            self.local_proc.wait(timeout=5)
+        except Exception as err:
+            self.log.warning("Error occurred stopping launcher of kernel {}: {}".format(self.kernel_id, err))
+
+    def _is_packed(self, kernel_cmd, **kwargs):
+        # Kernels opt into packing (see kernel_host.py) via KERNEL_PACKING.  Since packed kernels share their host's
+        # namespace, a namespace must be provided (or shared) and packing only applies to kernels launched via
+        # launch_kubernetes.py (i.e., not Spark kernels).
+        if str(kwargs['env'].get('KERNEL_PACKING', 'false')).lower() != 'true':
+            return False
+        if not any(str(arg).endswith('launch_kubernetes.py') for arg in kernel_cmd) or '--spark-driver' in kernel_cmd:
+            self.log.warning("KERNEL_PACKING ignored for kernel {} since it is not launched via launch_kubernetes.py.".
+                             format(self.kernel_id))
+            return False
+        if kwargs['env'].get('KERNEL_NAMESPACE') is None and not shared_namespace:
+            self.log.warning("KERNEL_PACKING ignored for kernel {} since packed kernels require KERNEL_NAMESPACE or "
+                             "EG_SHARED_NAMESPACE.".format(self.kernel_id))
+            return False
+        if kwargs['env'].get('KERNEL_PVC_POOL'):
+            self.log.warning("KERNEL_PVC_POOL ignored for packed kernel {}.".format(self.kernel_id))
+        return True
+
+    def _assign_kernel_host(self, **kwargs):
+        labels = {}
+        if self.kernel_shard is not None:
+            labels = {sharding.SHARD_LABEL: str(self.kernel_shard), sharding.REPLICA_LABEL: sharding.replica_label()}
+        uid = kwargs['env'].get('KERNEL_UID')
+        gid = kwargs['env'].get('KERNEL_GID')
+        try:
+            host_name = kernel_host.assign(self.kernel_id, self.kernel_namespace,
+                                           self.kernel_manager.kernel_username, self.kernel_image,
+                                           kwargs['env']['KERNEL_SERVICE_ACCOUNT_NAME'], labels=labels,
+                                           uid=int(uid) if uid is not None else None,
+                                           gid=int(gid) if gid is not None else None,
+                                           image_pull_policy=kwargs['env'].get('KERNEL_IMAGE_PULL_POLICY'))
+        except Exception as err:
+            self.log_and_raise(http_status_code=500, reason="Error occurred assigning kernel {} to a kernel host: {}".
+                               format(self.kernel_id, err))
+        self.container_name = host_name
+        self.launch_objects.append(('kernel_host', self.kernel_namespace, host_name))
+        self.log.info("Kernel {} assigned to kernel host pod '{}'.".format(self.kernel_id, host_name))
+        return host_name
+
+    async def _admit_kernel(self, **kwargs):
+        # Checks the target namespace's quota headroom and the best-fit node's free capacity against the
+        # kernel's requests.  Depending on EG_KERNEL_ADMISSION_POLICY, the launch is either failed immediately
+        # or held until capacity becomes available (or the launch timeout expires).
+        if admission.admission_policy == 'none':
+            return
 
-        return await super(KubernetesKernelLifecycleManager, self).launch_process(kernel_cmd, **kwargs)
+        namespace = kwargs['env'].get('KERNEL_NAMESPACE')
+        if namespace is None and shared_namespace:
+            namespace = enterprise_gateway_namespace
+        try:
+            requests = admission.get_kernel_requests(kwargs['env'])
+            limits = admission.get_kernel_limits(kwargs['env'])
+        except ValueError as ve:
+            self.log_and_raise(http_status_code=400, reason="Invalid kernel resource request: {}".format(ve))
+
+        while True:
+            try:
+                result = await asyncio.get_event_loop().run_in_executor(None, admission.check_admission,
+                                                                        namespace, requests, limits)
+            except Exception as err:
+                # Admission is advisory - never fail a launch because the check itself could not be performed.
+                self.log.warning("Unable to perform admission check for kernel {}: {}".format(self.kernel_id, err))
+                return
+            if result.admitted:
+                self.log.debug("Kernel {} admitted. Requests: {}, headroom: {}".
+                               format(self.kernel_id, requests, result.headroom))
+                return
+            if admission.admission_policy != 'queue' or time.time() > self.launch_deadline:
+                self.log_and_raise(http_status_code=503, reason="Kernel {} not admitted: {}".
+                                   format(self.kernel_id, result.reason))
+            self.log.info("Kernel {} queued awaiting capacity: {}".format(self.kernel_id, result.reason))
+            await asyncio.sleep(admission.admission_queue_interval)  # the cluster state refreshes per its TTL
+
+    def _assign_kernel_shard(self, **kwargs):
+        # When gateway replicas are sharded, stamp the kernel with one of the shards held by this replica so
+        # its objects are only visible to (and managed by) the replica owning that shard.
+        # Restarts retain the kernel's shard, provided it is still held.  Since a new instance is used for each
+        # restart, the shard is recorded in the kernel manager's env, which survives restarts (unlike
+        # kwargs['env'], which is a per-launch copy).
+        if not sharding.is_enabled():
+            return
+        shard = None
+        previous_shard = self.kernel_manager.env.get('KERNEL_SHARD')
+        if self.kernel_manager.restarting and previous_shard:
+            if int(previous_shard) in sharding.held_shards():
+                shard = int(previous_shard)
+        if shard is None:
+            shard = sharding.assign_shard(self.kernel_id)
+        if shard is None:
+            self.log_and_raise(http_status_code=503, reason="Kernel {} cannot be launched: replica '{}' does not "
+                                                            "currently own any kernel shards.".
+                               format(self.kernel_id, sharding.replica_id))
+        self.kernel_shard = shard
+        sharding.register_kernel(self.kernel_id, shard)
+        self.kernel_manager.env['KERNEL_SHARD'] = kwargs['env']['KERNEL_SHARD'] = str(shard)
+        kwargs['env']['KERNEL_REPLICA'] = sharding.replica_label()
 
     def get_initial_states(self):
         """Return list of states indicating container is starting (includes running)."""
@@ -56,20 +351,25 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
     def get_container_status(self, iteration):
         """Return current container state."""
         # Locates the kernel pod using the kernel_id selector.  If the phase indicates Running, the pod's IP
-        # is used for the assigned_ip.
+        # is used for the assigned_ip.  If the pod defines a startup or readiness probe (see kernel-pod.yaml.j2),
+        # the pod must also be Ready - indicating the kernel's ports are bound - so it is only connected to once.
+        if self.kernel_host:
+            return self._get_packed_kernel_status(iteration)
+
         pod_status = None
         ret = client.CoreV1Api().list_namespaced_pod(namespace=self.kernel_namespace,
                                                      label_selector="kernel_id=" + self.kernel_id)
-        if ret and ret.items:
-            pod_info = ret.items[0]
+        pod_info = self._select_current_pod(ret.items if ret else None)
+        if pod_info:
             self.container_name = pod_info.metadata.name
             if pod_info.status:
                 pod_status = pod_info.status.phase
-                if pod_status == 'Running' and self.assigned_host == '':
+                if pod_status == 'Running' and self.assigned_host == '' and self._is_pod_ready(pod_info):
                     # Pod is running, capture IP
                     self.assigned_ip = pod_info.status.pod_ip
                     self.assigned_host = self.container_name
                     self.assigned_node_ip = pod_info.status.host_ip
+                    self._record_launch_latency()
 
         if iteration:  # only log if iteration is not None (otherwise poll() is too noisy)
             self.log.debug("{}: Waiting to connect to k8s pod in namespace '{}'. "
@@ -79,15 +379,96 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
 
         return pod_status
 
+    def _get_packed_kernel_status(self, iteration):
+        # The status of a packed kernel is that of its process when its host pod is Running.
+        pod_status = None
+        try:
+            pod_info = client.CoreV1Api().read_namespaced_pod(name=self.kernel_host, namespace=self.kernel_namespace)
+        except client.rest.ApiException as err:
+            if err.status != 404:
+                raise
+            pod_info = None
+        if pod_info and pod_info.status:
+            pod_status = pod_info.status.phase
+            if pod_status == 'Running':
+                self._check_kernel_process()
+                pod_status = self.kernel_process_status or 'Pending'
+                if pod_status == 'Running' and self.assigned_host == '':
+                    self.assigned_ip = pod_info.status.pod_ip
+                    self.assigned_host = self.kernel_host
+                    self.assigned_node_ip = pod_info.status.host_ip
+                    self._record_launch_latency()
+
+        if iteration:  # only log if iteration is not None (otherwise poll() is too noisy)
+            self.log.debug("{}: Waiting to connect to kernel in k8s kernel host pod in namespace '{}'. "
+                           "Name: '{}', Status: '{}', Pod IP: '{}', KernelID: '{}'".
+                           format(iteration, self.kernel_namespace, self.kernel_host, pod_status,
+                                  self.assigned_ip, self.kernel_id))
+
+        return pod_status
+
+    def _check_kernel_process(self):
+        # Each check of a packed kernel's process requires an exec into its host pod, so checks are performed in
+        # the default executor and the status is that of the most recently completed check.  Once the kernel is
+        # running, its process is checked no more than every EG_KERNEL_HOST_STATUS_INTERVAL_SECS.
+        check = self.kernel_process_check
+        if check is not None:
+            if not check.done():
+                return
+            self.kernel_process_check = None
+            try:
+                self.kernel_process_status = check.result()
+            except Exception as err:
+                self.log.warning("Unable to check the process of kernel {} in kernel host pod '{}': {}".
+                                 format(self.kernel_id, self.kernel_host, err))
+            self.kernel_process_checked = time.time()
+        if self.kernel_process_status != 'Running' or \
+                time.time() - self.kernel_process_checked > kernel_host_status_interval:
+            self.kernel_process_check = asyncio.get_event_loop().run_in_executor(
+                None, kernel_host.kernel_status, self.kernel_namespace, self.kernel_host, self.kernel_id)
+
+    @staticmethod
+    def _is_pod_ready(pod):
+        """Returns True if the pod has no startup or readiness probes or its Ready condition is True."""
+        if not any(getattr(container, 'startup_probe', None) or container.readiness_probe
+                   for container in pod.spec.containers or []):
+            return True
+        for condition in pod.status.conditions or []:
+            if condition.type == 'Ready':
+                return condition.status == 'True'
+        return False
+
+    def _select_current_pod(self, pods):
+        """Returns the pod of the newest kernel generation, ignoring pods of prior generations that may
+        still be terminating following a restart."""
+        current_pod = None
+        current_generation = self.kernel_generation - 1
+        for pod in pods or []:
+            if pod.metadata.deletion_timestamp is not None:
+                continue
+            generation = int((pod.metadata.labels or {}).get('kernel_generation', 0))
+            if generation > current_generation:
+                current_pod, current_generation = pod, generation
+        return current_pod
+
     def terminate_container_resources(self):
         """Terminate any artifacts created on behalf of the container's lifetime."""
         # Kubernetes objects don't go away on their own - so we need to tear down the namespace
         # or pod associated with the kernel.  If we created the namespace and we're not in the
         # the process of restarting the kernel, then that's our target, else just delete the pod.
 
+        if not self.kernel_manager.restarting:
+            sharding.unregister_kernel(self.kernel_id)
+
+        if self.kernel_host:
+            return self._terminate_packed_kernel()
+
         result = False
         body = client.V1DeleteOptions(grace_period_seconds=0, propagation_policy='Background')
 
+        if not self.kernel_manager.restarting:
+            self._release_kernel_pvc()
+
         if self.delete_kernel_namespace and not self.kernel_manager.restarting:
             object_name = 'namespace'
         else:
@@ -123,6 +504,295 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
                                                                              self.container_name, self.kernel_id))
         return result
 
+    async def resize(self, cpus=None, memory=None, cpus_limit=None, memory_limit=None):
+        """Changes the CPU and/or memory of the running kernel pod in place (preserving kernel state).
+
+        Values are Kubernetes resource quantities (e.g., '2', '500m', '4Gi').  The new values are checked
+        against EG_KERNEL_MAX_CPUS and EG_KERNEL_MAX_MEMORY and any increase in requests must fit within the
+        free capacity of the pod's node.  Requires the in-place pod resize feature (the 'resize' subresource
+        in Kubernetes 1.33+ or the InPlacePodVerticalScaling feature gate in earlier releases).  Returns the
+        resulting resources and the pod's resize status.  Note: kernel restarts revert to the launch values.
+        """
+        requests = {resource: value for resource, value in (('cpu', cpus), ('memory', memory)) if value}
+        limits = {resource: value for resource, value in (('cpu', cpus_limit), ('memory', memory_limit)) if value}
+        if not requests and not limits:
+            self.log_and_raise(http_status_code=400, reason="No resources were specified for resizing kernel {}.".
+                               format(self.kernel_id))
+        if self.kernel_host:
+            self.log_and_raise(http_status_code=400, reason="Kernel {} shares kernel host pod '{}' and cannot be "
+                                                            "resized.".format(self.kernel_id, self.kernel_host))
+
+        maximums = {'cpu': max_kernel_cpus, 'memory': max_kernel_memory}
+        for resource, value in list(requests.items()) + list(limits.items()):
+            try:
+                quantity = admission.parse_quantity(value)
+                exceeded = maximums[resource] and quantity > admission.parse_quantity(maximums[resource])
+            except ValueError as ve:
+                self.log_and_raise(http_status_code=400, reason="Invalid kernel resource request: {}".format(ve))
+            if exceeded:
+                self.log_and_raise(http_status_code=403, reason="Requested {} of '{}' for kernel {} exceeds the "
+                                                                "maximum of '{}'.".
+                                   format(resource, value, self.kernel_id, maximums[resource]))
+
+        # The API calls (and the cluster state refresh) are made off the event loop, as admission checks are.
+        loop = asyncio.get_event_loop()
+        pod = await loop.run_in_executor(None, client.CoreV1Api().read_namespaced_pod, self.container_name,
+                                         self.kernel_namespace)
+        container = pod.spec.containers[0]
+        current = (container.resources and container.resources.requests) or {}
+        current_limits = (container.resources and container.resources.limits) or {}
+        for resource in ('cpu', 'memory'):
+            request = requests.get(resource) or current.get(resource)
+            limit = limits.get(resource) or current_limits.get(resource)
+            if request and limit and admission.parse_quantity(request) > admission.parse_quantity(limit):
+                self.log_and_raise(http_status_code=400, reason="The {} request of '{}' for kernel {} exceeds its "
+                                                                "limit of '{}'.".
+                                   format(resource, request, self.kernel_id, limit))
+        increases = {resource: admission.parse_quantity(value) - admission.parse_quantity(current.get(resource))
+                     for resource, value in requests.items()}
+        increases = {resource: value for resource, value in increases.items() if value > 0}
+        if increases:
+            node_free = await loop.run_in_executor(None, KubernetesKernelLifecycleManager._get_current_node_free)
+            node_free = node_free.get(pod.spec.node_name, {})
+            for resource, value in increases.items():
+                if node_free.get(resource, 0.0) < value:
+                    self.log_and_raise(http_status_code=409, reason="Node '{}' has insufficient free {} to resize "
+                                                                    "kernel {} ({} available, {} additional "
+                                                                    "requested).".
+                                       format(pod.spec.node_name, resource, self.kernel_id,
+                                              node_free.get(resource, 0.0), value))
+
+        resources = {}
+        if requests:
+            resources['requests'] = requests
+        if limits:
+            resources['limits'] = limits
+        body = {'spec': {'containers': [{'name': container.name, 'resources': resources}]}}
+        try:
+            pod = await loop.run_in_executor(None, self._patch_pod_resources, body)
+        except client.rest.ApiException as err:
+            if err.status in (404, 405):
+                self.log_and_raise(http_status_code=501, reason="Kernel {} could not be resized in place - the "
+                                                                "cluster may not support in-place pod resize: {}".
+                                   format(self.kernel_id, err.reason))
+            if err.status in (400, 422):  # the resize was rejected (e.g., by validation of the new resources)
+                self.log_and_raise(http_status_code=400, reason="Kernel {} could not be resized: {}".
+                                   format(self.kernel_id, KubernetesKernelLifecycleManager._get_api_message(err)))
+            self.log_and_raise(http_status_code=500, reason="Error occurred resizing kernel {}: {}".
+                               format(self.kernel_id, err))
+
+        status = self._get_resize_status(pod)
+        if status in ('Infeasible', 'Deferred'):
+            self.log_and_raise(http_status_code=409, reason="Resize of kernel {} is {} on node '{}'.".
+                               format(self.kernel_id, status.lower(), pod.spec.node_name))
+        self.log.info("Kernel {} resized - requests: {}, limits: {}, status: {}".
+                      format(self.kernel_id, requests, limits, status))
+        await loop.run_in_executor(None, admission.cluster_state.invalidate)
+        return {'requests': requests, 'limits': limits, 'status': status}
+
+    @staticmethod
+    def _get_current_node_free():
+        # The cached cluster state may predate recent launches, so the free capacity is refreshed.
+        admission.cluster_state.invalidate()
+        return admission.cluster_state.get_node_free()
+
+    def _patch_pod_resources(self, body):
+        # Kubernetes 1.33+ only permits resource changes via the pod's 'resize' subresource.  Earlier releases
+        # (with InPlacePodVerticalScaling enabled) allow the pod spec itself to be patched.
+        api = client.CoreV1Api()
+        patch_resize = getattr(api, 'patch_namespaced_pod_resize', None)
+        if patch_resize is not None:
+            try:
+                return patch_resize(name=self.container_name, namespace=self.kernel_namespace, body=body)
+            except client.rest.ApiException as err:
+                if err.status not in (404, 405):
+                    raise
+        return api.patch_namespaced_pod(name=self.container_name, namespace=self.kernel_namespace, body=body)
+
+    @staticmethod
+    def _get_api_message(err):
+        # Rejected requests carry a Status object whose message describes the cause.
+        try:
+            return json.loads(err.body)['message']
+        except (TypeError, ValueError, KeyError):
+            return err.reason
+
+    @staticmethod
+    def _get_resize_status(pod):
+        # The PodResizePending/PodResizeInProgress conditions replaced status.resize in Kubernetes 1.33.
+        for condition in (pod.status and pod.status.conditions) or []:
+            if condition.type == 'PodResizePending' and condition.status == 'True':
+                return condition.reason or 'Pending'
+            if condition.type == 'PodResizeInProgress' and condition.status == 'True':
+                return 'InProgress'
+        return getattr(pod.status, 'resize', None) or 'Proposed'
+
+    def _terminate_packed_kernel(self):
+        # Terminates the kernel's process within its host pod and releases its slot.  The host pod is deleted once
+        # its last kernel has terminated - unless restarting, in which case the kernel will be re-assigned to it.
+        try:
+            kernel_host.terminate_kernel(self.kernel_namespace, self.kernel_host, self.kernel_id)
+            kernel_host.release(self.kernel_id, self.kernel_namespace, self.kernel_host,
+                                delete_if_empty=not self.kernel_manager.restarting)
+        except Exception as err:
+            self.log.warning("KubernetesKernelLifecycleManager.terminate_container_resources, kernel host: {}.{}, "
+                             "kernel ID: {} has not been terminated: {}".format(self.kernel_namespace,
+                                                                                self.kernel_host, self.kernel_id,
+                                                                                err))
+            return False
+
+        self.log.debug("KubernetesKernelLifecycleManager.terminate_container_resources, kernel host: {}.{}, "
+                       "kernel ID: {} has been terminated.".format(self.kernel_namespace, self.kernel_host,
+                                                                   self.kernel_id))
+        self.container_name = None
+        return None  # maintain jupyter contract
+
+    def poll(self):
+        """Determines if the kernel is still active - hibernated kernels are considered active unless their
+        relaunch has failed."""
+        if self.hibernated:
+            return False if self.wake_error else None
+        return super(KubernetesKernelLifecycleManager, self).poll()
+
+    def send_signal(self, signum):
+        """Sends `signum` to the kernel.  Signals other than heartbeats and kills wake a hibernated kernel, in
+        which case the signal itself is not delivered since the relaunched kernel has nothing to interrupt."""
+        if self.hibernated:
+            if signum not in (0, signal.SIGKILL) and self.wake_future is None:
+                self.wake_future = asyncio.ensure_future(self._wake())
+            return self.poll()
+        return super(KubernetesKernelLifecycleManager, self).send_signal(signum)
+
+    async def hibernate(self):
+        """Hibernates the kernel, freeing its pod while retaining its state (see hibernation.py).
+
+        The kernel's user namespace is saved to a snapshot on its user's snapshot PVC and its pod is deleted.
+        The snapshot is restored when the kernel is relaunched by wake() - called upon the kernel's next
+        activity - or is next started by the hosting application.  Returns the path of the snapshot within the
+        kernel's pod.
+        """
+        if self.hibernated:
+            return self.kernel_snapshot
+        if not self.kernel_snapshot_pvc:
+            self.log_and_raise(http_status_code=400, reason="Kernel {} was not launched with hibernation enabled "
+                                                            "(KERNEL_HIBERNATION).".format(self.kernel_id))
+
+        language = self.kernel_manager.kernel_spec.language
+        path = hibernation.snapshot_path(self.kernel_id, language)
+        start_time = time.time()
+        try:
+            reply = await hibernation.execute(self.connection_info, hibernation.save_code(language, path))
+        except asyncio.TimeoutError:
+            self.log_and_raise(http_status_code=504, reason="Kernel {} not hibernated: timed out saving its "
+                                                            "snapshot.".format(self.kernel_id))
+        if reply.get('status') != 'ok':
+            self.log_and_raise(http_status_code=500, reason="Kernel {} not hibernated: error saving its snapshot: "
+                                                            "{}: {}".format(self.kernel_id, reply.get('ename'),
+                                                                            reply.get('evalue')))
+
+        self.kernel_snapshot = path
+        self.kernel_manager.env['KERNEL_SNAPSHOT'] = path  # restored by the next launch of this kernel
+        self.terminate_container_resources()
+        self.hibernated = True
+        self.wake_error = None
+        metrics.inc_counter('kernel_hibernations')
+        metrics.observe('kernel_hibernation_seconds', time.time() - start_time)
+        self.log.info("Kernel {} hibernated to snapshot '{}' on PVC '{}'.".
+                      format(self.kernel_id, path, self.kernel_snapshot_pvc))
+        return path
+
+    async def wake(self):
+        """Relaunches a hibernated kernel in place, restoring its snapshot, and returns its connection info.
+
+        The kernel retains its ID, kernel manager and this lifecycle manager, so the hosting application only
+        needs to reconnect its kernel clients using the returned connection info (the relaunched pod has a new
+        address).  Concurrent calls await the same relaunch.  Wakes are triggered by the kernel's next
+        activity seen by the provider (e.g., an interrupt) and can be requested directly by the hosting
+        application upon any request to the kernel.
+        """
+        if not self.hibernated:
+            return self.connection_info
+        if self.wake_future is None:
+            self.wake_future = asyncio.ensure_future(self._wake())
+        await asyncio.shield(self.wake_future)
+        if self.hibernated:
+            self.log_and_raise(http_status_code=500, reason="Kernel {} could not be woken from hibernation: {}".
+                               format(self.kernel_id, self.wake_error))
+        return self.connection_info
+
+    async def _wake(self):
+        # Failures are recorded rather than raised since wakes triggered by signals are not awaited - poll()
+        # then reports the kernel as no longer active.
+        self.log.info("Waking kernel {} from snapshot '{}' on PVC '{}'.".
+                      format(self.kernel_id, self.kernel_snapshot, self.kernel_snapshot_pvc))
+        self.wake_error = None
+        # The relaunch replaces the kernel's previous pod, so it is treated as a restart (e.g., retaining the
+        # kernel's shard and advancing its generation).
+        self.kernel_manager.restarting = True
+        try:
+            if self.response_socket is None:  # closed once the previous launch's connection info was received
+                self._prepare_response_socket()
+            await self.launch_process(self.kernel_manager.format_kernel_cmd(), env=self.kernel_manager.env)
+            self.hibernated = False
+            metrics.inc_counter('kernel_hibernation_wakes')
+        except Exception as err:
+            self.wake_error = err
+            self.log.error("Kernel {} could not be woken from hibernation: {}".format(self.kernel_id, err))
+        finally:
+            self.kernel_manager.restarting = False
+            self.wake_future = None
+
+    def _mount_snapshot_pvc(self, **kwargs):
+        # If the kernel has enabled hibernation (via KERNEL_HIBERNATION), ensure its user's snapshot PVC exists
+        # and add it to the kernel's volumes and volume mounts.  Since the PVC must outlive the kernel's
+        # namespace, hibernation is not available to kernels in namespaces created on their behalf.
+        if str(kwargs['env'].get('KERNEL_HIBERNATION', 'false')).lower() != 'true':
+            return
+        if self.delete_kernel_namespace:
+            self.log.warning("KERNEL_HIBERNATION ignored for kernel {} since hibernation requires KERNEL_NAMESPACE "
+                             "or EG_SHARED_NAMESPACE.".format(self.kernel_id))
+            return
+        if not hibernation.is_supported(self.kernel_manager.kernel_spec.language):
+            self.log.warning("KERNEL_HIBERNATION ignored for kernel {} since hibernation does not support "
+                             "'{}' kernels.".format(self.kernel_id, self.kernel_manager.kernel_spec.language))
+            return
+
+        try:
+            self.kernel_snapshot_pvc = hibernation.ensure_pvc(self.kernel_namespace,
+                                                              self.kernel_manager.kernel_username)
+        except Exception as err:
+            self.log_and_raise(http_status_code=500, reason="Error occurred creating snapshot PVC for kernel {}: {}".
+                               format(self.kernel_id, err))
+        self.kernel_snapshot = kwargs['env'].get('KERNEL_SNAPSHOT')
+
+        # KERNEL_VOLUMES and KERNEL_VOLUME_MOUNTS are yaml lists - JSON being a subset of yaml.
+        volumes = yaml.safe_load(kwargs['env'].get('KERNEL_VOLUMES', '[]')) or []
+        volumes.append({'name': hibernation.VOLUME_NAME,
+                        'persistentVolumeClaim': {'claimName': self.kernel_snapshot_pvc}})
+        kwargs['env']['KERNEL_VOLUMES'] = json.dumps(volumes)
+        volume_mounts = yaml.safe_load(kwargs['env'].get('KERNEL_VOLUME_MOUNTS', '[]')) or []
+        volume_mounts.append({'name': hibernation.VOLUME_NAME, 'mountPath': hibernation.mount_path})
+        kwargs['env']['KERNEL_VOLUME_MOUNTS'] = json.dumps(volume_mounts)
+
+    async def _restore_snapshot(self):
+        # Restores the snapshot of a hibernated kernel into the newly launched kernel.  A failed restore does not
+        # fail the launch - the kernel starts without its prior state and the snapshot is retained on the PVC.
+        path = self.kernel_snapshot
+        self.kernel_manager.env.pop('KERNEL_SNAPSHOT', None)
+        self.kernel_snapshot = None
+        try:
+            reply = await hibernation.execute(self.connection_info,
+                                              hibernation.restore_code(self.kernel_manager.kernel_spec.language,
+                                                                       path))
+            if reply.get('status') != 'ok':
+                raise RuntimeError("{}: {}".format(reply.get('ename'), reply.get('evalue')))
+        except Exception as err:
+            self.log.warning("Kernel {} was not restored from snapshot '{}' on PVC '{}': {}".
+                             format(self.kernel_id, path, self.kernel_snapshot_pvc, err or type(err).__name__))
+            return
+        metrics.inc_counter('kernel_hibernation_restores')
+        self.log.info("Kernel {} restored from snapshot '{}'.".format(self.kernel_id, path))
+
     def _determine_kernel_pod_name(self, **kwargs):
         pod_name = kwargs['env'].get('KERNEL_POD_NAME')
         if pod_name is None:
@@ -139,6 +809,79 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
 
         return pod_name
 
+    def _determine_kernel_generation(self, **kwargs):
+        # Restarts delete the previous pod without waiting for its termination.  So that the replacement pod
+        # never conflicts with (or waits on) its predecessor, each restart increments a generation number that
+        # is appended to the pod name and recorded in the 'kernel_generation' label.  The generation is derived
+        # from the existing pods so that it survives the re-creation of this instance across restarts.
+        pod_name = self.kernel_pod_name
+        self.kernel_generation = 0
+        if self.kernel_manager.restarting:
+            try:
+                ret = client.CoreV1Api().list_namespaced_pod(namespace=self.kernel_namespace,
+                                                             label_selector="kernel_id=" + self.kernel_id)
+                generations = [int((pod.metadata.labels or {}).get('kernel_generation', 0)) for pod in ret.items]
+                self.kernel_generation = max(generations) + 1 if generations else 0
+            except Exception as err:
+                self.log.warning("Unable to determine prior generation of kernel {}: {}".format(self.kernel_id, err))
+        if self.kernel_generation > 0:
+            pod_name = "{}-g{}".format(pod_name, self.kernel_generation)
+            kwargs['env']['KERNEL_POD_NAME'] = pod_name
+        kwargs['env']['KERNEL_GENERATION'] = str(self.kernel_generation)
+
+        return pod_name
+
+    def _claim_kernel_pvc(self, **kwargs):
+        # If the kernel has requested a pooled PVC (via KERNEL_PVC_POOL), claim one from the pool (re-attaching
+        # the user's released PVC if one exists) and add it to the kernel's volumes and volume mounts.
+        pool_name = kwargs['env'].get('KERNEL_PVC_POOL')
+        if not pool_name:
+            return
+
+        pool = pvc_pool.find_pool(pool_name)
+        if pool is None:
+            self.log_and_raise(http_status_code=400, reason="KERNEL_PVC_POOL '{}' does not identify a configured "
+                                                            "PVC pool (see EG_KERNEL_PVC_POOLS).".format(pool_name))
+        if self.kernel_namespace != pvc_pool.pool_namespace:
+            self.log.warning("KERNEL_PVC_POOL ignored since kernel namespace '{}' differs from PVC pool namespace "
+                             "'{}'.".format(self.kernel_namespace, pvc_pool.pool_namespace))
+            return
+
+        try:
+            self.kernel_pvc_name = pool.claim(self.kernel_id, self.kernel_manager.kernel_username)
+        except Exception as err:
+            self.log_and_raise(http_status_code=500, reason="Error occurred claiming PVC from pool '{}': {}".
+                               format(pool_name, err))
+        self.kernel_pvc_pool = pool_name
+        self.launch_objects.append(('pvc_claim', pvc_pool.pool_namespace, self.kernel_pvc_name))
+        self.log.info("Kernel {} claimed PVC '{}' from pool '{}'.".format(self.kernel_id, self.kernel_pvc_name,
+                                                                          pool.key))
+
+        # KERNEL_VOLUMES and KERNEL_VOLUME_MOUNTS are yaml lists - JSON being a subset of yaml.
+        volumes = yaml.safe_load(kwargs['env'].get('KERNEL_VOLUMES', '[]')) or []
+        volumes.append({'name': 'kernel-pvc', 'persistentVolumeClaim': {'claimName': self.kernel_pvc_name}})
+        kwargs['env']['KERNEL_VOLUMES'] = json.dumps(volumes)
+        volume_mounts = yaml.safe_load(kwargs['env'].get('KERNEL_VOLUME_MOUNTS', '[]')) or []
+        volume_mounts.append({'name': 'kernel-pvc',
+                              'mountPath': kwargs['env'].get('KERNEL_PVC_MOUNT_PATH', pvc_pool.default_mount_path)})
+        kwargs['env']['KERNEL_VOLUME_MOUNTS'] = json.dumps(volume_mounts)
+
+        # Replace the claimed PVC in the background, off the launch's critical path.
+        asyncio.get_event_loop().run_in_executor(None, pvc_pool.replenish_all, self.log)
+
+    def _release_kernel_pvc(self):
+        # Releases (or scrubs) the kernel's pooled PVC according to EG_KERNEL_PVC_RELEASE_POLICY.
+        pool = pvc_pool.find_pool(self.kernel_pvc_pool) if self.kernel_pvc_pool else None
+        if pool is None or self.kernel_pvc_name is None:
+            return
+        try:
+            pool.release(self.kernel_pvc_name, pvc_pool.release_policy)
+            self.log.debug("Kernel {} released PVC '{}' using policy '{}'.".
+                           format(self.kernel_id, self.kernel_pvc_name, pvc_pool.release_policy))
+            self.kernel_pvc_name = None
+        except Exception as err:
+            self.log.warning("Error occurred releasing PVC '{}': {}".format(self.kernel_pvc_name, err))
+
     def _determine_kernel_namespace(self, **kwargs):
 
         # Since we need the service account name regardless of whether we're creating the namespace or not,
@@ -170,6 +913,15 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
         kwargs['env']['KERNEL_SERVICE_ACCOUNT_NAME'] = service_account_name
         return service_account_name
 
+    @staticmethod
+    def _determine_kernel_priority_class_name(**kwargs):
+        # Kernel pods must outrank any capacity buffer placeholder pods so they can preempt them.  If a priority
+        # class wasn't provided, use the default (if any) set from the EG env.
+        priority_class_name = kwargs['env'].get('KERNEL_PRIORITY_CLASS_NAME', default_kernel_priority_class_name)
+        if priority_class_name:
+            kwargs['env']['KERNEL_PRIORITY_CLASS_NAME'] = priority_class_name
+        return priority_class_name
+
     def _create_kernel_namespace(self, service_account_name):
         # Creates the namespace for the kernel based on the kernel username and kernel id.  Since we're creating
         # the namespace, we'll also note that it should be deleted as well.  In addition, the kernel pod may need
@@ -181,6 +933,9 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
 
         # create the namespace ...
         labels = {'app': 'enterprise-gateway', 'component': 'kernel', 'kernel_id': self.kernel_id}
+        if self.kernel_shard is not None:
+            labels.update({sharding.SHARD_LABEL: str(self.kernel_shard),
+                           sharding.REPLICA_LABEL: sharding.replica_label()})
         namespace_metadata = client.V1ObjectMeta(name=namespace, labels=labels)
         body = client.V1Namespace(metadata=namespace_metadata)
 
@@ -188,6 +943,7 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
         try:
             client.CoreV1Api().create_namespace(body=body)
             self.delete_kernel_namespace = True
+            self.launch_objects.append(('namespace', None, namespace))
             self.log.info("Created kernel namespace: {}".format(namespace))
 
             # Now create a RoleBinding for this namespace for the default ServiceAccount.  We'll reference
@@ -231,13 +987,18 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
                                     subjects=[binding_subjects])
 
         client.RbacAuthorizationV1Api().create_namespaced_role_binding(namespace=namespace, body=body)
+        self.launch_objects.append(('rolebinding', namespace, role_binding_name))
         self.log.info("Created kernel role-binding '{}' in namespace: {} for service account: {}".
                       format(role_binding_name, namespace, service_account_name))
 
     def get_lifecycle_info(self):
         """Captures the base information necessary for kernel persistence relative to kubernetes."""
         lifecycle_info = super(KubernetesKernelLifecycleManager, self).get_lifecycle_info()
-        lifecycle_info.update({'kernel_ns': self.kernel_namespace, 'delete_ns': self.delete_kernel_namespace})
+        lifecycle_info.update({'kernel_ns': self.kernel_namespace, 'delete_ns': self.delete_kernel_namespace,
+                               'kernel_generation': self.kernel_generation, 'kernel_pvc': self.kernel_pvc_name,
+                               'kernel_pvc_pool': self.kernel_pvc_pool, 'kernel_shard': self.kernel_shard,
+                               'kernel_host': self.kernel_host, 'kernel_snapshot_pvc': self.kernel_snapshot_pvc,
+                               'kernel_snapshot': self.kernel_snapshot, 'hibernated': self.hibernated})
         return lifecycle_info
 
     def load_lifecycle_info(self, lifecycle_info):
@@ -245,3 +1006,16 @@ class KubernetesKernelLifecycleManager(ContainerKernelLifecycleManager):
         super(KubernetesKernelLifecycleManager, self).load_lifecycle_info(lifecycle_info)
         self.kernel_namespace = lifecycle_info['kernel_ns']
         self.delete_kernel_namespace = lifecycle_info['delete_ns']
+        self.kernel_generation = lifecycle_info.get('kernel_generation', 0)
+        self.kernel_pvc_name = lifecycle_info.get('kernel_pvc')
+        self.kernel_pvc_pool = lifecycle_info.get('kernel_pvc_pool')
+        self.kernel_shard = lifecycle_info.get('kernel_shard')
+        if self.kernel_shard is not None:
+            sharding.register_kernel(self.kernel_id, self.kernel_shard)
+            self.kernel_manager.env['KERNEL_SHARD'] = str(self.kernel_shard)  # retained across restarts
+        self.kernel_host = lifecycle_info.get('kernel_host')
+        self.kernel_snapshot_pvc = lifecycle_info.get('kernel_snapshot_pvc')
+        self.kernel_snapshot = lifecycle_info.get('kernel_snapshot')
+        self.hibernated = lifecycle_info.get('hibernated', False)
+        if self.hibernated:
+            self.kernel_manager.env['KERNEL_SNAPSHOT'] = self.kernel_snapshot  # restored when the kernel is woken
@@ -0,0 +1,173 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Packing of multiple lightweight kernels into shared "kernel host" pods.
+
+Kernels that opt in (via KERNEL_PACKING=true) are not given their own pod.  Instead, each is assigned a
+slot in a kernel host pod running the same image on behalf of the same user, in which the kernel runs as
+a separate process started by the kernel image's bootstrap script (see launch_kubernetes.py --kernel-host).
+Each kernel still returns its connection information over its own response address, so the kernels in a
+host are otherwise independent.  A host provides EG_KERNEL_HOST_SLOTS slots and is deleted once its last
+kernel has terminated.
+
+The kernels assigned to a host are recorded in the host pod's 'kubernetes-kernel-provider/kernels'
+annotation, which is updated using the pod's resourceVersion so that concurrent assignments (including
+those from other gateway replicas) never over-commit a host.  Likewise, host pods are given deterministic
+names (per user, image and index) so that concurrent launches needing a new host create only one - the
+others' creations conflict, after which they are assigned to the host that was created.  Kernel processes
+are tracked using pid files within the host pod, against which their status is checked and signals are sent
+(via the exec API).
+
+Packed kernels share their host's namespace, so KERNEL_NAMESPACE must be provided or EG_SHARED_NAMESPACE
+enabled.  Spark kernels and per-kernel PVCs are not supported.
+"""
+
+import hashlib
+import itertools
+import os
+import re
+
+from kubernetes import client
+from kubernetes.stream import stream
+
+host_slots = int(os.getenv('EG_KERNEL_HOST_SLOTS', '4'))
+host_cpus = os.getenv('EG_KERNEL_HOST_CPUS')
+host_memory = os.getenv('EG_KERNEL_HOST_MEMORY')
+
+KERNELS_ANNOTATION = 'kubernetes-kernel-provider/kernels'
+PID_DIR = '/tmp/k8skp-kernels'  # within the host pod
+HOST_COMMAND = 'trap "exit 0" TERM; while true; do sleep 3600 & wait $!; done'
+
+# Maps the output of the status command to container states.
+STATUS_COMMAND = 'if [ ! -f {dir}/{id}.pid ]; then echo Pending; elif kill -0 $(cat {dir}/{id}.pid) 2>/dev/null; ' \
+                 'then echo Running; else echo Failed; fi'
+TERMINATE_COMMAND = 'if [ -f {dir}/{id}.pid ]; then kill -{signal} -- -$(cat {dir}/{id}.pid) 2>/dev/null; fi; ' \
+                    'rm -f {dir}/{id}.pid'
+
+
+def _label_value(value):
+    return re.sub('[^0-9A-Za-z_.-]+', '-', value).strip('-_.')[:63]
+
+
+def _image_key(image):
+    return hashlib.sha1(image.encode('utf-8')).hexdigest()[:16]
+
+
+def _host_name(user, image, index):
+    user = re.sub('[^0-9a-z-]+', '-', user.lower()).strip('-')
+    return "kernel-host-{}-{}-{}".format(user, _image_key(image)[:8], index)
+
+
+def _assigned_kernels(pod):
+    kernels = ((pod.metadata.annotations or {}).get(KERNELS_ANNOTATION) or '').split(',')
+    return [kernel_id for kernel_id in kernels if kernel_id]
+
+
+def _update_assigned_kernels(pod, kernels):
+    # Including the resourceVersion makes the update fail (409) if the pod was updated by another launch.
+    body = {'metadata': {'annotations': {KERNELS_ANNOTATION: ','.join(kernels)},
+                         'resourceVersion': pod.metadata.resource_version}}
+    return client.CoreV1Api().patch_namespaced_pod(name=pod.metadata.name, namespace=pod.metadata.namespace,
+                                                   body=body)
+
+
+def assign(kernel_id, namespace, username, image, service_account_name, labels=None, uid=None, gid=None,
+           image_pull_policy=None):
+    """Assigns the kernel to a host pod with a free slot, creating a host pod if necessary.  Returns its name."""
+    user = _label_value(username)
+    selector = "component=kernel-host,kernel_username={},kernel_host_image={}".format(user, _image_key(image))
+    for _ in range(5):  # retry on conflicts
+        pods = client.CoreV1Api().list_namespaced_pod(namespace=namespace, label_selector=selector).items
+        for pod in pods:
+            if pod.metadata.deletion_timestamp is not None or pod.status.phase not in ('Pending', 'Running'):
+                continue
+            kernels = _assigned_kernels(pod)
+            if kernel_id in kernels:
+                return pod.metadata.name
+            if len(kernels) >= host_slots:
+                continue
+            try:
+                _update_assigned_kernels(pod, kernels + [kernel_id])
+                return pod.metadata.name
+            except client.rest.ApiException as err:
+                if err.status != 409:
+                    raise
+                break  # re-list and try again
+        else:
+            names = {pod.metadata.name for pod in pods}
+            host_name = next(_host_name(user, image, index) for index in itertools.count()
+                             if _host_name(user, image, index) not in names)
+            try:
+                return _create_host(host_name, kernel_id, namespace, user, image, service_account_name, labels,
+                                    uid, gid, image_pull_policy)
+            except client.rest.ApiException as err:
+                if err.status != 409:  # created by a concurrent launch - re-list and try again
+                    raise
+    raise RuntimeError("Unable to assign kernel {} to a kernel host due to repeated conflicts.".format(kernel_id))
+
+
+def _create_host(host_name, kernel_id, namespace, user, image, service_account_name, labels, uid, gid,
+                 image_pull_policy):
+    host_labels = dict(labels or {})
+    host_labels.update({'app': 'enterprise-gateway', 'component': 'kernel-host', 'kernel_username': user,
+                        'kernel_host_image': _image_key(image)})
+    resources = {}
+    if host_cpus:
+        resources['cpu'] = host_cpus
+    if host_memory:
+        resources['memory'] = host_memory
+    container = client.V1Container(name='kernel-host', image=image, command=['sh', '-c', HOST_COMMAND],
+                                   image_pull_policy=image_pull_policy,
+                                   resources=client.V1ResourceRequirements(requests=resources or None,
+                                                                           limits=resources or None))
+    security_context = None
+    if uid is not None or gid is not None:
+        security_context = client.V1PodSecurityContext(run_as_user=uid, run_as_group=gid, fs_group=100)
+    pod = client.V1Pod(
+        metadata=client.V1ObjectMeta(name=host_name, labels=host_labels, annotations={KERNELS_ANNOTATION: kernel_id}),
+        spec=client.V1PodSpec(containers=[container], restart_policy='Never', security_context=security_context,
+                              service_account_name=service_account_name, termination_grace_period_seconds=5))
+    return client.CoreV1Api().create_namespaced_pod(namespace=namespace, body=pod).metadata.name
+
+
+def release(kernel_id, namespace, host_name, delete_if_empty=True):
+    """Releases the kernel's slot, deleting the host pod if it has no remaining kernels (and `delete_if_empty`)."""
+    for _ in range(5):  # retry on conflicts
+        try:
+            pod = client.CoreV1Api().read_namespaced_pod(name=host_name, namespace=namespace)
+        except client.rest.ApiException as err:
+            if err.status == 404:
+                return
+            raise
+        kernels = [kid for kid in _assigned_kernels(pod) if kid != kernel_id]
+        try:
+            if kernels or not delete_if_empty:
+                _update_assigned_kernels(pod, kernels)
+            else:
+                # The precondition prevents deleting the host if a kernel was assigned to it in the meantime.
+                body = client.V1DeleteOptions(grace_period_seconds=0, propagation_policy='Background',
+                                              preconditions=client.V1Preconditions(
+                                                  resource_version=pod.metadata.resource_version))
+                client.CoreV1Api().delete_namespaced_pod(name=host_name, namespace=namespace, body=body)
+            return
+        except client.rest.ApiException as err:
+            if err.status == 404:
+                return
+            if err.status != 409:
+                raise
+
+
+def exec_command(namespace, host_name, command):
+    """Runs the shell `command` in the host pod, returning its output."""
+    return stream(client.CoreV1Api().connect_get_namespaced_pod_exec, host_name, namespace,
+                  command=['sh', '-c', command], stderr=True, stdin=False, stdout=True, tty=False)
+
+
+def kernel_status(namespace, host_name, kernel_id):
+    """Returns 'Pending', 'Running' or 'Failed' for the kernel process within the host pod."""
+    output = exec_command(namespace, host_name, STATUS_COMMAND.format(dir=PID_DIR, id=kernel_id))
+    return (output or '').strip() or None
+
+
+def terminate_kernel(namespace, host_name, kernel_id, signal='TERM'):
+    """Terminates the kernel's process group within the host pod."""
+    exec_command(namespace, host_name, TERMINATE_COMMAND.format(dir=PID_DIR, id=kernel_id, signal=signal))
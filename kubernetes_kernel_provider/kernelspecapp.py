@@ -3,25 +3,35 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+import copy
 import os
 import os.path
+import importlib.util
 import json
+import shutil
 import sys
+import yaml
 
+from concurrent.futures import ThreadPoolExecutor
 from distutils import dir_util
 from string import Template
 from traitlets.config.application import Application
 from jupyter_core.application import (
     JupyterApp, base_flags, base_aliases
 )
-from traitlets import Instance, Dict, Unicode, Bool, default
+from traitlets import Instance, Dict, Unicode, Bool, Float, TraitError, default
 from jupyter_kernel_mgmt.kernelspec import KernelSpec, KernelSpecManager
 from remote_kernel_provider import spec_utils
 
 from .provider import KubernetesKernelProvider
+from . import apitrace
+from . import images
+from . import spark_local_dirs
+from . import usage
 from . import __version__
 
 KERNEL_JSON = "k8skp_kernel.json"
+PRECOMPILED_POD_JSON = "kernel-pod.json"
 PYTHON = 'python'
 TENSORFLOW = 'tensorflow'
 DEFAULT_LANGUAGE = PYTHON
@@ -50,6 +60,31 @@ TENSORFLOW_SUFFIX = '_tf'
 TENSORFLOW_DISPLAY_NAME_SUFFIX = ' (with Tensorflow)'
 DEFAULT_INIT_MODE = 'lazy'
 SPARK_INIT_MODES = [DEFAULT_INIT_MODE, 'eager', 'none']
+PLACEMENT_POLICIES = ['pack', 'spread', 'dedicated']
+DEFAULT_SPARK_LAUNCH_MODE = 'submit'
+SPARK_LAUNCH_MODES = [DEFAULT_SPARK_LAUNCH_MODE, 'direct']
+IMAGE_PULL_POLICIES = ['Always', 'IfNotPresent', 'Never']
+
+# The (language, spark, tensorflow) variants installed by --all.
+ALL_VARIANTS = [(PYTHON, False, False), (PYTHON, True, False), (PYTHON, False, True), ('r', False, False),
+                ('r', True, False), ('scala', False, False), ('scala', True, False)]
+# Options that identify a kernelspec and are therefore specified per entry when installing from a manifest.
+KERNELSPEC_OPTIONS = ['kernel_name', 'display_name', 'image_name', 'executor_image_name', 'language', 'spark',
+                      'tensorflow']
+MANIFEST_OPTIONS = KERNELSPEC_OPTIONS + ['spark_home', 'spark_init_mode', 'extra_spark_opts', 'spark_launch_mode',
+                                         'placement_policy', 'image_pull_policy', 'spark_local_dirs']
+
+
+def _link_tree(src, dst):
+    """Hardlink the files of `src` into `dst`, copying those that cannot be linked (e.g., across devices)."""
+    for root, dirs, files in os.walk(src):
+        target_dir = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in files:
+            try:
+                os.link(os.path.join(root, name), os.path.join(target_dir, name))
+            except OSError:
+                shutil.copy2(os.path.join(root, name), os.path.join(target_dir, name))
 
 
 class K8SKP_SpecInstaller(JupyterApp):
@@ -60,6 +95,8 @@ class K8SKP_SpecInstaller(JupyterApp):
     jupyter-k8s-kernelspec install --language=R --image_name=foo/my_r_kernel_image:v4_0
     jupyter-k8s-kernelspec install --language=Scala --spark --kernel_name=Scala_on_k8s_spark
             --display_name='Scala on Kubernetes with Spark'
+    jupyter-k8s-kernelspec install --all --sys-prefix
+    jupyter-k8s-kernelspec install --manifest=kernelspecs.yaml
     '''
     kernel_spec_manager = Instance(KernelSpecManager)
 
@@ -106,6 +143,32 @@ class K8SKP_SpecInstaller(JupyterApp):
 
     extra_spark_opts = Unicode('', config=True, help="Specify additional Spark options.")
 
+    spark_launch_mode = Unicode(DEFAULT_SPARK_LAUNCH_MODE, config=True,
+                                help="How Spark driver pods are launched.  Must be one of 'submit' (via "
+                                     "spark-submit) or 'direct' (rendered from SPARK_OPTS without running "
+                                     "spark-submit in the server).  Default = 'submit'.")
+
+    spark_local_dirs = Unicode('', config=True,
+                               help="The volumes used for Spark's local (shuffle and spill) directories by the "
+                                    "driver and executors.  Must be one of 'emptyDir[:<size_limit>]', "
+                                    "'memory[:<size_limit>]' or 'hostPath:<path>[,<path>...]'.  Can be overridden "
+                                    "per launch via KERNEL_SPARK_LOCAL_DIRS.  Default = '' (the container's "
+                                    "filesystem).")
+
+    placement_policy = Unicode('', config=True,
+                               help="The named placement policy applied to kernel pods.  Must be one of 'pack', "
+                                    "'spread', or 'dedicated'.  Can be overridden per launch via "
+                                    "KERNEL_PLACEMENT_POLICY.  Default = '' (no policy).")
+
+    image_pull_policy = Unicode('', config=True,
+                                help="The imagePullPolicy of kernel containers.  Must be one of 'Always', "
+                                     "'IfNotPresent', or 'Never'.  Default = '' (the Kubernetes default, or "
+                                     "'IfNotPresent' when images are pinned).")
+
+    digest_map = Unicode('', config=True,
+                         help="A JSON or YAML file mapping image names to their digests, used to pin images "
+                              "without accessing their registries.  Implies --pin_images.")
+
     # Flags
     user = Bool(False, config=True,
                 help="Try to install the kernel spec to the per-user directory instead of the system "
@@ -119,6 +182,16 @@ class K8SKP_SpecInstaller(JupyterApp):
 
     tensorflow = Bool(False, config=True, help="Install kernel for use with Tensorflow.")
 
+    pin_images = Bool(False, config=True,
+                      help="Pin the kernel (and executor) images to their digests, resolved at install time.")
+
+    all = Bool(False, config=True, help="Install the default kernelspec of each supported variant.")
+
+    manifest = Unicode('', config=True,
+                       help="A YAML file listing the kernelspecs to install under 'kernelspecs', each entry "
+                            "specifying options (e.g., language, spark, image_name) by name.  Options under "
+                            "'defaults' apply to every entry.  Kernelspecs are built in parallel.")
+
     aliases = {
         'prefix': 'K8SKP_SpecInstaller.prefix',
         'kernel_name': 'K8SKP_SpecInstaller.kernel_name',
@@ -129,6 +202,12 @@ class K8SKP_SpecInstaller(JupyterApp):
         'spark_home': 'K8SKP_SpecInstaller.spark_home',
         'spark_init_mode': 'K8SKP_SpecInstaller.spark_init_mode',
         'extra_spark_opts': 'K8SKP_SpecInstaller.extra_spark_opts',
+        'spark_launch_mode': 'K8SKP_SpecInstaller.spark_launch_mode',
+        'spark_local_dirs': 'K8SKP_SpecInstaller.spark_local_dirs',
+        'placement_policy': 'K8SKP_SpecInstaller.placement_policy',
+        'manifest': 'K8SKP_SpecInstaller.manifest',
+        'image_pull_policy': 'K8SKP_SpecInstaller.image_pull_policy',
+        'digest_map': 'K8SKP_SpecInstaller.digest_map',
     }
     aliases.update(base_aliases)
 
@@ -140,14 +219,22 @@ class K8SKP_SpecInstaller(JupyterApp):
                        "Install kernelspec for Spark on Kubernetes."),
              'tensorflow': ({'K8SKP_SpecInstaller': {'tensorflow': True}},
                             "Install kernelspec with tensorflow support."),
+             'pin_images': ({'K8SKP_SpecInstaller': {'pin_images': True}},
+                            "Pin the kernel images to their digests, resolved at install time."),
+             'all': ({'K8SKP_SpecInstaller': {'all': True}},
+                     "Install kernelspecs for all supported languages, with and without Spark and Tensorflow."),
              'debug': base_flags['debug'], }
 
     def parse_command_line(self, argv=None):
         super(K8SKP_SpecInstaller, self).parse_command_line(argv=argv)
 
     def start(self):
+        if self.all or self.manifest:
+            return self._install_many()
+
         # validate parameters, ensure values are present
         self._validate_parameters()
+        self._pin_images()
 
         # create staging dir
         staging_dir = spec_utils.create_staging_directory()
@@ -159,6 +246,9 @@ class K8SKP_SpecInstaller(JupyterApp):
         source_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'pod-launcher'))
         dir_util.copy_tree(src=source_dir, dst=staging_dir)
 
+        self._install(staging_dir)
+
+    def _install(self, staging_dir):
         # copy appropriate resource files
         spec_utils.copy_kernelspec_files(staging_dir, launcher_type=None,
                                          resource_type=TENSORFLOW if self.tensorflow else self.language)
@@ -172,17 +262,98 @@ class K8SKP_SpecInstaller(JupyterApp):
         # apply template values at destination (since one of the values is the destination directory)
         self._finalize_kernel_json(install_dir)
 
+    def _install_many(self):
+        """Install the kernelspecs of the manifest (or all variants) in parallel.  The files common to all
+           kernelspecs are staged once and hardlinked into each kernelspec's staging directory.
+        """
+        if self.user and self.prefix:
+            self._log_and_exit("Can't specify both user and prefix. Please choose one or the other.")
+
+        ignored = sorted(name for name in KERNELSPEC_OPTIONS if name in self.config.K8SKP_SpecInstaller)
+        if ignored:
+            self.log.warning("Options {} will be ignored since they must be specified per kernelspec when "
+                             "installing multiple kernelspecs.".format(ignored))
+
+        installers = [self._create_installer(entry) for entry in self._get_manifest_entries()]
+        if not installers:
+            self._log_and_exit("Manifest '{}' does not list any kernelspecs.".format(self.manifest))
+        kernel_names = [installer.kernel_name for installer in installers]
+        duplicates = sorted(set(name for name in kernel_names if kernel_names.count(name) > 1))
+        if duplicates:
+            self._log_and_exit("Kernel names must be unique - found duplicates: {}".format(duplicates))
+
+        common_dir = spec_utils.create_staging_directory()
+        try:
+            source_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'pod-launcher'))
+            dir_util.copy_tree(src=source_dir, dst=common_dir)
+            with ThreadPoolExecutor(max_workers=min(len(installers), os.cpu_count() or 1)) as executor:
+                futures = [executor.submit(installer._install_from, common_dir) for installer in installers]
+                for future in futures:
+                    future.result()
+        finally:
+            spec_utils.delete_staging_directory(common_dir)
+
+    def _install_from(self, common_dir):
+        staging_dir = spec_utils.create_staging_directory()
+        try:
+            _link_tree(common_dir, staging_dir)
+            source_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'kernelspecs', self.template_dir))
+            dir_util.copy_tree(src=source_dir, dst=staging_dir)
+            self._install(staging_dir)
+        finally:
+            spec_utils.delete_staging_directory(staging_dir)
+
+    def _get_manifest_entries(self):
+        if not self.manifest:
+            return [{'language': language, 'spark': spark, 'tensorflow': tensorflow}
+                    for language, spark, tensorflow in ALL_VARIANTS]
+
+        try:
+            with open(self.manifest) as f:
+                manifest = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as err:
+            self._log_and_exit("Unable to load manifest '{}': {}".format(self.manifest, err))
+        if not isinstance(manifest, dict) or not isinstance(manifest.get('kernelspecs') or [], list):
+            self._log_and_exit("Manifest '{}' must contain a list of entries under 'kernelspecs'.".
+                               format(self.manifest))
+
+        defaults = manifest.get('defaults') or {}
+        entries = []
+        for entry in manifest.get('kernelspecs') or []:
+            entry = dict(defaults, **(entry or {}))
+            unknown = sorted(set(entry) - set(MANIFEST_OPTIONS))
+            if unknown:
+                self._log_and_exit("Manifest '{}' contains unsupported options {} - must be among: {}".
+                                   format(self.manifest, unknown, MANIFEST_OPTIONS))
+            entries.append(entry)
+        return entries
+
+    def _create_installer(self, entry):
+        # Options identifying a kernelspec come from its entry, while the remaining options (including those
+        # of the command line) apply to every kernelspec.
+        config = copy.deepcopy(self.config)
+        if 'K8SKP_SpecInstaller' in config:
+            for name in KERNELSPEC_OPTIONS:
+                config.K8SKP_SpecInstaller.pop(name, None)
+        installer = K8SKP_SpecInstaller(config=config, log=self.log, kernel_spec_manager=self.kernel_spec_manager)
+        installer.image_name = None  # use the language defaults rather than K8SKP_IMAGE_NAME
+        installer.executor_image_name = None
+        try:
+            for name, value in entry.items():
+                setattr(installer, name, value)
+        except TraitError as err:
+            self._log_and_exit("Manifest entry {} is invalid: {}".format(entry, err))
+        installer._validate_parameters()
+        installer._pin_images()
+        return installer
+
     def _finalize_kernel_json(self, location):
         """Apply substitutions to the kernel.json string, update a kernel spec using these values,
            then write to the target kernel.json file.
         """
         subs = self._get_substitutions(location)
-        kernel_json_str = ''
         with open(os.path.join(location, KERNEL_JSON)) as f:
-            for line in f:
-                line = line.split('#', 1)[0]
-                kernel_json_str = kernel_json_str + line
-            f.close()
+            kernel_json_str = ''.join(line.split('#', 1)[0] for line in f)
         post_subs = Template(kernel_json_str).safe_substitute(subs)
         kernel_json = json.loads(post_subs)
 
@@ -191,11 +362,50 @@ class K8SKP_SpecInstaller(JupyterApp):
         kernel_spec = KernelSpec().to_dict()
         kernel_spec.update(kernel_json)
 
+        if self.placement_policy:
+            kernel_spec['env']['KERNEL_PLACEMENT_POLICY'] = self.placement_policy
+
+        if self.image_pull_policy:
+            kernel_spec['env']['KERNEL_IMAGE_PULL_POLICY'] = self.image_pull_policy
+            for spark_opts in ('SPARK_OPTS', '__TOREE_SPARK_OPTS__'):  # applies to executors (and spark-submit)
+                if spark_opts in kernel_spec['env']:
+                    kernel_spec['env'][spark_opts] += " --conf spark.kubernetes.container.image.pullPolicy={}".\
+                        format(self.image_pull_policy)
+
+        if self.spark_local_dirs:
+            kernel_spec['env']['KERNEL_SPARK_LOCAL_DIRS'] = self.spark_local_dirs
+
+        if self.spark and self.spark_launch_mode == 'direct':
+            # Replace the spark-submit based run.sh with the pod launcher, which renders the driver pod itself.
+            kernel_spec['argv'] = ['python', os.path.join(location, 'scripts', 'launch_kubernetes.py'),
+                                   '--RemoteProcessProxy.kernel-id', '{kernel_id}',
+                                   '--RemoteProcessProxy.response-address', '{response_address}',
+                                   '--RemoteProcessProxy.spark-context-initialization-mode', self.spark_init_mode,
+                                   '--spark-driver']
+
         kernel_json_file = os.path.join(location, KERNEL_JSON)
         self.log.debug("Finalizing kernel json file for kernel: '{}'".format(self.display_name))
         with open(kernel_json_file, 'w+') as f:
             json.dump(kernel_spec, f, indent=2)
 
+        if not self.spark:
+            self._precompile_kernel_pod(location, kernel_spec)
+
+    def _precompile_kernel_pod(self, location, kernel_spec):
+        """Validate the kernel pod template by rendering it into the base pod spec used by launches."""
+        launcher_file = os.path.join(location, 'scripts', 'launch_kubernetes.py')
+        try:
+            spec = importlib.util.spec_from_file_location('launch_kubernetes', launcher_file)
+            launcher = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(launcher)
+            precompiled = launcher.precompile_kernel_pod(kernel_spec.get('env', {}))
+        except (Exception, SystemExit) as err:
+            self._log_and_exit("Kernel pod template for '{}' is invalid: {}".format(self.display_name, err))
+
+        self.log.debug("Precompiling kernel pod for kernel: '{}'".format(self.display_name))
+        with open(os.path.join(location, PRECOMPILED_POD_JSON), 'w+') as f:
+            json.dump(precompiled, f, indent=2)
+
     def _validate_parameters(self):
         if self.user and self.prefix:
             self._log_and_exit("Can't specify both user and prefix. Please choose one or the other.")
@@ -212,6 +422,12 @@ class K8SKP_SpecInstaller(JupyterApp):
             elif self.spark:
                 self._log_and_exit("Tensorflow support is mutually exclusive with Spark support.")
 
+        if self.placement_policy:
+            self.placement_policy = self.placement_policy.lower()
+            if self.placement_policy not in PLACEMENT_POLICIES:
+                self._log_and_exit("Placement policy '{}' is not in the set of supported placement policies: {}".
+                                   format(self.placement_policy, PLACEMENT_POLICIES))
+
         if self.spark is True:
             self.spark_init_mode = self.spark_init_mode.lower()
             if self.spark_init_mode not in SPARK_INIT_MODES:
@@ -226,6 +442,22 @@ class K8SKP_SpecInstaller(JupyterApp):
 
             self.template_dir = DEFAULT_KERNEL_NAMES[self.language] + SPARK_SUFFIX
 
+            self.spark_launch_mode = self.spark_launch_mode.lower()
+            if self.spark_launch_mode not in SPARK_LAUNCH_MODES:
+                self._log_and_exit("Spark launch mode '{}' is not in the set of supported launch modes: {}".
+                                   format(self.spark_launch_mode, SPARK_LAUNCH_MODES))
+
+            if self.spark_local_dirs:
+                try:
+                    spark_local_dirs.parse(self.spark_local_dirs)
+                except ValueError as ve:
+                    self._log_and_exit("Spark local dirs '{}' are invalid: {}".format(self.spark_local_dirs, ve))
+
+            if self.placement_policy and self.spark_launch_mode != 'direct':
+                self.log.warning("--placement_policy will be ignored since Spark driver pods are created by "
+                                 "spark-submit.  Use --spark_launch_mode=direct to apply placement policies.")
+                self.placement_policy = ''
+
             if self.image_name is None:
                 self.image_name = DEFAULT_SPARK_IMAGE_NAMES[self.language]
             if self.executor_image_name is None:
@@ -253,10 +485,51 @@ class K8SKP_SpecInstaller(JupyterApp):
             if len(self.extra_spark_opts) > 0:
                 self.log.warning("--extra_spark_opts will be ignored since --spark has not been specified.")
                 self.extra_spark_opts = ''
+            if self.spark_launch_mode != DEFAULT_SPARK_LAUNCH_MODE:
+                self.log.warning("--spark_launch_mode will be ignored since --spark has not been specified.")
+                self.spark_launch_mode = DEFAULT_SPARK_LAUNCH_MODE
+            if self.spark_local_dirs:
+                self.log.warning("--spark_local_dirs will be ignored since --spark has not been specified.")
+                self.spark_local_dirs = ''
+
+        if self.image_pull_policy:
+            policies = {policy.lower(): policy for policy in IMAGE_PULL_POLICIES}
+            if self.image_pull_policy.lower() not in policies:
+                self._log_and_exit("Image pull policy '{}' is not in the set of supported image pull policies: {}".
+                                   format(self.image_pull_policy, IMAGE_PULL_POLICIES))
+            self.image_pull_policy = policies[self.image_pull_policy.lower()]
 
         # sanitize kernel_name
         self.kernel_name = self.kernel_name.replace(' ', '_')
 
+    def _pin_images(self):
+        """Replace the kernel (and executor) image names with references pinned to their digests.  Since pinned
+           images cannot change, they are only pulled if not present (unless a pull policy is specified).
+        """
+        if not self.pin_images and not self.digest_map:
+            return
+
+        digest_map = None
+        if self.digest_map:
+            try:
+                digest_map = images.load_digest_map(self.digest_map)
+            except (OSError, ValueError, yaml.YAMLError) as err:
+                self._log_and_exit("Unable to load digest map '{}': {}".format(self.digest_map, err))
+
+        for trait_name in ('image_name', 'executor_image_name'):
+            image = getattr(self, trait_name)
+            if not image:
+                continue
+            try:
+                digest = images.resolve_digest(image, digest_map)
+            except Exception as err:
+                self._log_and_exit("Unable to pin image '{}' to its digest: {}".format(image, err))
+            setattr(self, trait_name, images.pin_image_reference(image, digest))
+            self.log.debug("Pinned image '{}' to '{}'".format(image, getattr(self, trait_name)))
+
+        if not self.image_pull_policy:
+            self.image_pull_policy = 'IfNotPresent'
+
     def _get_substitutions(self, install_dir):
 
         substitutions = dict()
@@ -275,6 +548,109 @@ class K8SKP_SpecInstaller(JupyterApp):
         self.exit(exit_status)
 
 
+class K8SKP_RecommendApp(JupyterApp):
+    """CLI for resource recommendations."""
+    name = u'jupyter-k8s-kernelspec-recommend'
+    description = u'Recommend kernel resource requests and limits from sampled kernel usage'
+    examples = '''
+    jupyter-k8s-kernelspec recommend
+    jupyter-k8s-kernelspec recommend --kernel_name=k8skp_python_spark --usage_file=/tmp/k8skp_usage.json
+    '''
+
+    usage_file = Unicode(usage.usage_file, config=True,
+                         help="The file containing the kernel usage sampled by the provider.  "
+                              "(K8SKP_USAGE_FILE env var)")
+
+    kernel_name = Unicode('', config=True,
+                          help="Only produce the recommendation for this kernelspec.  Default = '' (all kernelspecs).")
+
+    aliases = {
+        'usage_file': 'K8SKP_RecommendApp.usage_file',
+        'kernel_name': 'K8SKP_RecommendApp.kernel_name',
+    }
+    aliases.update(base_aliases)
+
+    flags = {'debug': base_flags['debug'], }
+
+    def start(self):
+        if not os.path.exists(self.usage_file):
+            self._log_and_exit("Usage file '{}' does not exist.  Ensure the provider has been run with "
+                               "K8SKP_USAGE_SAMPLING_INTERVAL_SECS enabled.".format(self.usage_file))
+
+        recommendations = usage.recommend(usage.load_usage(self.usage_file))
+        if self.kernel_name:
+            recommendations = {k: v for k, v in recommendations.items() if k == self.kernel_name}
+        if not recommendations:
+            self._log_and_exit("No usage has been recorded{}.".
+                               format(" for kernel '{}'".format(self.kernel_name) if self.kernel_name else ''))
+
+        row_format = "{:<30} {:>8} {:>12} {:>10} {:>15} {:>13}"
+        print(row_format.format('KERNEL', 'SAMPLES', 'CPU_REQUEST', 'CPU_LIMIT', 'MEMORY_REQUEST', 'MEMORY_LIMIT'))
+        for kernel_name, r in recommendations.items():
+            print(row_format.format(kernel_name, r['samples'], r['cpu_request'], r['cpu_limit'], r['memory_request'],
+                                    r['memory_limit']))
+
+    def _log_and_exit(self, msg, exit_status=1):
+        self.log.error(msg)
+        self.exit(exit_status)
+
+
+class K8SKP_ReplayApp(JupyterApp):
+    """CLI for replaying recorded Kubernetes API traces."""
+    name = u'jupyter-k8s-kernelspec-replay'
+    description = u'Replay a recorded Kubernetes API trace against a stub API server'
+    examples = '''
+    jupyter-k8s-kernelspec replay --trace_file=/tmp/k8skp_api_trace.jsonl
+    jupyter-k8s-kernelspec replay --trace_file=/tmp/k8skp_api_trace.jsonl --speed=2 --target=http://localhost:8001
+    '''
+
+    trace_file = Unicode(apitrace.trace_file or '', config=True,
+                         help="The trace recorded by the provider.  (K8SKP_API_TRACE_FILE env var)")
+
+    speed = Float(1.0, config=True,
+                  help="The factor by which the time between requests is compressed.  Default = 1.0 (as recorded).")
+
+    target = Unicode('', config=True,
+                     help="The URL of the API server to replay the requests against.  Default = '' (a local stub "
+                          "API server responding with the recorded status, latency and response size).")
+
+    aliases = {
+        'trace_file': 'K8SKP_ReplayApp.trace_file',
+        'speed': 'K8SKP_ReplayApp.speed',
+        'target': 'K8SKP_ReplayApp.target',
+    }
+    aliases.update(base_aliases)
+
+    flags = {'debug': base_flags['debug'], }
+
+    def start(self):
+        if not self.trace_file or not os.path.exists(self.trace_file):
+            self._log_and_exit("Trace file '{}' does not exist.  Ensure the provider has been run with "
+                               "K8SKP_API_TRACE_FILE set.".format(self.trace_file))
+        if self.speed <= 0:
+            self._log_and_exit("Speed must be positive.")
+
+        entries = apitrace.load_trace(self.trace_file)
+        if not entries:
+            self._log_and_exit("Trace file '{}' contains no requests.".format(self.trace_file))
+
+        self.log.info("Replaying {} requests from '{}'".format(len(entries), self.trace_file))
+        summary = apitrace.replay(entries, target=self.target or None, speed=self.speed)
+
+        print("Requests: {}  Duration: {:.2f}s (recorded {:.2f}s)  Max in flight: {} (recorded {})".
+              format(summary['requests'], summary['duration'], summary['recorded_duration'],
+                     summary['max_in_flight'], summary['recorded_max_in_flight']))
+        row_format = "{:<40} {:>7} {:>10} {:>9} {:>9}"
+        print(row_format.format('CALL', 'COUNT', 'MISMATCHES', 'P50_SECS', 'P99_SECS'))
+        for call, c in summary['calls'].items():
+            print(row_format.format(call, c['count'], c['mismatches'], "{:.3f}".format(c['p50']),
+                                    "{:.3f}".format(c['p99'])))
+
+    def _log_and_exit(self, msg, exit_status=1):
+        self.log.error(msg)
+        self.exit(exit_status)
+
+
 class KubernetesKernelProviderApp(Application):
     version = __version__
     name = 'jupyter k8s-kernelspec'
@@ -284,10 +660,14 @@ class KubernetesKernelProviderApp(Application):
     '''.format(__version__)
     examples = '''
     jupyter k8s-kernelspec install - Installs the kernel as a Jupyter Kernel.
+    jupyter k8s-kernelspec recommend - Recommends kernel resource requests and limits from sampled usage.
+    jupyter k8s-kernelspec replay - Replays a recorded Kubernetes API trace against a stub API server.
     '''
 
     subcommands = Dict({
         'install': (K8SKP_SpecInstaller, K8SKP_SpecInstaller.description.splitlines()[0]),
+        'recommend': (K8SKP_RecommendApp, K8SKP_RecommendApp.description.splitlines()[0]),
+        'replay': (K8SKP_ReplayApp, K8SKP_ReplayApp.description.splitlines()[0]),
     })
 
     aliases = {}
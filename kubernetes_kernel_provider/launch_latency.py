@@ -0,0 +1,153 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Adaptive kernel launch timeouts learned from observed kernel startup latencies.
+
+The time each kernel takes from launch until its pod is running (and ready) is folded into a decaying
+histogram kept per kernelspec and image, persisted to K8SKP_LAUNCH_LATENCY_FILE so that it survives
+restarts.  When K8SKP_ADAPTIVE_LAUNCH_TIMEOUT is enabled and a kernelspec/image has at least
+K8SKP_LAUNCH_TIMEOUT_MIN_SAMPLES observations, launches that do not specify KERNEL_LAUNCH_TIMEOUT use
+the K8SKP_LAUNCH_TIMEOUT_PERCENTILE latency times K8SKP_LAUNCH_TIMEOUT_MARGIN as their timeout - bounded
+by K8SKP_LAUNCH_TIMEOUT_MIN_SECS and K8SKP_LAUNCH_TIMEOUT_MAX_SECS.  As a result, stuck launches are
+abandoned promptly while slow-but-healthy launches (e.g., of large images on fresh nodes) are not.
+
+Launches that time out are censored observations - their latency is only known to exceed their timeout -
+so rather than being added to the histogram (which would pull the percentile toward the timeout itself),
+they are counted separately and placed above all observed latencies when computing the percentile.  Once
+timeouts exceed the fraction of launches the percentile allows for, the percentile is known to be beyond
+the learned timeout, so launches revert to the configured launch timeout until the kernelspec recovers.
+Each observation decays the previous ones by K8SKP_LAUNCH_LATENCY_DECAY, so the distribution reflects
+roughly the last 1 / (1 - decay) launches.
+
+Observations are persisted (off the event loop) at most every K8SKP_LAUNCH_LATENCY_SAVE_INTERVAL_SECS.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+
+from jupyter_core.paths import jupyter_data_dir
+
+from .stats import LogHistogram
+
+adaptive_launch_timeout = bool(os.getenv('K8SKP_ADAPTIVE_LAUNCH_TIMEOUT', 'false').lower() == 'true')
+latency_file = os.getenv('K8SKP_LAUNCH_LATENCY_FILE', os.path.join(jupyter_data_dir(), 'k8skp_launch_latency.json'))
+timeout_percentile = float(os.getenv('K8SKP_LAUNCH_TIMEOUT_PERCENTILE', '99'))
+timeout_margin = float(os.getenv('K8SKP_LAUNCH_TIMEOUT_MARGIN', '1.5'))
+min_samples = int(os.getenv('K8SKP_LAUNCH_TIMEOUT_MIN_SAMPLES', '10'))
+min_timeout = float(os.getenv('K8SKP_LAUNCH_TIMEOUT_MIN_SECS', '15'))
+max_timeout = float(os.getenv('K8SKP_LAUNCH_TIMEOUT_MAX_SECS', '900'))
+latency_decay = float(os.getenv('K8SKP_LAUNCH_LATENCY_DECAY', '0.98'))
+save_interval = float(os.getenv('K8SKP_LAUNCH_LATENCY_SAVE_INTERVAL_SECS', '30'))
+
+_lock = threading.Lock()
+_latencies = None
+_save_timer = None
+
+
+def latency_key(kernel_name, image):
+    return "{}|{}".format(kernel_name, image or '')
+
+
+def _new_entry():
+    return {'samples': 0, 'timeouts': 0.0, 'latency': LogHistogram(minimum=0.1)}
+
+
+def _load():
+    global _latencies
+    if _latencies is None:
+        _latencies = {}
+        if os.path.exists(latency_file):
+            with open(latency_file) as f:
+                data = json.load(f)
+            _latencies = {key: {'samples': entry['samples'], 'timeouts': entry.get('timeouts', 0.0),
+                                'latency': LogHistogram.from_dict(entry['latency'])}
+                          for key, entry in data.items()}
+    return _latencies
+
+
+def _save(data):
+    # Each save uses its own temp file so that concurrent saves (e.g., from multiple processes sharing
+    # the file) never write to the same temp file.
+    directory = os.path.dirname(os.path.abspath(latency_file))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(latency_file) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temp_path, latency_file)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def flush():
+    """Persists the distributions if any observations are pending."""
+    global _save_timer
+    with _lock:
+        if _save_timer is None:
+            return
+        _save_timer.cancel()
+        _save_timer = None
+        data = {key: {'samples': entry['samples'], 'timeouts': round(entry['timeouts'], 4),
+                      'latency': entry['latency'].to_dict()}
+                for key, entry in _latencies.items()}
+    _save(data)
+
+
+def _schedule_save():
+    # Called with _lock held.  Observations are batched into a single save, performed on a timer thread.
+    global _save_timer
+    if _save_timer is None:
+        _save_timer = threading.Timer(save_interval, flush)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+atexit.register(flush)
+
+
+def _observe(key):
+    # Called with _lock held.  Decays the previous observations of `key` and returns its entry.
+    entry = _load().setdefault(key, _new_entry())
+    entry['latency'].decay(latency_decay)
+    entry['timeouts'] *= latency_decay
+    entry['samples'] += 1
+    _schedule_save()
+    return entry
+
+
+def record(key, seconds):
+    """Records a startup latency (in seconds) for `key`."""
+    with _lock:
+        _observe(key)['latency'].add(seconds)
+
+
+def record_timeout(key):
+    """Records a launch of `key` that timed out (a censored observation whose latency is unknown)."""
+    with _lock:
+        _observe(key)['timeouts'] += 1
+
+
+def get_timeout(key):
+    """Returns the adaptive launch timeout for `key`, or None if disabled, too few launches were observed or
+    too many of them timed out."""
+    if not adaptive_launch_timeout:
+        return None
+    with _lock:
+        entry = _load().get(key)
+        if entry is None or entry['samples'] < min_samples:
+            return None
+        observed = entry['latency'].total
+        if observed <= 0:
+            return None
+        # Timeouts rank above every observed latency, so the percentile of all launches is the (higher)
+        # percentile of the observed latencies that accounts for them.
+        percentile = timeout_percentile * (observed + entry['timeouts']) / observed
+        if percentile > 100:
+            return None
+        latency = entry['latency'].percentile(percentile)
+    if latency is None:
+        return None
+    return round(min(max(latency * timeout_margin, min_timeout), max_timeout), 1)
@@ -0,0 +1,60 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Lightweight, in-process metrics registry used by the Kubernetes Kernel Provider.
+
+Values are keyed by metric name and a (sorted) tuple of label pairs.  The hosting application
+can publish them by calling `snapshot()` from whatever metrics endpoint it exposes.
+"""
+
+import threading
+
+_lock = threading.Lock()
+_gauges = {}
+_counters = {}
+_summaries = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def set_gauge(name, value, **labels):
+    """Sets gauge `name` (qualified by `labels`) to `value`."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def inc_gauge(name, amount=1, **labels):
+    """Adjusts gauge `name` (qualified by `labels`) by `amount`."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + amount
+
+
+def inc_counter(name, amount=1, **labels):
+    """Increments counter `name` (qualified by `labels`) by `amount`."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Records `value` into summary `name` (qualified by `labels`) - tracking count, sum and max."""
+    key = _key(name, labels)
+    with _lock:
+        count, total, maximum = _summaries.get(key, (0, 0.0, 0.0))
+        _summaries[key] = (count + 1, total + value, max(maximum, value))
+
+
+def snapshot():
+    """Returns a copy of all current metric values as a list of dictionaries."""
+    results = []
+    with _lock:
+        for (name, labels), value in _gauges.items():
+            results.append({'name': name, 'type': 'gauge', 'labels': dict(labels), 'value': value})
+        for (name, labels), value in _counters.items():
+            results.append({'name': name, 'type': 'counter', 'labels': dict(labels), 'value': value})
+        for (name, labels), (count, total, maximum) in _summaries.items():
+            results.append({'name': name, 'type': 'summary', 'labels': dict(labels),
+                            'count': count, 'sum': total, 'max': maximum})
+    return results
@@ -1,35 +1,481 @@
 import os
+import re
 import sys
-import yaml
+import copy
+import glob
+import json
+import time
+import shlex
+import hashlib
 import argparse
 from kubernetes import client, config
+from kubernetes.stream import stream
 import urllib3
 
-from jinja2 import FileSystemLoader, Environment
+# yaml and jinja2 are only imported when the templates must be rendered - launches using the precompiled kernel
+# pod (the common case) avoid the cost of importing them.
 
 urllib3.disable_warnings()
 
 KERNEL_POD_TEMPLATE_PATH = '/kernel-pod.yaml.j2'
+KERNEL_PLACEMENT_TEMPLATE_PATH = '/kernel-placement.yaml.j2'
+SPARK_DRIVER_TEMPLATE_PATH = '/spark-driver.yaml.j2'
+PRECOMPILED_POD_FILE = 'kernel-pod.json'  # located in the kernelspec directory, alongside k8skp_kernel.json
 
+# Packed kernels (see kernel_host.py) are started within their host pod using the kernel image's bootstrap script.
+KERNEL_BOOTSTRAP_SCRIPT = os.environ.get('KERNEL_BOOTSTRAP_SCRIPT', '/usr/local/bin/bootstrap-kernel.sh')
+KERNEL_HOST_PID_DIR = '/tmp/k8skp-kernels'
 
-def generate_kernel_pod_yaml(keywords):
+# Keywords whose values vary per launch.  When precompiling the kernel pod, these are rendered as sentinels whose
+# locations are recorded and later patched with the launch's values.  Optional keywords whose values are not
+# provided at launch have their fields removed (mirroring the template's `is defined` checks).
+PATCH_KEYWORDS = ['kernel_id', 'kernel_pod_name', 'kernel_namespace', 'kernel_generation', 'kernel_username',
+                  'kernel_language', 'kernel_image', 'kernel_service_account_name', 'eg_response_address',
+                  'kernel_spark_context_init_mode']
+OPTIONAL_PATCH_KEYWORDS = ['kernel_priority_class_name', 'kernel_shard', 'kernel_replica', 'kernel_working_dir']
+# Values of per-launch keywords not provided at launch (mirroring the template's `default` filters).
+PATCH_KEYWORD_DEFAULTS = {'kernel_generation': 0}
+# Integer-valued keywords are rendered using out-of-range sentinel values.
+INT_PATCH_KEYWORDS = {'kernel_uid': 1999999991, 'kernel_gid': 1999999992}
+
+# Maps the sections of a placement policy to the keywords consumed by the kernel pod template.
+PLACEMENT_KEYWORDS = {
+    'affinity': 'kernel_affinity',
+    'topologySpreadConstraints': 'kernel_topology_spread_constraints',
+    'nodeSelector': 'kernel_node_selector',
+    'tolerations': 'kernel_tolerations',
+}
+
+
+# Maps spark-submit options to the Spark properties they set.
+SPARK_SUBMIT_OPTIONS = {
+    '--name': 'spark.app.name',
+    '--driver-memory': 'spark.driver.memory',
+    '--driver-cores': 'spark.driver.cores',
+    '--driver-java-options': 'spark.driver.extraJavaOptions',
+    '--driver-library-path': 'spark.driver.extraLibraryPath',
+    '--driver-class-path': 'spark.driver.extraClassPath',
+    '--executor-memory': 'spark.executor.memory',
+    '--executor-cores': 'spark.executor.cores',
+    '--num-executors': 'spark.executor.instances',
+    '--total-executor-cores': 'spark.cores.max',
+    '--jars': 'spark.jars',
+    '--packages': 'spark.jars.packages',
+    '--exclude-packages': 'spark.jars.excludes',
+    '--repositories': 'spark.jars.repositories',
+    '--py-files': 'spark.submit.pyFiles',
+    '--files': 'spark.files',
+    '--archives': 'spark.archives',
+}
+# spark-submit options that have no bearing once the driver pod is rendered directly.
+SPARK_SUBMIT_IGNORED_OPTIONS = ['--deploy-mode', '--verbose', '--supervise']
+
+SPARK_DRIVER_PORT = 7078
+SPARK_BLOCK_MANAGER_PORT = 7079
+SPARK_MIN_MEMORY_OVERHEAD_MIB = 384
+
+# Keywords whose values are rendered as explicit driver pod labels - so they are not duplicated from Spark properties.
+SPARK_RESERVED_LABELS = ['kernel_id', 'kernel_generation', 'kernel_name', 'component', 'spark-role', 'placement_policy',
+                         'kernel_shard', 'kernel_replica']
+
+
+def generate_kernel_pod_yaml(keywords, template_path=KERNEL_POD_TEMPLATE_PATH):
     """Return the kubernetes pod spec as a yaml string.
 
     - load jinja2 template from this file directory.
     - substitute template variables with keywords items.
     """
+    from jinja2 import FileSystemLoader, Environment
+
     j_env = Environment(loader=FileSystemLoader(os.path.dirname(__file__)), trim_blocks=True, lstrip_blocks=True)
     # jinja2 template substitutes template variables with None though keywords doesn't contain corresponding item.
     # Therefore, no need to check if any are left unsubstituted; Kubernetes API server will validate the pod spec.
-    k8s_yaml = j_env.get_template(KERNEL_POD_TEMPLATE_PATH).render(**keywords)
+    k8s_yaml = j_env.get_template(template_path).render(**keywords)
 
     return k8s_yaml
 
 
-def launch_kubernetes_kernel(kernel_id, response_addr, spark_context_init_mode):
-    # Launches a containerized kernel as a kubernetes pod.
+def apply_placement_policy(keywords):
+    """Expand the placement policy named by keyword 'kernel_placement_policy' into pod spec keywords.
+
+    - load the policies from the jinja2 template in this file directory.
+    - values explicitly provided via KERNEL_ env (e.g., KERNEL_NODE_SELECTOR) take precedence over the policy.
+    """
+    policy_name = keywords.get('kernel_placement_policy')
+    if not policy_name:
+        return
+
+    import yaml
+    from jinja2 import FileSystemLoader, Environment
+
+    j_env = Environment(loader=FileSystemLoader(os.path.dirname(__file__)), trim_blocks=True, lstrip_blocks=True)
+    policies = yaml.safe_load(j_env.get_template(KERNEL_PLACEMENT_TEMPLATE_PATH).render(**keywords)) or {}
+    policy = policies.get(policy_name)
+    if policy is None:
+        sys.exit("ERROR - Unknown placement policy '{}' - must be one of {} - kernel launch terminating!".
+                 format(policy_name, list(policies)))
+
+    for section, value in policy.items():
+        keyword = PLACEMENT_KEYWORDS.get(section)
+        if keyword is None:
+            sys.exit("ERROR - Unhandled section '{}' found in placement policy '{}' - kernel launch terminating!".
+                     format(section, policy_name))
+        keywords.setdefault(keyword, value)
+
+
+def _sentinel(keyword):
+    return '@@{}@@'.format(keyword)
+
+
+def _collect_patches(node, path, patches):
+    # Records the path of each value containing a sentinel so it can be patched at launch.
+    if isinstance(node, dict):
+        for key, value in node.items():
+            _collect_patches(value, path + [key], patches)
+    elif isinstance(node, list):
+        for index, value in enumerate(node):
+            _collect_patches(value, path + [index], patches)
+    elif isinstance(node, str) and '@@' in node:
+        patches.append({'path': path, 'value': node})
+    elif isinstance(node, int) and node in INT_PATCH_KEYWORDS.values():
+        keyword = [name for name, sentinel in INT_PATCH_KEYWORDS.items() if sentinel == node][0]
+        patches.append({'path': path, 'keyword': keyword})
+
+
+def _template_hashes():
+    # Content hashes (unlike modification times) are unaffected by copying or re-installing unchanged templates.
+    template_dir = os.path.dirname(os.path.abspath(__file__))
+    hashes = dict()
+    for path in [KERNEL_POD_TEMPLATE_PATH, KERNEL_PLACEMENT_TEMPLATE_PATH]:
+        with open(os.path.join(template_dir, path.lstrip('/')), 'rb') as f:
+            hashes[path] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def precompile_kernel_pod(kernel_env):
+    """Render the kernel pod template once (at install time) into a base pod spec.
+
+    - KERNEL_ values from the kernelspec's env are rendered as-is and recorded.
+    - per-launch keywords are rendered as sentinels and their locations recorded as patches.
+    """
+    import yaml
+    from jinja2 import FileSystemLoader, Environment, meta
+
+    keywords = dict()
+    compiled_keywords = dict()
+    for name, value in kernel_env.items():
+        if name.startswith('KERNEL_'):
+            keywords[name.lower()] = yaml.safe_load(value)
+            compiled_keywords[name.lower()] = value
+    for keyword in PATCH_KEYWORDS + OPTIONAL_PATCH_KEYWORDS:
+        keywords[keyword] = _sentinel(keyword)
+    keywords.update(INT_PATCH_KEYWORDS)
+    keywords['kernel_name'] = os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    apply_placement_policy(keywords)
+
+    k8s_objs = [k8s_obj for k8s_obj in yaml.safe_load_all(generate_kernel_pod_yaml(keywords)) if k8s_obj]
+    patches = []
+    _collect_patches(k8s_objs, [], patches)
+
+    # Only KERNEL_ values referenced by the templates affect the pod - all others can be ignored at launch.
+    j_env = Environment(loader=FileSystemLoader(os.path.dirname(__file__)), trim_blocks=True, lstrip_blocks=True)
+    referenced = set()
+    for template_path in [KERNEL_POD_TEMPLATE_PATH, KERNEL_PLACEMENT_TEMPLATE_PATH]:
+        source = j_env.loader.get_source(j_env, template_path)[0]
+        referenced.update(meta.find_undeclared_variables(j_env.parse(source)))
+
+    return {'templates': _template_hashes(), 'keywords': compiled_keywords, 'referenced': sorted(referenced),
+            'objects': k8s_objs, 'patches': patches}
+
+
+def load_precompiled_kernel_pod(values):
+    """Return the kernel's objects from the precompiled pod spec patched with `values`, or None if the launch's
+    KERNEL_ env differs from that used to precompile the pod spec (requiring the template to be rendered)."""
+    precompiled_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), PRECOMPILED_POD_FILE)
+    if not os.path.exists(precompiled_file):
+        return None
+    with open(precompiled_file) as f:
+        precompiled = json.load(f)
+    if precompiled['templates'] != _template_hashes():  # templates have been modified since install
+        return None
+
+    referenced = set(precompiled['referenced'])
+    patchable = set(PATCH_KEYWORDS + OPTIONAL_PATCH_KEYWORDS) | set(INT_PATCH_KEYWORDS)
+    launch_keywords = {name.lower(): value for name, value in os.environ.items() if name.startswith('KERNEL_')}
+    for keyword in referenced - patchable:
+        if launch_keywords.get(keyword) != precompiled['keywords'].get(keyword):
+            return None
+
+    k8s_objs = copy.deepcopy(precompiled['objects'])
+    # The template only renders a section holding integer-valued fields (i.e., securityContext) if at least one
+    # of its keywords is defined, so sections none of whose integer fields have values are removed entirely.
+    int_sections = dict()
+    for patch in precompiled['patches']:
+        parent = k8s_objs
+        for key in patch['path'][:-1]:
+            parent = parent[key]
+        key = patch['path'][-1]
+        if 'keyword' in patch:
+            value = values.get(patch['keyword'])
+            section = tuple(patch['path'][:-1])
+            if value is None:
+                del parent[key]
+                int_sections.setdefault(section, False)
+            else:
+                parent[key] = int(value)
+                int_sections[section] = True
+            continue
+        value = patch['value']
+        for keyword in OPTIONAL_PATCH_KEYWORDS:
+            if value == _sentinel(keyword) and values.get(keyword) is None and isinstance(parent, dict):
+                del parent[key]
+                break
+        else:
+            for keyword in PATCH_KEYWORDS + OPTIONAL_PATCH_KEYWORDS:
+                default = PATCH_KEYWORD_DEFAULTS.get(keyword, '')
+                value = value.replace(_sentinel(keyword), str(values.get(keyword, default)))
+            parent[key] = value
+    for section, has_values in int_sections.items():
+        if not has_values:
+            parent = k8s_objs
+            for key in section[:-1]:
+                parent = parent[key]
+            del parent[section[-1]]
+    return k8s_objs
+
+
+def parse_spark_opts(spark_opts):
+    """Convert spark-submit options (i.e., SPARK_OPTS) into the equivalent dictionary of Spark properties."""
+    properties = dict()
+    args = shlex.split(spark_opts)
+    i = 0
+    while i < len(args):
+        option = args[i]
+        value = args[i + 1] if i + 1 < len(args) else None
+        if option == '-c':
+            option = '--conf'
+        if '=' in option and option.startswith('--'):
+            option, value = option.split('=', 1)  # e.g., '--conf=spark.foo=bar' or '--name=foo'
+            i -= 1  # value was embedded in the option
+        if option == '--conf':
+            if value is None or '=' not in value:
+                sys.exit("ERROR - Invalid Spark configuration '{}' found in SPARK_OPTS - kernel launch terminating!".
+                         format(value))
+            name, conf_value = value.split('=', 1)
+            properties[name] = conf_value
+        elif option == '--master':
+            properties['spark.master'] = value
+        elif option in SPARK_SUBMIT_OPTIONS:
+            properties[SPARK_SUBMIT_OPTIONS[option]] = value
+        elif option in SPARK_SUBMIT_IGNORED_OPTIONS:
+            if option != '--deploy-mode':
+                i -= 1  # flag options have no value
+        else:
+            sys.exit("ERROR - Unsupported spark-submit option '{}' found in SPARK_OPTS - kernel launch terminating!".
+                     format(option))
+        i += 2
+    return properties
+
+
+def _spark_memory_mib(memory):
+    """Convert a JVM memory string (e.g., '2g', '512m') to MiB.  Values without a suffix are taken as MiB."""
+    match = re.match(r'^(\d+)([kmgtp]?)b?$', str(memory).strip().lower())
+    if not match:
+        sys.exit("ERROR - Invalid Spark memory value '{}' - kernel launch terminating!".format(memory))
+    scale = {'k': 1.0 / 1024, '': 1, 'm': 1, 'g': 1024, 't': 1024 ** 2, 'p': 1024 ** 3}[match.group(2)]
+    return int(int(match.group(1)) * scale)
+
+
+def _spark_driver_volumes(properties):
+    """Convert spark.kubernetes.driver.volumes.[type].[name].* properties into pod volumes and volume mounts."""
+    volumes = dict()
+    mounts = dict()
+    prefix = 'spark.kubernetes.driver.volumes.'
+    for name, value in properties.items():
+        if not name.startswith(prefix):
+            continue
+        parts = name[len(prefix):].split('.')
+        if len(parts) < 4:
+            continue
+        volume_type, volume_name, section, key = parts[0], parts[1], parts[2], '.'.join(parts[3:])
+        if section == 'mount':
+            mount = mounts.setdefault(volume_name, {'name': volume_name})
+            if key == 'path':
+                mount['mountPath'] = value
+            elif key == 'readOnly':
+                mount['readOnly'] = value.lower() == 'true'
+            elif key == 'subPath':
+                mount['subPath'] = value
+        elif section == 'options':
+            source = volumes.setdefault(volume_name, {'name': volume_name, volume_type: {}})[volume_type]
+            if key == 'sizeLimit' or key == 'medium' or key == 'path' or key == 'type' or key == 'server':
+                source[key] = value
+            elif key == 'claimName':
+                source[key] = value
+            elif key == 'readOnly':
+                source[key] = value.lower() == 'true'
+    for volume_name in mounts:
+        volumes.setdefault(volume_name, {'name': volume_name, 'emptyDir': {}})
+    return list(volumes.values()), list(mounts.values())
+
+
+def _spark_primary_resource(language, launch_args):
+    """Return the driver's main class, primary resource and any additional jars based on the kernel's language."""
+    launchers_dir = os.environ.get('KERNEL_LAUNCHERS_DIR', '/usr/local/bin/kernel-launchers')
+    if language == 'python':
+        return 'org.apache.spark.deploy.PythonRunner', \
+            'local://{}/python/scripts/launch_ipykernel.py'.format(launchers_dir), [], launch_args
+    if language == 'r':
+        return 'org.apache.spark.deploy.RRunner', \
+            'local://{}/R/scripts/launch_IRkernel.R'.format(launchers_dir), [], launch_args
+    if language == 'scala':
+        # As with bin/run.sh, the launcher and toree jars are located relative to the gateway's launchers directory,
+        # which mirrors that of the kernel image.
+        lib_dir = os.path.join(launchers_dir, 'scala', 'lib')
+        launcher_jars = glob.glob(os.path.join(lib_dir, 'toree-launcher*.jar'))
+        assembly_jars = glob.glob(os.path.join(lib_dir, 'toree-assembly-*.jar'))
+        if not launcher_jars or not assembly_jars:
+            sys.exit("ERROR - Toree launcher or assembly jar is missing from '{}' - kernel launch terminating!".
+                     format(lib_dir))
+        toree_opts = shlex.split(os.environ.get('TOREE_OPTS') or os.environ.get('__TOREE_OPTS__', ''))
+        return 'launcher.ToreeLauncher', 'local://' + launcher_jars[0], ['local://' + assembly_jars[0]], \
+            toree_opts + launch_args
+    sys.exit("ERROR - Spark driver launch is not supported for kernel language '{}' - kernel launch terminating!".
+             format(language))
+
+
+def expand_env_vars(value):
+    """Expand $name and ${name} references in `value` from the environment as the shell would - unlike
+    os.path.expandvars, references to unset variables (e.g., KERNEL_EXTRA_SPARK_OPTS) expand to ''."""
+    return re.sub(r'\$(?:(\w+)|\{(\w+)\})', lambda match: os.environ.get(match.group(1) or match.group(2), ''),
+                  value)
+
+
+def build_spark_driver_keywords(keywords, launch_args):
+    """Derive the keywords used by the Spark driver template from SPARK_OPTS.
+
+    This performs the work spark-submit would otherwise perform (in a JVM) when submitting in cluster mode:
+    SPARK_OPTS is expanded and converted to Spark properties, which are then used to produce the driver's
+    spark.properties file, its headless service and the driver pod itself.
+    """
+    spark_opts = expand_env_vars(os.environ.get('SPARK_OPTS') or os.environ.get('__TOREE_SPARK_OPTS__', ''))
+    properties = parse_spark_opts(spark_opts)
+
+    kernel_id = keywords['kernel_id']
+    namespace = properties.get('spark.kubernetes.namespace', keywords['kernel_namespace'])
+    keywords['kernel_namespace'] = namespace
+    generation = keywords.get('kernel_generation') or 0
+    service_name = 'kd-{}-g{}'.format(kernel_id, generation)
+
+    main_class, primary_resource, jars, app_args = \
+        _spark_primary_resource(str(keywords.get('kernel_language', 'python')).lower(), launch_args)
+    if jars:
+        properties['spark.jars'] = ','.join([properties['spark.jars']] + jars if properties.get('spark.jars') else jars)
+
+    properties.setdefault('spark.app.name', kernel_id)
+    properties['spark.submit.deployMode'] = 'cluster'
+    properties['spark.kubernetes.submitInDriver'] = 'true'
+    properties['spark.kubernetes.namespace'] = namespace
+    properties['spark.kubernetes.driver.pod.name'] = keywords['kernel_pod_name']  # executors are owned by the driver
+    properties['spark.driver.host'] = '{}.{}.svc'.format(service_name, namespace)
+    properties.setdefault('spark.driver.port', str(SPARK_DRIVER_PORT))
+    properties.setdefault('spark.driver.blockManager.port', str(SPARK_BLOCK_MANAGER_PORT))
+
+    driver_memory_mib = _spark_memory_mib(properties.get('spark.driver.memory', '1g'))
+    if properties.get('spark.driver.memoryOverhead'):
+        overhead_mib = _spark_memory_mib(properties['spark.driver.memoryOverhead'])
+    else:
+        default_factor = '0.1' if primary_resource.endswith('.jar') else '0.4'  # non-JVM drivers need more
+        factor = float(properties.get('spark.kubernetes.memoryOverheadFactor', default_factor))
+        overhead_mib = max(int(driver_memory_mib * factor), SPARK_MIN_MEMORY_OVERHEAD_MIB)
+
+    labels_prefix = 'spark.kubernetes.driver.label.'
+    annotations_prefix = 'spark.kubernetes.driver.annotation.'
+    env_prefix = 'spark.kubernetes.driverEnv.'
+    keywords['spark_driver_labels'] = {name[len(labels_prefix):]: value for name, value in properties.items()
+                                       if name.startswith(labels_prefix) and
+                                       name[len(labels_prefix):] not in SPARK_RESERVED_LABELS}
+    keywords['spark_driver_annotations'] = {name[len(annotations_prefix):]: value for name, value in properties.items()
+                                            if name.startswith(annotations_prefix)}
+    keywords['spark_driver_env'] = {name[len(env_prefix):]: value for name, value in properties.items()
+                                    if name.startswith(env_prefix)}
+    if properties.get('spark.kubernetes.pyspark.pythonVersion'):
+        keywords['spark_driver_env']['PYSPARK_MAJOR_PYTHON_VERSION'] = \
+            properties['spark.kubernetes.pyspark.pythonVersion']
+    keywords['spark_driver_volumes'], keywords['spark_driver_volume_mounts'] = _spark_driver_volumes(properties)
 
-    config.load_incluster_config()
+    keywords['spark_driver_image'] = properties.get('spark.kubernetes.driver.container.image',
+                                                    properties.get('spark.kubernetes.container.image',
+                                                                   keywords.get('kernel_image')))
+    keywords['spark_driver_image_pull_policy'] = properties.get('spark.kubernetes.container.image.pullPolicy',
+                                                                keywords.get('kernel_image_pull_policy'))
+    keywords['spark_driver_service_account_name'] = \
+        properties.get('spark.kubernetes.authenticate.driver.serviceAccountName',
+                       keywords.get('kernel_service_account_name', 'default'))
+    keywords['spark_driver_cpus'] = properties.get('spark.kubernetes.driver.request.cores',
+                                                   properties.get('spark.driver.cores', '1'))
+    keywords['spark_driver_cpus_limit'] = properties.get('spark.kubernetes.driver.limit.cores')
+    keywords['spark_driver_memory'] = '{}Mi'.format(driver_memory_mib + overhead_mib)
+    keywords['spark_driver_port'] = int(properties['spark.driver.port'])
+    keywords['spark_block_manager_port'] = int(properties['spark.driver.blockManager.port'])
+    keywords['spark_driver_service_name'] = service_name
+    keywords['spark_driver_config_map_name'] = '{}-conf'.format(keywords['kernel_pod_name'])
+    keywords['spark_properties'] = properties
+    keywords['spark_driver_args'] = ['driver', '--properties-file', '/opt/spark/conf/spark.properties',
+                                     '--class', main_class, primary_resource] + app_args
+
+
+def launch_kernel_in_host(kernel_host, kernel_id, response_addr, spark_context_init_mode):
+    """Start the kernel as a process within the (shared) kernel host pod, recording its pid for status and
+    termination.  The kernel is started in its own session so that it (and its children) can be signaled as a group.
+    """
+    namespace = os.environ['KERNEL_NAMESPACE']
+    timeout = float(os.environ.get('KERNEL_LAUNCH_TIMEOUT', '30'))
+    start_time = time.time()
+    while True:  # the host pod may have just been created
+        pod = client.CoreV1Api().read_namespaced_pod(name=kernel_host, namespace=namespace)
+        if pod.status.phase == 'Running':
+            break
+        if pod.status.phase not in ('Pending', None) or time.time() - start_time > timeout:
+            sys.exit("ERROR - Kernel host pod '{}' is not running (phase: {}) - kernel launch terminating!".
+                     format(kernel_host, pod.status.phase))
+        time.sleep(0.5)
+
+    kernel_env = {
+        'EG_RESPONSE_ADDRESS': response_addr,
+        'KERNEL_LANGUAGE': os.environ.get('KERNEL_LANGUAGE', ''),
+        'KERNEL_SPARK_CONTEXT_INIT_MODE': spark_context_init_mode,
+        'KERNEL_NAME': os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+        'KERNEL_USERNAME': os.environ.get('KERNEL_USERNAME', ''),
+        'KERNEL_ID': kernel_id,
+        'KERNEL_NAMESPACE': namespace,
+    }
+    env_assignments = ' '.join('{}={}'.format(name, shlex.quote(value)) for name, value in kernel_env.items())
+    command = "mkdir -p {dir} && cd ~ 2>/dev/null; {env} setsid {script} > {dir}/{id}.log 2>&1 < /dev/null & " \
+              "echo $! > {dir}/{id}.pid".format(dir=KERNEL_HOST_PID_DIR, env=env_assignments,
+                                                script=KERNEL_BOOTSTRAP_SCRIPT, id=kernel_id)
+    stream(client.CoreV1Api().connect_get_namespaced_pod_exec, kernel_host, namespace,
+           command=['sh', '-c', command], stderr=True, stdin=False, stdout=True, tty=False)
+
+
+def launch_kubernetes_kernel(kernel_id, response_addr, spark_context_init_mode, spark_driver=False,
+                             kernel_host=None, dry_run=False):
+    # Launches a containerized kernel as a kubernetes pod.  If spark_driver is True, the kernel is
+    # launched as a Spark driver pod rendered directly from SPARK_OPTS (rather than by spark-submit).
+    # If kernel_host is provided, the kernel is launched as a process within that (shared) pod.
+    # If dry_run is True, the kernel's objects are written to stdout rather than created.
+
+    if dry_run:
+        if kernel_host:
+            sys.exit("ERROR - Dry runs are not supported for kernels launched within a kernel host pod!")
+        create_objects = print_kernel_objects
+    else:
+        config.load_incluster_config()
+        create_objects = create_kernel_objects
+
+    if kernel_host:
+        launch_kernel_in_host(kernel_host, kernel_id, response_addr, spark_context_init_mode)
+        return
 
     # Capture keywords and their values.
     keywords = dict()
@@ -42,15 +488,48 @@ def launch_kubernetes_kernel(kernel_id, response_addr, spark_context_init_mode):
     keywords['eg_response_address'] = response_addr
     keywords['kernel_spark_context_init_mode'] = spark_context_init_mode
 
+    # Unless launching a Spark driver, first try the kernel pod precompiled at install time.  This only requires
+    # patching the per-launch values into a copy of the pod spec, avoiding rendering and parsing the templates.
+    if not spark_driver:
+        values = {name.lower(): value for name, value in os.environ.items() if name.startswith('KERNEL_')}
+        values.update(keywords)
+        k8s_objs = load_precompiled_kernel_pod(values)
+        if k8s_objs is not None:
+            create_objects(k8s_objs, values['kernel_namespace'])
+            return
+
+    import yaml
+
     # Walk env variables looking for names prefixed with KERNEL_.  When found, set corresponding keyword value
     # with name in lower case.
     for name, value in os.environ.items():
         if name.startswith('KERNEL_'):
             keywords[name.lower()] = yaml.safe_load(value)
 
+    # Expand any placement policy into affinity, topology spread, node selector and toleration keywords.
+    apply_placement_policy(keywords)
+
     # Substitute all template variable (wrapped with {{ }}) and generate `yaml` string.
-    k8s_yaml = generate_kernel_pod_yaml(keywords)
+    if spark_driver:
+        launch_args = ['--RemoteProcessProxy.kernel-id', kernel_id,
+                       '--RemoteProcessProxy.response-address', response_addr,
+                       '--RemoteProcessProxy.spark-context-initialization-mode', spark_context_init_mode]
+        build_spark_driver_keywords(keywords, shlex.split(os.environ.get('LAUNCH_OPTS', '')) + launch_args)
+        k8s_yaml = generate_kernel_pod_yaml(keywords, SPARK_DRIVER_TEMPLATE_PATH)
+    else:
+        k8s_yaml = generate_kernel_pod_yaml(keywords)
+
+    create_objects(yaml.safe_load_all(k8s_yaml), keywords['kernel_namespace'])
+
+
+def print_kernel_objects(k8s_objs, kernel_namespace):
+    # Writes the kernel's objects (those create_kernel_objects would create) to stdout as yaml documents.
+    import yaml
+
+    print(yaml.safe_dump_all([k8s_obj for k8s_obj in k8s_objs if k8s_obj], default_flow_style=False), end='')
 
+
+def create_kernel_objects(k8s_objs, kernel_namespace):
     # For each k8s object (kind), call the appropriate API method.  Too bad there isn't a method
     # that can take a set of objects.
     #
@@ -58,13 +537,25 @@ def launch_kubernetes_kernel(kernel_id, response_addr, spark_context_init_mode):
     # https://github.com/kubernetes-client/python for API signatures.  Other examples can be found in
     # https://github.com/jupyter-incubator/enterprise_gateway/blob/master/enterprise_gateway/services/processproxies/k8s.py
     #
-    kernel_namespace = keywords['kernel_namespace']
-    k8s_objs = yaml.safe_load_all(k8s_yaml)
+    owner_reference = None  # objects following the pod are owned by it so they're deleted along with the pod
     for k8s_obj in k8s_objs:
         if k8s_obj.get('kind'):
             if k8s_obj['kind'] == 'Pod':
                 # print("{}".format(k8s_obj))  # useful for debug
-                client.CoreV1Api(client.ApiClient()).create_namespaced_pod(body=k8s_obj, namespace=kernel_namespace)
+                pod = client.CoreV1Api(client.ApiClient()).create_namespaced_pod(body=k8s_obj,
+                                                                                 namespace=kernel_namespace)
+                owner_reference = {'apiVersion': 'v1', 'kind': 'Pod', 'name': pod.metadata.name,
+                                   'uid': pod.metadata.uid}
+            elif k8s_obj['kind'] == 'ConfigMap':
+                if owner_reference:
+                    k8s_obj['metadata'].setdefault('ownerReferences', [owner_reference])
+                client.CoreV1Api(client.ApiClient()).create_namespaced_config_map(body=k8s_obj,
+                                                                                  namespace=kernel_namespace)
+            elif k8s_obj['kind'] == 'Service':
+                if owner_reference:
+                    k8s_obj['metadata'].setdefault('ownerReferences', [owner_reference])
+                client.CoreV1Api(client.ApiClient()).create_namespaced_service(body=k8s_obj,
+                                                                               namespace=kernel_namespace)
             elif k8s_obj['kind'] == 'Secret':
                 client.CoreV1Api(client.ApiClient()).create_namespaced_secret(body=k8s_obj, namespace=kernel_namespace)
             elif k8s_obj['kind'] == 'PersistentVolumeClaim':
@@ -86,6 +577,9 @@ if __name__ == '__main__':
                     [--RemoteProcessProxy.kernel-id <kernel_id>]
                     [--RemoteProcessProxy.response-address <response_addr>]
                     [--RemoteProcessProxy.spark-context-initialization-mode <mode>]
+                    [--spark-driver]
+                    [--kernel-host <pod_name>]
+                    [--dry-run]
     """
 
     parser = argparse.ArgumentParser()
@@ -96,10 +590,28 @@ if __name__ == '__main__':
     parser.add_argument('--RemoteProcessProxy.spark-context-initialization-mode', dest='spark_context_init_mode',
                         nargs='?', help='Indicates whether or how a spark context should be created',
                         default='none')
+    parser.add_argument('--spark-driver', dest='spark_driver', action='store_true',
+                        help='Launch the kernel as a Spark driver pod rendered from SPARK_OPTS (no spark-submit)')
+    parser.add_argument('--kernel-host', dest='kernel_host', nargs='?',
+                        help='Launch the kernel as a process within the named kernel host pod')
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help='Write the kernel\'s objects to stdout rather than creating them')
 
     arguments = vars(parser.parse_args())
+
+    if os.environ.get('K8SKP_API_TRACE_FILE'):  # record this launch's API requests alongside the provider's
+        try:
+            from kubernetes_kernel_provider import apitrace
+            apitrace.install(source='launch_kubernetes')
+        except ImportError:
+            pass
     kernel_id = arguments['kernel_id']
     response_addr = arguments['response_address']
     spark_context_init_mode = arguments['spark_context_init_mode']
 
-    launch_kubernetes_kernel(kernel_id, response_addr, spark_context_init_mode)
+    spark_driver = arguments['spark_driver']
+    kernel_host = arguments['kernel_host']
+
+    dry_run = arguments['dry_run']
+
+    launch_kubernetes_kernel(kernel_id, response_addr, spark_context_init_mode, spark_driver, kernel_host, dry_run)
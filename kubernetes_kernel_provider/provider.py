@@ -6,6 +6,11 @@ from kubernetes import config
 from kubernetes.config.config_exception import ConfigException
 from remote_kernel_provider import RemoteKernelProviderBase
 
+from . import capacity_buffer
+from . import pvc_pool
+from . import sharding
+from . import usage
+
 
 LOGGED_WARNING_INTERVAL = int(os.getenv("K8SKP_LOGGED_WARNING_INTERVAL_SECS", "600"))  # log no more than every 10 min
 last_logged_warning = datetime.min
@@ -47,4 +52,9 @@ class KubernetesKernelProvider(RemoteKernelProviderBase):
                 last_logged_warning = current_time
             return {}
 
+        sharding.start(self.log)  # no-op unless replicas are sharded
+        capacity_buffer.start(self.log)  # no-op unless a capacity buffer is configured
+        pvc_pool.start(self.log)  # no-op unless PVC pools are configured
+        usage.start(self.log)  # no-op unless usage sampling is enabled
+
         return super(KubernetesKernelProvider, self).find_kernels()
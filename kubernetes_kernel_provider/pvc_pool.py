@@ -0,0 +1,213 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Pools of pre-provisioned PersistentVolumeClaims used for kernel home/work volumes.
+
+Dynamically provisioning a PVC during a kernel launch puts the storage provisioner on the critical
+path of kernel startup.  Instead, pools of PVCs (one pool per storage class and size) are provisioned
+ahead of time in EG_KERNEL_PVC_POOL_NAMESPACE and claimed by kernels as they launch.  A user's
+previously released PVC is re-attached when available, otherwise any available PVC is claimed.
+
+Pools are configured via EG_KERNEL_PVC_POOLS, a semicolon-separated list of
+'<storage_class>:<size>:<count>' entries (e.g., 'fast-ssd:10Gi:5;standard:50Gi:2').  Kernels opt in
+via KERNEL_PVC_POOL, whose value is either '<storage_class>:<size>' or 'default' (the first pool).
+The claimed PVC is mounted at KERNEL_PVC_MOUNT_PATH (default '/home/jovyan/work').
+
+On kernel termination, EG_KERNEL_PVC_RELEASE_POLICY determines the PVC's fate: 'retain' (the default)
+releases it to its user for re-attachment by a subsequent kernel, while 'scrub' deletes it and lets the
+pool replenish itself with a fresh PVC.  Released PVCs that have not been re-attached within
+EG_KERNEL_PVC_RELEASED_TTL_SECS (default 7 days, 0 to retain them indefinitely) are deleted.
+
+Note: PVCs are namespaced, so pooled PVCs can only be used by kernels running in the pool's namespace
+(e.g., when EG_SHARED_NAMESPACE is enabled).  Storage classes that use 'WaitForFirstConsumer' binding
+will not bind pooled PVCs until first use.
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+
+from kubernetes import client
+
+pool_specs = os.getenv('EG_KERNEL_PVC_POOLS', '')
+pool_namespace = os.getenv('EG_KERNEL_PVC_POOL_NAMESPACE', os.getenv('EG_NAMESPACE', 'default'))
+release_policy = os.getenv('EG_KERNEL_PVC_RELEASE_POLICY', 'retain').lower()
+replenish_interval = float(os.getenv('EG_KERNEL_PVC_POOL_INTERVAL_SECS', '60'))
+default_mount_path = os.getenv('EG_KERNEL_PVC_MOUNT_PATH', '/home/jovyan/work')
+released_ttl = float(os.getenv('EG_KERNEL_PVC_RELEASED_TTL_SECS', str(7 * 24 * 60 * 60)))
+
+RELEASE_POLICIES = ['retain', 'scrub']
+POOL_LABEL = 'component=kernel-pvc-pool'
+AVAILABLE = 'available'
+CLAIMED = 'claimed'
+RELEASED = 'released'
+RELEASED_ANNOTATION = 'kubernetes-kernel-provider/released-at'  # epoch seconds
+
+_replenish_lock = threading.Lock()
+
+
+def _label_value(value):
+    """Converts `value` into a valid label value."""
+    return re.sub('[^0-9A-Za-z_.-]+', '-', value).strip('-_.')[:63]
+
+
+class PVCPool(object):
+    """A pool of pre-provisioned PVCs of a given storage class and size."""
+    def __init__(self, storage_class, size, count):
+        self.storage_class = storage_class
+        self.size = size
+        self.count = count
+        self.key = _label_value("{}-{}".format(storage_class, size).lower())
+
+    def selector(self, **labels):
+        selector = "{},pvc_pool={}".format(POOL_LABEL, self.key)
+        for name, value in labels.items():
+            selector += ",{}={}".format(name, value)
+        return selector
+
+    def list(self, **labels):
+        return client.CoreV1Api().list_namespaced_persistent_volume_claim(namespace=pool_namespace,
+                                                                          label_selector=self.selector(**labels)).items
+
+    def claim(self, kernel_id, username):
+        """Claims a PVC for the kernel, preferring one already claimed by the kernel (restarts), then one
+        previously released by the user, then any available PVC (bound PVCs first).  Returns its name.
+        """
+        user = _label_value(username)
+        candidates = self.list(kernel_id=kernel_id) + self.list(kernel_username=user, pvc_state=RELEASED)
+        available = self.list(pvc_state=AVAILABLE)
+        candidates += sorted(available, key=lambda pvc: (pvc.status.phase or '') != 'Bound')
+
+        for pvc in candidates:
+            labels = {'pvc_state': CLAIMED, 'kernel_id': kernel_id, 'kernel_username': user}
+            # Including the resourceVersion makes the claim fail (409) if another launch claimed it first.
+            body = {'metadata': {'labels': labels, 'annotations': {RELEASED_ANNOTATION: None},
+                                 'resourceVersion': pvc.metadata.resource_version}}
+            try:
+                client.CoreV1Api().patch_namespaced_persistent_volume_claim(name=pvc.metadata.name,
+                                                                            namespace=pool_namespace, body=body)
+                return pvc.metadata.name
+            except client.rest.ApiException as err:
+                if err.status != 409:
+                    raise
+
+        # The pool is exhausted - fall back to provisioning a PVC on the launch path.
+        return self.create(state=CLAIMED, kernel_id=kernel_id, kernel_username=user)
+
+    def release(self, pvc_name, policy):
+        if policy == 'scrub':
+            client.CoreV1Api().delete_namespaced_persistent_volume_claim(name=pvc_name, namespace=pool_namespace)
+        else:
+            body = {'metadata': {'labels': {'pvc_state': RELEASED, 'kernel_id': None},
+                                 'annotations': {RELEASED_ANNOTATION: str(int(time.time()))}}}
+            client.CoreV1Api().patch_namespaced_persistent_volume_claim(name=pvc_name, namespace=pool_namespace,
+                                                                        body=body)
+
+    def create(self, state=AVAILABLE, **labels):
+        labels.update({'app': 'enterprise-gateway', 'component': 'kernel-pvc-pool', 'pvc_pool': self.key,
+                       'pvc_state': state})
+        body = client.V1PersistentVolumeClaim(
+            metadata=client.V1ObjectMeta(generate_name="kernel-pvc-{}-".format(self.key), labels=labels),
+            spec=client.V1PersistentVolumeClaimSpec(
+                access_modes=['ReadWriteOnce'], storage_class_name=self.storage_class,
+                resources=client.V1ResourceRequirements(requests={'storage': self.size})))
+        pvc = client.CoreV1Api().create_namespaced_persistent_volume_claim(namespace=pool_namespace, body=body)
+        return pvc.metadata.name
+
+    def expire_released(self, ttl):
+        """Deletes released PVCs that have not been re-attached within `ttl` seconds.  Returns the number deleted.
+        """
+        deleted = 0
+        now = time.time()
+        for pvc in self.list(pvc_state=RELEASED):
+            released_at = (pvc.metadata.annotations or {}).get(RELEASED_ANNOTATION)
+            if released_at is None:  # released before release times were recorded
+                created = pvc.metadata.creation_timestamp
+                released_at = created.timestamp() if created else now
+            if now - float(released_at) < ttl:
+                continue
+            # The precondition prevents deleting the PVC if it was claimed in the meantime.
+            body = client.V1DeleteOptions(preconditions=client.V1Preconditions(
+                resource_version=pvc.metadata.resource_version))
+            try:
+                client.CoreV1Api().delete_namespaced_persistent_volume_claim(name=pvc.metadata.name,
+                                                                             namespace=pool_namespace, body=body)
+                deleted += 1
+            except client.rest.ApiException as err:
+                if err.status not in (404, 409):
+                    raise
+        return deleted
+
+    def replenish(self):
+        """Provisions PVCs until the pool holds `count` available PVCs.  Returns the number created."""
+        shortfall = self.count - len(self.list(pvc_state=AVAILABLE))
+        for _ in range(shortfall):
+            self.create()
+        return max(shortfall, 0)
+
+
+def parse_pools(specs):
+    """Parses EG_KERNEL_PVC_POOLS into a list of PVCPool instances."""
+    pools = []
+    for spec in specs.split(';'):
+        spec = spec.strip()
+        if not spec:
+            continue
+        parts = spec.split(':')
+        if len(parts) != 3:
+            raise ValueError("Invalid PVC pool specification '{}' - expected '<storage_class>:<size>:<count>'".
+                             format(spec))
+        pools.append(PVCPool(parts[0], parts[1], int(parts[2])))
+    return pools
+
+
+pools = parse_pools(pool_specs)
+
+
+def find_pool(name):
+    """Returns the pool identified by `name` ('default' or '<storage_class>:<size>'), or None."""
+    if not pools:
+        return None
+    if name.lower() == 'default':
+        return pools[0]
+    for pool in pools:
+        if name == "{}:{}".format(pool.storage_class, pool.size):
+            return pool
+    return None
+
+
+def replenish_all(log):
+    # Replenishments are serialized so that concurrent ones (e.g., following claims by concurrent launches and
+    # the periodic replenishment) each count the PVCs provisioned by the others rather than over-provisioning.
+    with _replenish_lock:
+        for pool in pools:
+            try:
+                if released_ttl > 0:
+                    expired = pool.expire_released(released_ttl)
+                    if expired:
+                        log.info("Deleted {} expired released PVC(s) from kernel PVC pool '{}'.".
+                                 format(expired, pool.key))
+                created = pool.replenish()
+                if created:
+                    log.info("Provisioned {} PVC(s) for kernel PVC pool '{}'.".format(created, pool.key))
+            except Exception as err:
+                log.warning("Error occurred replenishing kernel PVC pool '{}': {}".format(pool.key, err))
+
+
+async def _run(log):
+    loop = asyncio.get_event_loop()
+    while True:
+        await loop.run_in_executor(None, replenish_all, log)
+        await asyncio.sleep(replenish_interval)
+
+
+_pool_task = None
+
+
+def start(log):
+    """Starts the background replenishment of the PVC pools, if configured and not already started."""
+    global _pool_task
+    if _pool_task is None and pools:
+        _pool_task = asyncio.ensure_future(_run(log))
+    return _pool_task
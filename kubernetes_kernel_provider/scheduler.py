@@ -0,0 +1,144 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Fair-share scheduling of kernel launches.
+
+Kernel launches pass through a scheduler that bounds the number of concurrent launches - both overall
+(K8SKP_LAUNCH_CONCURRENCY) and per user (K8SKP_LAUNCH_USER_CONCURRENCY), where users are identified by
+KERNEL_USERNAME.  Launches beyond those limits wait in per-user queues that are served using weighted
+fair queuing: each user accrues virtual time in inverse proportion to their weight as their launches
+are dispatched, and the next launch always comes from the eligible user with the least virtual time.
+As a result, a user submitting a burst of launches cannot starve other users, whose launches proceed
+at (at least) their fair share of the available launch slots.
+
+Weights default to 1 and can be set per user via K8SKP_LAUNCH_USER_WEIGHTS, a comma-separated list of
+'<user>=<weight>' entries (e.g., 'alice=2,batch-user=0.5').  A value of 0 for either limit disables it.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+from . import metrics
+
+max_concurrent_launches = int(os.getenv('K8SKP_LAUNCH_CONCURRENCY', '0'))
+max_user_concurrent_launches = int(os.getenv('K8SKP_LAUNCH_USER_CONCURRENCY', '0'))
+user_weight_specs = os.getenv('K8SKP_LAUNCH_USER_WEIGHTS', '')
+
+
+def parse_weights(specs):
+    """Parses K8SKP_LAUNCH_USER_WEIGHTS into a dictionary of user to weight."""
+    weights = {}
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        user, sep, weight = spec.rpartition('=')
+        if not sep or not user or float(weight) <= 0:
+            raise ValueError("Invalid launch weight specification '{}' - expected '<user>=<weight>' "
+                             "with a positive weight".format(spec))
+        weights[user.strip()] = float(weight)
+    return weights
+
+
+class LaunchScheduler(object):
+    """Grants launch slots subject to global and per-user limits using weighted fair queuing."""
+    def __init__(self, max_concurrent=0, max_per_user=0, weights=None):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.weights = weights or {}
+        self.in_progress = 0
+        self.user_in_progress = {}
+        self.queues = {}  # user -> deque of waiting futures
+        self.virtual_times = {}
+        self.virtual_clock = 0.0
+
+    @property
+    def enabled(self):
+        return self.max_concurrent > 0 or self.max_per_user > 0
+
+    @property
+    def queue_depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _can_start(self, user):
+        if self.max_concurrent > 0 and self.in_progress >= self.max_concurrent:
+            return False
+        return self.max_per_user <= 0 or self.user_in_progress.get(user, 0) < self.max_per_user
+
+    def _start(self, user):
+        # A user's virtual time never lags the clock, so idle users can't bank credit for later bursts.
+        virtual_time = max(self.virtual_times.get(user, 0.0), self.virtual_clock)
+        self.virtual_clock = virtual_time
+        self.virtual_times[user] = virtual_time + 1.0 / self.weights.get(user, 1.0)
+        self.in_progress += 1
+        self.user_in_progress[user] = self.user_in_progress.get(user, 0) + 1
+
+    def _dispatch(self):
+        # Grant slots to the eligible user(s) with the least virtual time until no more can start.
+        while True:
+            eligible = [user for user, queue in self.queues.items() if queue and self._can_start(user)]
+            if not eligible:
+                break
+            user = min(eligible, key=lambda u: max(self.virtual_times.get(u, 0.0), self.virtual_clock))
+            waiter = self.queues[user].popleft()
+            if not self.queues[user]:
+                del self.queues[user]
+            if waiter.done():  # cancelled while waiting
+                continue
+            self._start(user)
+            waiter.set_result(None)
+        self._update_metrics()
+
+    async def acquire(self, user, timeout=None):
+        """Waits until a launch slot is available for `user`.  Raises asyncio.TimeoutError if a slot
+        cannot be acquired within `timeout` seconds."""
+        if not self.enabled:
+            return
+        if not self.queues.get(user) and self._can_start(user):
+            self._start(user)
+            self._update_metrics()
+            metrics.observe('kernel_launch_queue_wait_seconds', 0.0)
+            return
+
+        start_time = time.time()
+        waiter = asyncio.get_event_loop().create_future()
+        self.queues.setdefault(user, deque()).append(waiter)
+        self._update_metrics()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if waiter.done():
+                self.release(user)  # the slot was granted just as we gave up
+            else:
+                waiter.cancel()
+                self._remove_waiter(user, waiter)
+            raise
+        finally:
+            metrics.observe('kernel_launch_queue_wait_seconds', time.time() - start_time)
+
+    def release(self, user):
+        """Returns `user`'s launch slot, dispatching any waiting launches."""
+        if not self.enabled:
+            return
+        self.in_progress -= 1
+        self.user_in_progress[user] -= 1
+        if not self.user_in_progress[user]:
+            del self.user_in_progress[user]
+        self._dispatch()
+
+    def _remove_waiter(self, user, waiter):
+        queue = self.queues.get(user)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[user]
+        self._update_metrics()
+
+    def _update_metrics(self):
+        metrics.set_gauge('kernel_launch_queue_depth', self.queue_depth)
+        metrics.set_gauge('kernel_launches_in_progress', self.in_progress)
+
+
+launch_scheduler = LaunchScheduler(max_concurrent_launches, max_user_concurrent_launches,
+                                   parse_weights(user_weight_specs))
@@ -0,0 +1,257 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Partitions kernel ownership across multiple gateway replicas.
+
+When K8SKP_SHARD_COUNT is positive, kernels are divided into that many shards, each owned by the
+replica holding the shard's Lease (coordination.k8s.io) in K8SKP_SHARD_LEASE_NAMESPACE.  A replica
+stamps the kernels it launches (their pods and any namespaces created for them) with the 'kernel_shard'
+and 'kernel_replica' labels, and scopes its own kernel LISTs to the shards it holds via `selector()`.
+As a result, the API load and memory of each replica remain proportional to its share of kernels
+rather than to the total number of kernels.
+
+Each replica also maintains a membership lease and renews all of its leases every
+K8SKP_SHARD_RENEW_INTERVAL_SECS.  A replica's fair share is the shard count divided by the number of
+live members: replicas holding more than their share hand the excess off (as new replicas are added)
+and, when a replica goes away, its leases expire after K8SKP_SHARD_LEASE_DURATION_SECS and the orphaned
+shards are acquired by the remaining replicas.  Optimistic concurrency (the lease's resourceVersion)
+ensures only one replica wins a given shard.
+
+Only shards without kernels managed by this replica (see `register_kernel()`) are handed off - shards
+that still have kernels are retained, beyond the fair share if necessary, until those kernels terminate.
+That way a live replica's kernels are never relabeled or claimed by another replica while it is still
+managing them - only the kernels of orphaned shards change hands.
+
+Note: a replica that acquires an orphaned shard takes over the scoped LISTs (e.g., usage sampling) of
+its kernels.  Re-attaching kernel sessions requires the hosting application's kernel persistence.
+"""
+
+import asyncio
+import math
+import os
+import socket
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from kubernetes import client
+
+from . import metrics
+
+shard_count = int(os.getenv('K8SKP_SHARD_COUNT', '0'))
+replica_id = os.getenv('K8SKP_REPLICA_ID', os.getenv('HOSTNAME', socket.gethostname()))
+lease_namespace = os.getenv('K8SKP_SHARD_LEASE_NAMESPACE', os.getenv('EG_NAMESPACE', 'default'))
+lease_prefix = os.getenv('K8SKP_SHARD_LEASE_PREFIX', 'k8skp-shard')
+lease_duration = int(os.getenv('K8SKP_SHARD_LEASE_DURATION_SECS', '30'))
+renew_interval = float(os.getenv('K8SKP_SHARD_RENEW_INTERVAL_SECS', '10'))
+
+SHARD_LABEL = 'kernel_shard'
+REPLICA_LABEL = 'kernel_replica'
+MEMBER_SELECTOR = 'component=kernel-replica-lease'
+SHARD_SELECTOR = 'component=kernel-shard-lease'
+
+_kernels_lock = threading.Lock()
+_kernel_shards = {}  # kernel_id -> shard, for the kernels managed by this replica
+
+
+def is_enabled():
+    return shard_count > 0
+
+
+def _label_value(value):
+    return ''.join(c if c.isalnum() or c in '-_.' else '-' for c in value).strip('-_.')[:63]
+
+
+def _format_time(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _is_expired(lease, now):
+    spec = lease.spec
+    if spec is None or not spec.holder_identity or spec.renew_time is None:
+        return True
+    renew_time = spec.renew_time.replace(tzinfo=None)
+    return renew_time + timedelta(seconds=spec.lease_duration_seconds or lease_duration) < now
+
+
+class ShardLeaseManager(object):
+    """Acquires, renews and takes over shard leases on behalf of this replica."""
+    def __init__(self, log, identity=None):
+        self.log = log
+        self.identity = identity or replica_id
+        self.held = set()
+        self._lock = threading.Lock()
+
+    def lease_name(self, shard):
+        return "{}-{}".format(lease_prefix, shard)
+
+    def held_shards(self):
+        with self._lock:
+            return sorted(self.held)
+
+    def reconcile(self):
+        """Renews held leases, hands off shards beyond this replica's fair share, then acquires unheld or
+        expired leases up to that fair share."""
+        now = datetime.utcnow()
+        fair_share = int(math.ceil(shard_count / float(self._renew_membership(now))))
+
+        leases = {self.lease_name(shard): None for shard in range(shard_count)}
+        for lease in client.CoordinationV1Api().list_namespaced_lease(namespace=lease_namespace,
+                                                                      label_selector=SHARD_SELECTOR).items:
+            if lease.metadata.name in leases:
+                leases[lease.metadata.name] = lease
+        leases = {shard: leases[self.lease_name(shard)] for shard in range(shard_count)}
+
+        # Shards with kernels are renewed first so that only shards without kernels are handed off.
+        busy = kernel_shards()
+        owned = sorted((shard for shard, lease in leases.items()
+                        if lease is not None and lease.spec and lease.spec.holder_identity == self.identity),
+                       key=lambda shard: shard not in busy)
+        held = set()
+        for shard in owned:
+            if len(held) >= fair_share and shard not in busy:
+                self._release(shard, leases[shard])
+            elif self._update(shard, leases[shard], now):
+                held.add(shard)
+        for shard, lease in leases.items():
+            if len(held) >= fair_share:
+                break
+            if shard in held or (lease is not None and not _is_expired(lease, now)):
+                continue
+            if self._update(shard, lease, now):
+                previous = lease.spec.holder_identity if lease is not None and lease.spec else None
+                if previous and previous != self.identity:
+                    self.log.info("Replica '{}' took over orphaned kernel shard {} from '{}'.".
+                                  format(self.identity, shard, previous))
+                held.add(shard)
+
+        with self._lock:
+            if held != self.held:
+                self.log.info("Replica '{}' now owns kernel shards: {}".format(self.identity, sorted(held)))
+            self.held = held
+        metrics.set_gauge('kernel_shards_held', len(held), replica=self.identity)
+        return sorted(held)
+
+    def _renew_membership(self, now):
+        # Renews this replica's membership lease and returns the number of live replicas (including this one).
+        name = "{}-replica-{}".format(lease_prefix, _label_value(self.identity).lower())
+        body = {'apiVersion': 'coordination.k8s.io/v1', 'kind': 'Lease',
+                'metadata': {'name': name, 'labels': {'app': 'enterprise-gateway',
+                                                      'component': 'kernel-replica-lease'}},
+                'spec': {'holderIdentity': self.identity, 'leaseDurationSeconds': lease_duration,
+                         'renewTime': _format_time(now)}}
+        try:
+            client.CoordinationV1Api().patch_namespaced_lease(name=name, namespace=lease_namespace, body=body)
+        except client.rest.ApiException as err:
+            if err.status != 404:
+                raise
+            client.CoordinationV1Api().create_namespaced_lease(namespace=lease_namespace, body=body)
+
+        members = client.CoordinationV1Api().list_namespaced_lease(namespace=lease_namespace,
+                                                                   label_selector=MEMBER_SELECTOR).items
+        live_members = {lease.spec.holder_identity for lease in members if not _is_expired(lease, now)}
+        live_members.add(self.identity)
+        return len(live_members)
+
+    def _release(self, shard, lease):
+        # Hands off a shard by clearing its holder - making it immediately available to other replicas.
+        body = {'metadata': {'resourceVersion': lease.metadata.resource_version},
+                'spec': {'holderIdentity': None, 'renewTime': None}}
+        try:
+            client.CoordinationV1Api().patch_namespaced_lease(name=self.lease_name(shard), namespace=lease_namespace,
+                                                              body=body)
+            self.log.info("Replica '{}' handed off kernel shard {}.".format(self.identity, shard))
+        except client.rest.ApiException as err:
+            if err.status != 409:
+                raise
+
+    def _update(self, shard, lease, now):
+        # Creates or replaces the lease with this replica as the holder.  Replacing includes the lease's
+        # resourceVersion so that the update fails (409) if another replica updated the lease first.
+        spec = {'holderIdentity': self.identity, 'leaseDurationSeconds': lease_duration,
+                'renewTime': _format_time(now)}
+        name = self.lease_name(shard)
+        try:
+            if lease is None:
+                spec.update({'acquireTime': _format_time(now), 'leaseTransitions': 0})
+                body = {'apiVersion': 'coordination.k8s.io/v1', 'kind': 'Lease',
+                        'metadata': {'name': name, 'labels': {'app': 'enterprise-gateway',
+                                                              'component': 'kernel-shard-lease'}},
+                        'spec': spec}
+                client.CoordinationV1Api().create_namespaced_lease(namespace=lease_namespace, body=body)
+            else:
+                if lease.spec is None or lease.spec.holder_identity != self.identity:
+                    transitions = (lease.spec.lease_transitions or 0) + 1 if lease.spec else 0
+                    spec.update({'acquireTime': _format_time(now), 'leaseTransitions': transitions})
+                body = {'metadata': {'name': name, 'resourceVersion': lease.metadata.resource_version},
+                        'spec': spec}
+                client.CoordinationV1Api().patch_namespaced_lease(name=name, namespace=lease_namespace, body=body)
+        except client.rest.ApiException as err:
+            if err.status == 409:  # another replica won
+                return False
+            raise
+        return True
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.reconcile)
+            except Exception as err:
+                self.log.warning("Error occurred reconciling kernel shard leases: {}".format(err))
+            await asyncio.sleep(renew_interval)
+
+
+lease_manager = None
+_lease_task = None
+
+
+def start(log):
+    """Starts the background shard lease management, if sharding is enabled and not already started."""
+    global lease_manager, _lease_task
+    if _lease_task is None and is_enabled():
+        lease_manager = ShardLeaseManager(log)
+        _lease_task = asyncio.ensure_future(lease_manager.run())
+    return _lease_task
+
+
+def held_shards():
+    """Returns the shards currently held by this replica (empty if sharding is disabled or not started)."""
+    return lease_manager.held_shards() if lease_manager else []
+
+
+def assign_shard(kernel_id):
+    """Returns the held shard a new kernel should be stamped with, or None if no shards are held."""
+    shards = held_shards()
+    if not shards:
+        return None
+    return shards[zlib.crc32(kernel_id.encode('utf-8')) % len(shards)]
+
+
+def register_kernel(kernel_id, shard):
+    """Records that this replica manages kernel `kernel_id` in `shard` - preventing the shard's hand-off."""
+    with _kernels_lock:
+        _kernel_shards[kernel_id] = shard
+
+
+def unregister_kernel(kernel_id):
+    """Records that this replica no longer manages kernel `kernel_id`."""
+    with _kernels_lock:
+        _kernel_shards.pop(kernel_id, None)
+
+
+def kernel_shards():
+    """Returns the shards of the kernels managed by this replica."""
+    with _kernels_lock:
+        return set(_kernel_shards.values())
+
+
+def selector(label_selector):
+    """Scopes `label_selector` to the shards held by this replica when sharding is enabled."""
+    if not is_enabled():
+        return label_selector
+    shards = held_shards() or ['none']  # select nothing until shards are held
+    return "{},{} in ({})".format(label_selector, SHARD_LABEL, ','.join(str(shard) for shard in shards))
+
+
+def replica_label():
+    return _label_value(replica_id)
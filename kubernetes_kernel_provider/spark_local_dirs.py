@@ -0,0 +1,77 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Local scratch storage (spark.local.dir) for the drivers and executors of Spark kernels.
+
+By default, Spark's shuffle and spill files are written to the container's filesystem, which is slow and counts
+against the pod's ephemeral-storage limit.  KERNEL_SPARK_LOCAL_DIRS (defaulted at install time via
+`jupyter k8s-kernelspec install --spark_local_dirs`) selects dedicated volumes for them instead:
+
+    emptyDir[:<size_limit>]          - a node-local emptyDir volume (e.g., 'emptyDir:50Gi')
+    memory[:<size_limit>]            - a memory-backed (tmpfs) emptyDir volume, which counts against the pod's
+                                       memory limit
+    hostPath:<path>[,<path>...]      - host directories, typically local SSDs (e.g., 'hostPath:/mnt/ssd0,/mnt/ssd1')
+
+The volumes are named 'spark-local-dir-<n>', which Spark uses as local directories for the pods it creates
+(executors, and the driver when launched via spark-submit), and spark.local.dir names their mount paths for
+drivers rendered directly by launch_kubernetes.py.  The resulting Spark options are provided to the kernel's
+SPARK_OPTS (or __TOREE_SPARK_OPTS__) via KERNEL_SPARK_LOCAL_DIR_OPTS.
+"""
+
+import re
+
+LOCAL_DIR_TYPES = ['emptyDir', 'memory', 'hostPath']
+VOLUME_NAME = 'spark-local-dir-{}'
+MOUNT_PATH = '/var/data/spark-local-dir-{}'
+
+_quantity_pattern = re.compile(r'^\d+(\.\d+)?([KMGTPE]i?|[kmM])?$')
+
+
+def parse(spec):
+    """Returns the (type, values) of the spark local dirs `spec`, where values are the host paths (hostPath) or
+    the volume's optional size limit (emptyDir and memory).  Returns (None, []) if no local dirs are specified."""
+    if not spec or spec.strip().lower() == 'none':
+        return None, []
+    local_dir_type, _, argument = spec.strip().partition(':')
+    types = {name.lower(): name for name in LOCAL_DIR_TYPES}
+    if local_dir_type.lower() not in types:
+        raise ValueError("'{}' is not in the set of supported local dir types: {}".
+                         format(local_dir_type, LOCAL_DIR_TYPES))
+    local_dir_type = types[local_dir_type.lower()]
+    if local_dir_type == 'hostPath':
+        paths = [path.strip() for path in argument.split(',') if path.strip()]
+        if not paths:
+            raise ValueError("hostPath local dirs require one or more host paths (e.g., 'hostPath:/mnt/ssd0')")
+        for path in paths:
+            if not path.startswith('/') or re.search(r'\s', path):
+                raise ValueError("host path '{}' must be an absolute path".format(path))
+        return local_dir_type, paths
+    if argument and not _quantity_pattern.match(argument):
+        raise ValueError("size limit '{}' is not a valid quantity (e.g., '50Gi')".format(argument))
+    return local_dir_type, [argument] if argument else []
+
+
+def spark_opts(spec):
+    """Returns the Spark options (a string of '--conf' options) that mount the local dirs of `spec`."""
+    local_dir_type, values = parse(spec)
+    if local_dir_type is None:
+        return ''
+
+    # The (volume type, options) of each local dir.
+    if local_dir_type == 'hostPath':
+        volumes = [('hostPath', {'path': path, 'type': 'DirectoryOrCreate'}) for path in values]
+    else:
+        options = {'sizeLimit': values[0]} if values else {}
+        if local_dir_type == 'memory':
+            options['medium'] = 'Memory'
+        volumes = [('emptyDir', options)]
+
+    confs = []
+    for role in ('driver', 'executor'):
+        for i, (volume_type, options) in enumerate(volumes, start=1):
+            prefix = "spark.kubernetes.{}.volumes.{}.{}".format(role, volume_type, VOLUME_NAME.format(i))
+            confs.append("{}.mount.path={}".format(prefix, MOUNT_PATH.format(i)))
+            confs.extend("{}.options.{}={}".format(prefix, name, value) for name, value in options.items())
+    confs.append("spark.local.dir={}".format(','.join(MOUNT_PATH.format(i) for i in range(1, len(volumes) + 1))))
+    if local_dir_type == 'memory':
+        confs.append("spark.kubernetes.local.dirs.tmpfs=true")
+    return ' '.join("--conf {}".format(conf) for conf in confs)
@@ -0,0 +1,60 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Compact statistical summaries used to track kernel behavior over time."""
+
+import math
+
+
+class LogHistogram(object):
+    """An approximate histogram using logarithmically sized buckets.
+
+    Values are mapped to buckets whose upper bounds grow by `growth` (so percentiles are accurate to within
+    that factor) starting at `minimum`.  Only non-empty buckets are stored, keeping the histogram small
+    regardless of the number of values recorded.  Weights can be decayed so that recent values dominate.
+    """
+    def __init__(self, growth=1.05, minimum=1e-3, buckets=None):
+        self.growth = growth
+        self.minimum = minimum
+        self.buckets = buckets or {}
+
+    def _index(self, value):
+        if value <= self.minimum:
+            return 0
+        return int(math.ceil(math.log(value / self.minimum, self.growth)))
+
+    def _upper_bound(self, index):
+        return self.minimum * (self.growth ** index)
+
+    def add(self, value, weight=1.0):
+        index = self._index(value)
+        self.buckets[index] = self.buckets.get(index, 0.0) + weight
+
+    def decay(self, factor, epsilon=1e-3):
+        """Multiplies all weights by `factor`, discarding buckets whose weight falls below `epsilon`."""
+        self.buckets = {index: weight * factor for index, weight in self.buckets.items() if weight * factor >= epsilon}
+
+    @property
+    def total(self):
+        return sum(self.buckets.values())
+
+    def percentile(self, pct):
+        """Returns the (upper bound of the bucket containing the) `pct` percentile, or None if empty."""
+        total = self.total
+        if total <= 0:
+            return None
+        threshold = total * pct / 100.0
+        cumulative = 0.0
+        for index in sorted(self.buckets):
+            cumulative += self.buckets[index]
+            if cumulative >= threshold:
+                return self._upper_bound(index)
+        return self._upper_bound(max(self.buckets))
+
+    def to_dict(self):
+        return {'growth': self.growth, 'minimum': self.minimum,
+                'buckets': {str(index): round(weight, 4) for index, weight in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(growth=d['growth'], minimum=d['minimum'],
+                   buckets={int(index): weight for index, weight in d.get('buckets', {}).items()})
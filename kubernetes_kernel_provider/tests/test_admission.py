@@ -0,0 +1,92 @@
+"""Tests the pre-launch admission checks of kernels"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import logging
+import pytest
+
+from kubernetes_kernel_provider import admission
+
+GI = 2 ** 30
+
+
+@pytest.fixture()
+def cluster(monkeypatch):
+    quotas = {}
+    node_free = {'small': {'cpu': 2.0, 'memory': 4.0 * GI, 'pods': 10.0},
+                 'large': {'cpu': 16.0, 'memory': 64.0 * GI, 'pods': 10.0}}
+    monkeypatch.setattr(admission, 'get_quota_headroom', lambda namespace: quotas.get(namespace, {}))
+    monkeypatch.setattr(admission.cluster_state, 'get_node_free', lambda: node_free)
+    yield quotas, node_free
+
+
+@pytest.mark.parametrize('quantity, expected', [
+    ('500m', 0.5), ('2', 2.0), (4, 4.0), (0.25, 0.25), (None, 0.0), ('2Gi', 2.0 * GI), ('1.5Mi', 1.5 * 2 ** 20),
+    ('1k', 1000.0), ('3M', 3e6), ('100n', 1e-7), ('1e3', 1000.0), (' 1G ', 1e9),
+])
+def test_parse_quantity(quantity, expected):
+    assert admission.parse_quantity(quantity) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('quantity', ['', 'abc', '2Zi', '1.5 Gi', 'Gi'])
+def test_parse_quantity_invalid(quantity):
+    with pytest.raises(ValueError):
+        admission.parse_quantity(quantity)
+
+
+def test_kernel_requests():
+    env = {'KERNEL_CPUS': '500m', 'KERNEL_MEMORY_LIMIT': '2Gi', 'KERNEL_GPUS_LIMIT': '1', 'KERNEL_GPUS': ''}
+    assert admission.get_kernel_requests(env) == {'cpu': 0.5, 'memory': 2.0 * GI, 'nvidia.com/gpu': 1.0}
+    assert admission.get_kernel_limits(env) == {'memory': 2.0 * GI, 'nvidia.com/gpu': 1.0}
+
+
+def test_find_best_fit_node():
+    node_free = {'small': {'cpu': 2.0, 'memory': 4.0 * GI},
+                 'large': {'cpu': 16.0, 'memory': 64.0 * GI},
+                 'full': {'cpu': 32.0, 'memory': 64.0 * GI, 'pods': 0.0}}
+    assert admission.find_best_fit_node(node_free, {'cpu': 1.0, 'memory': 2.0 * GI}) == 'small'  # tightest fit
+    assert admission.find_best_fit_node(node_free, {'cpu': 4.0}) == 'large'
+    assert admission.find_best_fit_node(node_free, {'cpu': 20.0}) is None  # 'full' can't take more pods
+    assert admission.find_best_fit_node(node_free, {'nvidia.com/gpu': 1.0}) is None
+    assert admission.find_best_fit_node({}, {'cpu': 1.0}) is None
+
+
+def test_check_admission(cluster):
+    result = admission.check_admission(None, {'cpu': 4.0})
+    assert result.admitted
+    assert result.headroom == {'nodes': 2, 'best_fit_node': 'large'}
+
+    result = admission.check_admission(None, {'cpu': 32.0})
+    assert not result.admitted
+    assert 'No schedulable node' in result.reason
+
+
+def test_check_admission_quota_headroom(cluster):
+    quotas, _ = cluster
+    quotas['kernels'] = {'requests.cpu': 2.0, 'limits.memory': 8.0 * GI, 'pods': 5.0}
+    result = admission.check_admission('kernels', {'cpu': 1.0}, {'memory': 8.0 * GI})
+    assert result.admitted
+    assert result.headroom['quota'] == quotas['kernels']
+
+    result = admission.check_admission('kernels', {'cpu': 4.0})
+    assert not result.admitted
+    assert "insufficient 'requests.cpu' headroom" in result.reason
+
+    result = admission.check_admission('kernels', {'cpu': 1.0}, {'memory': 16.0 * GI})
+    assert not result.admitted
+    assert "insufficient 'limits.memory' headroom" in result.reason
+
+    quotas['kernels']['pods'] = 0.0
+    result = admission.check_admission('kernels', {})
+    assert not result.admitted
+    assert "insufficient 'pods' headroom" in result.reason
+
+
+def test_validate_policy(caplog):
+    log = logging.getLogger('test_admission')
+    for policy in admission.ADMISSION_POLICIES:
+        assert admission.validate_policy(policy, log) == policy
+    assert not caplog.records
+    assert admission.validate_policy('reejct', log) == 'none'
+    assert "EG_KERNEL_ADMISSION_POLICY 'reejct' is not one of" in caplog.records[0].getMessage()
@@ -0,0 +1,76 @@
+"""Tests the recording of the provider's Kubernetes API requests"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import json
+import pytest
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from kubernetes import client
+from kubernetes.client import rest
+
+from kubernetes_kernel_provider import apitrace
+
+POD_LIST = json.dumps({'kind': 'PodList', 'apiVersion': 'v1', 'metadata': {}, 'items': []}).encode()
+
+
+class PodListHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if '/pods' in self.path:
+            status, body = 200, POD_LIST
+        else:
+            status, body = 404, json.dumps({'kind': 'Status', 'code': 404, 'reason': 'NotFound'}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture()
+def api(monkeypatch, tmpdir):
+    monkeypatch.setattr(rest.RESTClientObject, 'request', rest.RESTClientObject.request)  # restored on teardown
+    monkeypatch.setattr(apitrace, '_trace', None)
+    monkeypatch.setattr(apitrace, '_source', None)
+    monkeypatch.setattr(apitrace, '_original_request', None)
+    trace_file = str(tmpdir.join('trace.jsonl'))
+    assert apitrace.install(path=trace_file)
+
+    server = HTTPServer(('127.0.0.1', 0), PodListHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    configuration = client.Configuration()
+    configuration.host = "http://127.0.0.1:{}".format(server.server_address[1])
+    yield client.CoreV1Api(client.ApiClient(configuration)), trace_file
+    server.shutdown()
+    server.server_close()
+    apitrace._trace.close()
+
+
+def test_parse_resource():
+    assert apitrace.parse_resource('/api/v1/namespaces/kernels/pods') == ('pods', 'kernels')
+    assert apitrace.parse_resource('/api/v1/namespaces/kernels/pods/k1/exec') == ('pods/exec', 'kernels')
+    assert apitrace.parse_resource('/api/v1/namespaces/kernels') == ('namespaces', 'kernels')
+    assert apitrace.parse_resource('/apis/coordination.k8s.io/v1/namespaces/ns/leases/l') == ('leases', 'ns')
+    assert apitrace.parse_resource('/api/v1/nodes') == ('nodes', None)
+
+
+def test_records_requests(api):
+    core_v1_api, trace_file = api
+    pods = core_v1_api.list_namespaced_pod('kernels', label_selector='component=kernel')
+    assert pods.items == []
+    with pytest.raises(client.rest.ApiException):
+        core_v1_api.read_namespace('kernels')
+
+    listed, missing = apitrace.load_trace(trace_file)
+    assert listed['src'] == 'provider'
+    assert (listed['verb'], listed['resource'], listed['ns']) == ('GET', 'pods', 'kernels')
+    assert listed['path'] == '/api/v1/namespaces/kernels/pods'
+    assert 'labelSelector=component%3Dkernel' in listed['query']
+    assert (listed['status'], listed['bytes']) == (200, len(POD_LIST))
+    assert listed['latency'] >= 0
+    assert (missing['resource'], missing['status']) == ('namespaces', 404)
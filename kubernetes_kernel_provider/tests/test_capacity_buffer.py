@@ -0,0 +1,85 @@
+"""Tests the schedule of the kernel capacity buffer"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import logging
+import pytest
+from datetime import datetime
+
+from kubernetes_kernel_provider import capacity_buffer
+from kubernetes_kernel_provider.capacity_buffer import desired_size, parse_schedule
+
+MONDAY = datetime(2024, 1, 1)
+FRIDAY = datetime(2024, 1, 5)
+SATURDAY = datetime(2024, 1, 6)
+SUNDAY = datetime(2024, 1, 7)
+
+
+def at(day, hour, minute=0):
+    return day.replace(hour=hour, minute=minute)
+
+
+def test_parse_schedule():
+    entries = parse_schedule(' Mon-Fri 08:00-18:00=10; 18:00-22:30 = 4;; Sat,Sun 9:00-17:00=2 ')
+    assert entries == [({0, 1, 2, 3, 4}, 480, 1080, 10),
+                       (set(range(7)), 1080, 1350, 4),
+                       ({5, 6}, 540, 1020, 2)]
+    assert parse_schedule('') == []
+
+
+def test_parse_schedule_wrapping_days():
+    assert parse_schedule('Fri-Mon 08:00-18:00=3')[0][0] == {4, 5, 6, 0}
+    assert parse_schedule('Sunday-Tuesday 08:00-18:00=3')[0][0] == {6, 0, 1}
+
+
+@pytest.mark.parametrize('schedule', ['Mon-Fri 08:00-18:00', 'Mon-Fri 08:00=10', 'Funday 08:00-18:00=10',
+                                      'Mon- 08:00-18:00=10', '08:00-25:00=10', '08:60-18:00=10',
+                                      '08:00-18:00=-1', 'Mon-Fri 08:00-18:00=10; bogus'])
+def test_parse_schedule_invalid(schedule):
+    with pytest.raises(ValueError):
+        parse_schedule(schedule)
+
+
+def test_desired_size():
+    entries = parse_schedule('Mon-Fri 08:00-18:00=10; 18:00-22:00=4')
+    assert desired_size(entries, 1, at(MONDAY, 8)) == 10
+    assert desired_size(entries, 1, at(MONDAY, 17, 59)) == 10
+    assert desired_size(entries, 1, at(MONDAY, 18)) == 4  # windows end exclusively
+    assert desired_size(entries, 1, at(SATURDAY, 12)) == 1
+    assert desired_size(entries, 1, at(SATURDAY, 19)) == 4
+    assert desired_size(entries, 1, at(MONDAY, 22)) == 1
+    assert desired_size([], 1, at(MONDAY, 12)) == 1
+
+
+def test_desired_size_first_match_wins():
+    entries = parse_schedule('Mon 00:00-24:00=0; 08:00-18:00=10')
+    assert desired_size(entries, 1, at(MONDAY, 12)) == 0
+    assert desired_size(entries, 1, at(SUNDAY, 12)) == 10
+
+
+def test_desired_size_overnight_window():
+    entries = parse_schedule('Fri 22:00-02:00=6')
+    assert desired_size(entries, 1, at(FRIDAY, 21, 59)) == 1
+    assert desired_size(entries, 1, at(FRIDAY, 23)) == 6
+    assert desired_size(entries, 1, at(SATURDAY, 1, 59)) == 6  # the window started on Friday
+    assert desired_size(entries, 1, at(SATURDAY, 2)) == 1
+    assert desired_size(entries, 1, at(FRIDAY, 1)) == 1  # Thursday's night isn't scheduled
+    assert desired_size(entries, 1, at(SATURDAY, 23)) == 1
+
+    # overnight windows on wrapping day ranges carry into the following week
+    entries = parse_schedule('Sat-Sun 20:00-06:00=2')
+    assert desired_size(entries, 1, at(MONDAY, 5)) == 2
+    assert desired_size(entries, 1, at(MONDAY, 20)) == 1
+
+
+def test_start_with_invalid_schedule(monkeypatch, caplog):
+    monkeypatch.setattr(capacity_buffer, 'buffer_schedule', 'Mon-Fri 08:00-18:00')
+    monkeypatch.setattr(capacity_buffer, '_buffer_task', None)
+    monkeypatch.setattr(capacity_buffer, '_invalid_schedule', False)
+    log = logging.getLogger('test_capacity_buffer')
+    assert capacity_buffer.start(log) is None
+    assert capacity_buffer.start(log) is None  # e.g., each time kernels are found
+    errors = [record for record in caplog.records if record.levelno == logging.ERROR]
+    assert len(errors) == 1
+    assert 'K8SKP_CAPACITY_BUFFER_SCHEDULE' in errors[0].getMessage()
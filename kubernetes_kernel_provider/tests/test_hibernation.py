@@ -0,0 +1,73 @@
+"""Tests the snapshots of hibernated kernels"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import os
+import pytest
+import sys
+
+from kubernetes_kernel_provider import hibernation
+
+
+class FakeShell(object):
+    def __init__(self, user_ns):
+        self.user_ns = user_ns
+        self.user_ns_hidden = {'In': None, 'Out': None}
+
+
+def run_in_kernel(code, shell):
+    exec(compile(code, '<kernel>', 'exec'), {'get_ipython': lambda: shell})
+
+
+def test_pvc_name(monkeypatch):
+    assert hibernation.pvc_name('Bob@Example.com') == 'kernel-snapshots-bob-example-com'
+    assert hibernation.pvc_name('-alice_') == 'kernel-snapshots-alice'
+    monkeypatch.setattr(hibernation, 'pvc_prefix', 'Snapshots')
+    assert hibernation.pvc_name('x' * 300) == ('snapshots-' + 'x' * 300)[:253]
+
+
+def test_snapshot_path(monkeypatch):
+    monkeypatch.setattr(hibernation, 'mount_path', '/snapshots/')
+    assert hibernation.snapshot_path('k1', 'Python') == '/snapshots/k1.pickle'
+    assert hibernation.snapshot_path('k1', 'R') == '/snapshots/k1.RData'
+    assert hibernation.is_supported('python') and hibernation.is_supported('R')
+    assert not hibernation.is_supported('scala') and not hibernation.is_supported(None)
+
+
+def test_code_quotes_path():
+    path = '/snapshots/it\'s "k1".RData'
+    assert 'file.rename(paste0("/snapshots/it\'s \\"k1\\".RData", ".tmp"), "/snapshots/it\'s \\"k1\\".RData")' in \
+        hibernation.save_code('r', path)
+    assert 'load("/snapshots/it\'s \\"k1\\".RData", envir = env)' in hibernation.restore_code('R', path)
+
+
+def test_python_round_trip(tmpdir):
+    path = str(tmpdir.join('k1.pickle'))
+    saved = FakeShell({'x': 42, 'data': {'a': [1, 2]}, 'os_module': os, 'In': [], '_hidden': 1,
+                       'unpicklable': (i for i in range(3))})
+    run_in_kernel(hibernation.save_code('python', path), saved)
+    assert os.listdir(str(tmpdir)) == ['k1.pickle']  # written via a temp file
+    assert '__k8skp_save' not in saved.user_ns
+
+    restored = FakeShell({'In': []})
+    run_in_kernel(hibernation.restore_code('python', path), restored)
+    assert restored.user_ns == {'In': [], 'x': 42, 'data': {'a': [1, 2]}, 'os_module': os}
+    assert not os.path.exists(path)  # snapshots are removed once restored
+
+
+def test_python_restore_skips_failures(tmpdir, monkeypatch):
+    path = str(tmpdir.join('k1.pickle'))
+    module = type(sys)('k8skp_snapshot_test_module')
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+    run_in_kernel(hibernation.save_code('python', path), FakeShell({'mod': module, 'y': 'kept'}))
+
+    monkeypatch.delitem(sys.modules, module.__name__)  # the module is no longer importable
+    restored = FakeShell({})
+    run_in_kernel(hibernation.restore_code('python', path), restored)
+    assert restored.user_ns == {'y': 'kept'}
+
+
+def test_unsupported_language():
+    with pytest.raises(KeyError):
+        hibernation.save_code('scala', '/snapshots/k1')
@@ -7,6 +7,8 @@ import json
 import os
 import pytest
 import shutil
+import sys
+import yaml
 from tempfile import mkdtemp
 
 
@@ -174,3 +176,344 @@ def test_create_tensorflow_kernelspec(script_runner, mock_kernels_dir):
         assert 'SPARK_HOME' not in kernel_json["env"]
         argv = kernel_json["argv"]
         assert argv[len(argv) - 1] == '{response_address}'
+
+
+def test_bad_placement_policy(script_runner):
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--placement_policy=bogus')
+    assert ret.success is False
+    assert ret.stdout == ''
+    assert "[K8SKP_SpecInstaller] ERROR | Placement policy 'bogus' is not in the set of supported placement " \
+           "policies" in ret.stderr
+
+
+def test_create_placement_policy_kernelspec(script_runner, mock_kernels_dir):
+    my_env = os.environ.copy()
+    my_env.update({"JUPYTER_DATA_DIR": mock_kernels_dir})
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--kernel_name=my_packed_kernel',
+                            '--placement_policy=Pack', '--user', env=my_env)
+    assert ret.success
+    assert ret.stderr.startswith("[K8SKP_SpecInstaller] Installing Kubernetes Kernel Provider")
+    assert ret.stdout == ''
+
+    assert os.path.isfile(os.path.join(mock_kernels_dir, 'kernels', 'my_packed_kernel', 'scripts',
+                                       'kernel-placement.yaml.j2'))
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'my_packed_kernel', 'k8skp_kernel.json'), "r") as fd:
+        kernel_json = json.load(fd)
+        assert kernel_json["env"]["KERNEL_PLACEMENT_POLICY"] == 'pack'
+
+
+def test_create_precompiled_pod_kernelspec(script_runner, mock_kernels_dir):
+    my_env = os.environ.copy()
+    my_env.update({"JUPYTER_DATA_DIR": mock_kernels_dir})
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--user', env=my_env)
+    assert ret.success
+    assert ret.stdout == ''
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_python', 'kernel-pod.json'), "r") as fd:
+        precompiled = json.load(fd)
+        pod = precompiled["objects"][0]
+        assert pod["kind"] == 'Pod'
+        assert pod["metadata"]["labels"]["kernel_name"] == 'k8skp_python'
+        assert pod["metadata"]["name"] == '@@kernel_pod_name@@'
+        assert {'path': [0, 'metadata', 'name'], 'value': '@@kernel_pod_name@@'} in precompiled["patches"]
+        assert {'path': [0, 'spec', 'securityContext', 'runAsUser'], 'keyword': 'kernel_uid'} in \
+            precompiled["patches"]
+        assert 'kernel_cpus' in precompiled["referenced"]
+        assert len(precompiled["templates"]['/kernel-pod.yaml.j2']) == 64  # sha256 of the template's content
+
+    # Spark kernelspecs are not precompiled
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--spark', '--user', env=my_env)
+    assert ret.success
+    assert not os.path.exists(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_python_spark', 'kernel-pod.json'))
+
+
+@pytest.mark.parametrize('kernel_env', [
+    {},
+    {"KERNEL_UID": '1000'},
+    {"KERNEL_GID": '100'},
+    {"KERNEL_UID": '1000', "KERNEL_GID": '100'},
+    {"KERNEL_PRIORITY_CLASS_NAME": 'interactive', "KERNEL_WORKING_DIR": '/home/jovyan/work'},
+    {"KERNEL_SHARD": '3', "KERNEL_REPLICA": 'gateway-0', "KERNEL_GENERATION": '2'},
+    {"KERNEL_GENERATION": None},
+])
+def test_launch_precompiled_pod_matches_template(script_runner, mock_kernels_dir, kernel_env):
+    my_env = os.environ.copy()
+    my_env.update({"JUPYTER_DATA_DIR": mock_kernels_dir})
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--user', env=my_env)
+    assert ret.success
+    kernel_dir = os.path.join(mock_kernels_dir, 'kernels', 'k8skp_python')
+    with open(os.path.join(kernel_dir, 'k8skp_kernel.json'), "r") as fd:
+        kernel_json = json.load(fd)
+
+    launch_env = {name: value for name, value in os.environ.items() if not name.startswith('KERNEL_')}
+    launch_env.update(kernel_json["env"])
+    launch_env.update({"KERNEL_ID": 'k1', "KERNEL_NAMESPACE": 'kernels', "KERNEL_POD_NAME": 'bob-k1',
+                       "KERNEL_USERNAME": 'bob', "KERNEL_LANGUAGE": 'python', "KERNEL_GENERATION": '0',
+                       "KERNEL_IMAGE": 'elyra/kernel-py:dev', "KERNEL_SERVICE_ACCOUNT_NAME": 'default'})
+    launch_env.update({name: value for name, value in kernel_env.items() if value is not None})
+    for name in [name for name, value in kernel_env.items() if value is None]:
+        launch_env.pop(name)
+    argv = [arg.format(kernel_id='k1', response_address='10.0.0.1:8877') for arg in kernel_json["argv"]]
+
+    # The same launch, using the precompiled pod and then rendering the template, produces the same pod.
+    precompiled = script_runner.run(sys.executable, *argv[1:], '--dry-run', env=launch_env)
+    assert precompiled.success, precompiled.stderr
+    os.remove(os.path.join(kernel_dir, 'kernel-pod.json'))
+    rendered = script_runner.run(sys.executable, *argv[1:], '--dry-run', env=launch_env)
+    assert rendered.success, rendered.stderr
+    assert list(yaml.safe_load_all(precompiled.stdout)) == list(yaml.safe_load_all(rendered.stdout))
+
+
+def test_bad_spark_launch_mode(script_runner):
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--spark', '--spark_launch_mode=bogus')
+    assert ret.success is False
+    assert ret.stdout == ''
+    assert "[K8SKP_SpecInstaller] ERROR | Spark launch mode 'bogus' is not in the set of supported launch " \
+           "modes" in ret.stderr
+
+
+def test_create_direct_spark_kernelspec(script_runner, mock_kernels_dir):
+    my_env = os.environ.copy()
+    my_env.update({"JUPYTER_DATA_DIR": mock_kernels_dir})
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--spark', '--spark_launch_mode=Direct',
+                            '--placement_policy=spread', '--user', env=my_env)
+    assert ret.success
+    assert ret.stderr.startswith("[K8SKP_SpecInstaller] Installing Kubernetes Kernel Provider")
+    assert ret.stdout == ''
+
+    assert os.path.isfile(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_python_spark', 'scripts',
+                                       'spark-driver.yaml.j2'))
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_python_spark', 'k8skp_kernel.json'), "r") as fd:
+        kernel_json = json.load(fd)
+        assert kernel_json["env"]["KERNEL_PLACEMENT_POLICY"] == 'spread'
+        argv = kernel_json["argv"]
+        assert argv[1].endswith(os.path.join('scripts', 'launch_kubernetes.py'))
+        assert argv[len(argv) - 2] == 'lazy'
+        assert argv[len(argv) - 1] == '--spark-driver'
+
+
+def test_launch_direct_spark_kernel(script_runner, mock_kernels_dir):
+    my_env = os.environ.copy()
+    my_env.update({"JUPYTER_DATA_DIR": mock_kernels_dir})
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--spark', '--spark_launch_mode=direct',
+                            '--user', env=my_env)
+    assert ret.success
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_python_spark', 'k8skp_kernel.json'), "r") as fd:
+        kernel_json = json.load(fd)
+
+    # Launch (as a dry run) using the installed kernelspec's argv and env, as the kernel provider would, leaving
+    # the optional KERNEL_ values referenced by SPARK_OPTS (e.g., KERNEL_EXTRA_SPARK_OPTS) unset.
+    launch_env = {name: value for name, value in os.environ.items() if not name.startswith('KERNEL_')}
+    launch_env.update(kernel_json["env"])
+    launch_env.update({"KUBERNETES_SERVICE_HOST": '10.96.0.1', "KUBERNETES_SERVICE_PORT": '443'})
+    launch_env.update({"KERNEL_ID": 'k1', "KERNEL_NAMESPACE": 'kernels', "KERNEL_POD_NAME": 'bob-k1',
+                       "KERNEL_USERNAME": 'bob', "KERNEL_LANGUAGE": 'python', "KERNEL_GENERATION": '0',
+                       "KERNEL_IMAGE": 'elyra/kernel-spark-py:dev',
+                       "KERNEL_EXECUTOR_IMAGE": 'elyra/kernel-spark-py:dev'})
+    argv = [arg.format(kernel_id='k1', response_address='10.0.0.1:8877') for arg in kernel_json["argv"]]
+    ret = script_runner.run(sys.executable, *argv[1:], '--dry-run', env=launch_env)
+    assert ret.success, ret.stderr
+
+    k8s_objs = list(yaml.safe_load_all(ret.stdout))
+    assert [k8s_obj['kind'] for k8s_obj in k8s_objs] == ['Pod', 'ConfigMap', 'Service']
+    properties = k8s_objs[1]['data']['spark.properties']
+    assert '$' not in properties
+    assert 'spark.app.name=bob-k1' in properties
+    assert 'spark.master=k8s://https://10.96.0.1:443' in properties
+    assert k8s_objs[0]['metadata']['labels']['kernel_id'] == 'k1'
+    assert 'kernel_shard' not in k8s_objs[0]['metadata']['labels']
+
+    # Options can embed their values ('--opt=value') and spark-submit's short form of --conf (-c) is accepted.
+    launch_env["KERNEL_EXTRA_SPARK_OPTS"] = "--conf=spark.foo=a=b -c spark.bar=baz --name=my-app --driver-memory=2g"
+    ret = script_runner.run(sys.executable, *argv[1:], '--dry-run', env=launch_env)
+    assert ret.success, ret.stderr
+    properties = list(yaml.safe_load_all(ret.stdout))[1]['data']['spark.properties'].splitlines()
+    for conf in ('spark.foo=a=b', 'spark.bar=baz', 'spark.app.name=my-app', 'spark.driver.memory=2g'):
+        assert conf in properties
+
+    launch_env["KERNEL_EXTRA_SPARK_OPTS"] = "-c spark.foo"
+    ret = script_runner.run(sys.executable, *argv[1:], '--dry-run', env=launch_env)
+    assert ret.success is False
+    assert "Invalid Spark configuration 'spark.foo'" in ret.stderr
+
+
+def test_create_spark_local_dirs_kernelspec(script_runner, mock_kernels_dir):
+    my_env = os.environ.copy()
+    my_env.update({"JUPYTER_DATA_DIR": mock_kernels_dir})
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--spark', '--spark_local_dirs=memory:8Gi',
+                            '--user', env=my_env)
+    assert ret.success
+    assert ret.stdout == ''
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_python_spark', 'k8skp_kernel.json'), "r") as fd:
+        kernel_json = json.load(fd)
+        assert kernel_json["env"]["KERNEL_SPARK_LOCAL_DIRS"] == 'memory:8Gi'
+        assert "${KERNEL_SPARK_LOCAL_DIR_OPTS}" in kernel_json["env"]["SPARK_OPTS"]
+
+
+def test_bad_spark_local_dirs(script_runner):
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--spark', '--spark_local_dirs=hostPath:')
+    assert ret.success is False
+    assert ret.stdout == ''
+    assert "[K8SKP_SpecInstaller] ERROR | Spark local dirs 'hostPath:' are invalid" in ret.stderr
+
+
+def test_create_all_kernelspecs(script_runner, mock_kernels_dir):
+    my_env = os.environ.copy()
+    my_env.update({"JUPYTER_DATA_DIR": mock_kernels_dir})
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--all', '--user', env=my_env)
+    assert ret.success
+    assert ret.stdout == ''
+
+    assert sorted(os.listdir(os.path.join(mock_kernels_dir, 'kernels'))) == \
+        ['k8skp_python', 'k8skp_python_spark', 'k8skp_python_tf', 'k8skp_r', 'k8skp_r_spark', 'k8skp_scala',
+         'k8skp_scala_spark']
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_r_spark', 'k8skp_kernel.json'), "r") as fd:
+        kernel_json = json.load(fd)
+        assert kernel_json["display_name"] == 'Kubernetes R (with Spark)'
+        assert kernel_json["metadata"]["lifecycle_manager"]["config"]["image_name"] == 'elyra/kernel-spark-r:dev'
+
+
+def test_create_manifest_kernelspecs(script_runner, mock_kernels_dir):
+    manifest_file = os.path.join(mock_kernels_dir, 'manifest.yaml')
+    with open(manifest_file, 'w') as fd:
+        fd.write("defaults:\n"
+                 "  spark_home: /foo/bar\n"
+                 "kernelspecs:\n"
+                 "- language: R\n"
+                 "  image_name: foo/r:zed\n"
+                 "- language: Scala\n"
+                 "  spark: true\n"
+                 "  kernel_name: my_scala_kernel\n")
+
+    my_env = os.environ.copy()
+    my_env.update({"JUPYTER_DATA_DIR": mock_kernels_dir})
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--manifest={}'.format(manifest_file), '--user',
+                            env=my_env)
+    assert ret.success
+    assert ret.stdout == ''
+
+    assert sorted(os.listdir(os.path.join(mock_kernels_dir, 'kernels'))) == ['k8skp_r', 'my_scala_kernel']
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_r', 'k8skp_kernel.json'), "r") as fd:
+        kernel_json = json.load(fd)
+        assert kernel_json["metadata"]["lifecycle_manager"]["config"]["image_name"] == 'foo/r:zed'
+    assert os.path.isfile(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_r', 'kernel-pod.json'))
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'my_scala_kernel', 'k8skp_kernel.json'), "r") as fd:
+        kernel_json = json.load(fd)
+        assert kernel_json["display_name"] == 'Kubernetes Scala (with Spark)'
+        assert kernel_json["env"]["SPARK_HOME"] == '/foo/bar'
+
+
+def test_bad_manifest(script_runner, mock_kernels_dir):
+    manifest_file = os.path.join(mock_kernels_dir, 'manifest.yaml')
+    with open(manifest_file, 'w') as fd:
+        fd.write("kernelspecs:\n"
+                 "- language: R\n"
+                 "  bogus: true\n")
+
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--manifest={}'.format(manifest_file))
+    assert ret.success is False
+    assert ret.stdout == ''
+    assert "[K8SKP_SpecInstaller] ERROR | Manifest '{}' contains unsupported options ['bogus']".\
+        format(manifest_file) in ret.stderr
+
+
+def test_create_pinned_image_kernelspec(script_runner, mock_kernels_dir):
+    digest = 'sha256:' + 'a' * 64
+    digest_map_file = os.path.join(mock_kernels_dir, 'digests.yaml')
+    with open(digest_map_file, 'w') as fd:
+        fd.write("foo/bar:zed: {}\n".format(digest))
+
+    my_env = os.environ.copy()
+    my_env.update({"JUPYTER_DATA_DIR": mock_kernels_dir})
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--image_name=foo/bar:zed',
+                            '--digest_map={}'.format(digest_map_file), '--user', env=my_env)
+    assert ret.success
+    assert ret.stdout == ''
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_python', 'k8skp_kernel.json'), "r") as fd:
+        kernel_json = json.load(fd)
+        assert kernel_json["metadata"]["lifecycle_manager"]["config"]["image_name"] == 'foo/bar:zed@' + digest
+        assert kernel_json["env"]["KERNEL_IMAGE_PULL_POLICY"] == 'IfNotPresent'
+
+    with open(os.path.join(mock_kernels_dir, 'kernels', 'k8skp_python', 'kernel-pod.json'), "r") as fd:
+        pod = json.load(fd)["objects"][0]
+        assert pod["spec"]["containers"][0]["imagePullPolicy"] == 'IfNotPresent'
+
+    # images missing from the digest map can't be pinned
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--image_name=foo/bar:other',
+                            '--digest_map={}'.format(digest_map_file), '--user', env=my_env)
+    assert ret.success is False
+    assert "[K8SKP_SpecInstaller] ERROR | Unable to pin image 'foo/bar:other' to its digest" in ret.stderr
+
+
+def test_bad_image_pull_policy(script_runner):
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'install', '--image_pull_policy=sometimes')
+    assert ret.success is False
+    assert ret.stdout == ''
+    assert "[K8SKP_SpecInstaller] ERROR | Image pull policy 'sometimes' is not in the set of supported image " \
+           "pull policies" in ret.stderr
+
+
+def test_recommend_no_usage(script_runner, mock_kernels_dir):
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'recommend',
+                            '--usage_file={}'.format(os.path.join(mock_kernels_dir, 'missing.json')))
+    assert ret.success is False
+    assert ret.stdout == ''
+    assert "[K8SKP_RecommendApp] ERROR | Usage file" in ret.stderr
+
+
+def test_recommend(script_runner, mock_kernels_dir):
+    usage_file = os.path.join(mock_kernels_dir, 'k8skp_usage.json')
+    usage = {
+        'k8skp_python': {'samples': 10,
+                         'cpu': {'growth': 1.05, 'minimum': 0.001, 'buckets': {'99': 9.0, '140': 1.0}},
+                         'memory': {'growth': 1.05, 'minimum': 1048576, 'buckets': {'117': 9.0, '146': 1.0}}},
+        'k8skp_r': {'samples': 4,
+                    'cpu': {'growth': 1.05, 'minimum': 0.001, 'buckets': {'50': 4.0}},
+                    'memory': {'growth': 1.05, 'minimum': 1048576, 'buckets': {'100': 4.0}}},
+    }
+    with open(usage_file, 'w') as fd:
+        json.dump(usage, fd)
+
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'recommend', '--usage_file={}'.format(usage_file),
+                            '--kernel_name=k8skp_python')
+    assert ret.success
+    assert ret.stderr == ''
+    lines = ret.stdout.splitlines()
+    assert lines[0].split() == ['KERNEL', 'SAMPLES', 'CPU_REQUEST', 'CPU_LIMIT', 'MEMORY_REQUEST', 'MEMORY_LIMIT']
+    assert len(lines) == 2
+    assert lines[1].split() == ['k8skp_python', '10', '144m', '1203m', '347Mi', '1613Mi']
+
+
+def test_replay_no_trace(script_runner, mock_kernels_dir):
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'replay',
+                            '--trace_file={}'.format(os.path.join(mock_kernels_dir, 'missing.jsonl')))
+    assert ret.success is False
+    assert ret.stdout == ''
+    assert "[K8SKP_ReplayApp] ERROR | Trace file" in ret.stderr
+
+
+def test_replay(script_runner, mock_kernels_dir):
+    trace_file = os.path.join(mock_kernels_dir, 'k8skp_api_trace.jsonl')
+    with open(trace_file, 'w') as fd:
+        for i in range(6):
+            entry = {'ts': 1000.0 + i * 0.01, 'verb': 'GET' if i % 2 else 'POST', 'resource': 'pods',
+                     'path': '/api/v1/namespaces/kernels/pods', 'status': 200 if i % 2 else 201,
+                     'latency': 0.1, 'bytes': 256}
+            fd.write(json.dumps(entry) + '\n')
+
+    ret = script_runner.run('jupyter-k8s-kernelspec', 'replay', '--trace_file={}'.format(trace_file))
+    assert ret.success
+    assert "[K8SKP_ReplayApp] Replaying 6 requests" in ret.stderr
+    lines = ret.stdout.splitlines()
+    assert lines[0].startswith("Requests: 6")
+    assert lines[1].split() == ['CALL', 'COUNT', 'MISMATCHES', 'P50_SECS', 'P99_SECS']
+    assert lines[2].split()[:4] == ['GET', 'pods', '3', '0']
+    assert lines[3].split()[:4] == ['POST', 'pods', '3', '0']
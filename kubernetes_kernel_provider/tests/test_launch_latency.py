@@ -0,0 +1,126 @@
+"""Tests the startup latency histograms used to derive adaptive launch timeouts"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import json
+import os
+import pytest
+
+from kubernetes_kernel_provider import launch_latency
+from kubernetes_kernel_provider.stats import LogHistogram
+
+
+@pytest.fixture()
+def latencies(monkeypatch, tmpdir):
+    latency_file = str(tmpdir.join('k8skp_launch_latency.json'))
+    monkeypatch.setattr(launch_latency, 'latency_file', latency_file)
+    monkeypatch.setattr(launch_latency, 'adaptive_launch_timeout', True)
+    monkeypatch.setattr(launch_latency, 'min_samples', 10)
+    monkeypatch.setattr(launch_latency, 'timeout_percentile', 99.0)
+    monkeypatch.setattr(launch_latency, 'timeout_margin', 1.5)
+    monkeypatch.setattr(launch_latency, 'min_timeout', 15.0)
+    monkeypatch.setattr(launch_latency, 'max_timeout', 900.0)
+    monkeypatch.setattr(launch_latency, 'latency_decay', 0.98)
+    monkeypatch.setattr(launch_latency, 'save_interval', 3600.0)  # saves are flushed explicitly
+    monkeypatch.setattr(launch_latency, '_latencies', None)
+    yield latency_file
+    launch_latency.flush()  # cancel any pending save
+
+
+def test_histogram_percentile_accuracy():
+    histogram = LogHistogram(minimum=0.1)
+    for value in range(1, 101):
+        histogram.add(float(value))
+    for pct in (50, 90, 99):
+        # the bucket's upper bound is within the growth factor of the actual value
+        assert pct <= histogram.percentile(pct) <= pct * histogram.growth
+    assert histogram.percentile(100) == pytest.approx(100, rel=histogram.growth - 1)
+    assert LogHistogram().percentile(50) is None
+
+
+def test_histogram_clamps_to_minimum():
+    histogram = LogHistogram(minimum=0.1)
+    histogram.add(0.0)
+    histogram.add(0.05)
+    assert histogram.buckets == {0: 2.0}
+    assert histogram.percentile(100) == 0.1
+
+
+def test_histogram_decay():
+    histogram = LogHistogram(minimum=0.1)
+    histogram.add(1.0)
+    histogram.decay(0.5)
+    histogram.add(100.0)
+    assert histogram.total == pytest.approx(1.5)
+    assert histogram.percentile(50) >= 100  # the recent value dominates
+    histogram.decay(0.0005)  # weights below epsilon are discarded
+    assert histogram.buckets == {}
+
+
+def test_histogram_round_trip():
+    histogram = LogHistogram(minimum=0.1)
+    for value in (0.5, 2.0, 30.0):
+        histogram.add(value, weight=0.5)
+    restored = LogHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+    assert restored.buckets == histogram.buckets
+    assert restored.percentile(50) == histogram.percentile(50)
+
+
+def test_timeout_requires_min_samples(latencies):
+    for _ in range(9):
+        launch_latency.record('k8skp_python|image', 20.0)
+    assert launch_latency.get_timeout('k8skp_python|image') is None
+    launch_latency.record('k8skp_python|image', 20.0)
+    assert launch_latency.get_timeout('k8skp_python|image') == pytest.approx(30.0, rel=0.05)
+    assert launch_latency.get_timeout('k8skp_r|image') is None
+
+
+def test_timeout_disabled(latencies, monkeypatch):
+    for _ in range(10):
+        launch_latency.record('k8skp_python|image', 20.0)
+    monkeypatch.setattr(launch_latency, 'adaptive_launch_timeout', False)
+    assert launch_latency.get_timeout('k8skp_python|image') is None
+
+
+def test_timeout_bounds(latencies):
+    for _ in range(10):
+        launch_latency.record('fast|image', 1.0)
+        launch_latency.record('slow|image', 1000.0)
+    assert launch_latency.get_timeout('fast|image') == 15.0
+    assert launch_latency.get_timeout('slow|image') == 900.0
+
+
+def test_timeouts_are_censored(latencies, monkeypatch):
+    monkeypatch.setattr(launch_latency, 'timeout_percentile', 95.0)
+    for _ in range(200):
+        launch_latency.record('k8skp_python|image', 20.0)
+    timeout = launch_latency.get_timeout('k8skp_python|image')
+
+    # a timeout doesn't drag the percentile toward the timeout itself
+    launch_latency.record_timeout('k8skp_python|image')
+    assert launch_latency.get_timeout('k8skp_python|image') == timeout
+
+    # once more launches time out than the percentile allows for, the configured timeout applies
+    for _ in range(5):
+        launch_latency.record_timeout('k8skp_python|image')
+    assert launch_latency.get_timeout('k8skp_python|image') is None
+
+
+def test_persistence_round_trip(latencies, monkeypatch):
+    for _ in range(10):
+        launch_latency.record('k8skp_python|image', 20.0)
+    launch_latency.record_timeout('k8skp_r|image')
+    timeout = launch_latency.get_timeout('k8skp_python|image')
+    assert timeout is not None
+    assert not os.path.exists(latencies)  # saves are deferred
+
+    launch_latency.flush()
+    assert os.listdir(os.path.dirname(latencies)) == [os.path.basename(latencies)]  # no temp files remain
+    with open(latencies) as f:
+        data = json.load(f)
+        assert data['k8skp_python|image']['samples'] == 10
+        assert data['k8skp_r|image']['timeouts'] == 1.0
+
+    monkeypatch.setattr(launch_latency, '_latencies', None)
+    assert launch_latency.get_timeout('k8skp_python|image') == timeout
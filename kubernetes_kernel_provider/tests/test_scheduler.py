@@ -0,0 +1,103 @@
+"""Tests the fair-share scheduling of kernel launches"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import asyncio
+import pytest
+
+from kubernetes_kernel_provider.scheduler import LaunchScheduler, parse_weights
+
+
+@pytest.fixture()
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+
+
+def test_parse_weights():
+    assert parse_weights('') == {}
+    assert parse_weights('alice=2, batch-user=0.5') == {'alice': 2.0, 'batch-user': 0.5}
+    for specs in ('alice', 'alice=0', '=2', 'alice=-1'):
+        with pytest.raises(ValueError):
+            parse_weights(specs)
+
+
+def test_disabled(loop):
+    scheduler = LaunchScheduler()
+    loop.run_until_complete(scheduler.acquire('alice'))
+    scheduler.release('alice')
+    assert scheduler.in_progress == 0
+
+
+def test_per_user_limit(loop):
+    scheduler = LaunchScheduler(max_per_user=1)
+    loop.run_until_complete(scheduler.acquire('alice'))
+    loop.run_until_complete(scheduler.acquire('bob'))  # other users aren't limited by alice's launches
+    with pytest.raises(asyncio.TimeoutError):
+        loop.run_until_complete(scheduler.acquire('alice', timeout=0.01))
+    assert scheduler.queue_depth == 0
+    assert scheduler.in_progress == 2
+
+
+def test_weighted_fairness(loop):
+    scheduler = LaunchScheduler(max_concurrent=1, weights={'alice': 2})
+    order = []
+
+    async def launch(user):
+        await scheduler.acquire(user)
+        order.append(user)
+        await asyncio.sleep(0)
+        scheduler.release(user)
+
+    async def launches():
+        await scheduler.acquire('bob')  # hold the only slot while the others queue
+        tasks = [asyncio.ensure_future(launch(user)) for user in ['bob'] * 6 + ['alice'] * 6]
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth == 12
+        scheduler.release('bob')
+        await asyncio.gather(*tasks)
+
+    loop.run_until_complete(launches())
+    # bob's burst doesn't starve alice, who is dispatched twice as often while both are waiting
+    assert order[:9] == ['alice', 'alice', 'bob', 'alice', 'alice', 'bob', 'alice', 'alice', 'bob']
+    assert scheduler.in_progress == 0
+
+
+def test_cancel_while_queued(loop):
+    scheduler = LaunchScheduler(max_concurrent=1)
+
+    async def launches():
+        await scheduler.acquire('alice')
+        queued = asyncio.ensure_future(scheduler.acquire('bob'))
+        waiting = asyncio.ensure_future(scheduler.acquire('carol'))
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth == 2
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert scheduler.queue_depth == 1
+        scheduler.release('alice')
+        await waiting  # the slot goes to the next waiter rather than the cancelled launch
+        assert scheduler.user_in_progress == {'carol': 1}
+
+    loop.run_until_complete(launches())
+
+
+def test_release_on_error(loop):
+    scheduler = LaunchScheduler(max_concurrent=1)
+
+    async def failed_launch():
+        await scheduler.acquire('alice')
+        try:
+            raise RuntimeError("launch failed")
+        finally:
+            scheduler.release('alice')
+
+    with pytest.raises(RuntimeError):
+        loop.run_until_complete(failed_launch())
+    assert scheduler.in_progress == 0
+    assert scheduler.user_in_progress == {}
+    loop.run_until_complete(scheduler.acquire('bob', timeout=0.01))  # the slot was returned
@@ -0,0 +1,128 @@
+"""Tests the partitioning of kernel ownership across gateway replicas"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import logging
+import pytest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from kubernetes.client.rest import ApiException
+
+from kubernetes_kernel_provider import sharding
+
+
+def lease(name, holder, renewed=None, duration=30, version='1'):
+    return SimpleNamespace(metadata=SimpleNamespace(name=name, resource_version=version),
+                           spec=SimpleNamespace(holder_identity=holder, renew_time=renewed or datetime.utcnow(),
+                                                lease_duration_seconds=duration, lease_transitions=0))
+
+
+class FakeCoordinationApi(object):
+    """Holds the leases of a single namespace, recording the shard leases patched and created."""
+    def __init__(self):
+        self.shard_leases = {}
+        self.members = {}
+        self.patched = []
+        self.created = []
+
+    def __call__(self):
+        return self
+
+    def list_namespaced_lease(self, namespace, label_selector):
+        leases = self.members if label_selector == sharding.MEMBER_SELECTOR else self.shard_leases
+        return SimpleNamespace(items=list(leases.values()))
+
+    def patch_namespaced_lease(self, name, namespace, body):
+        if name in self.members or 'replica' in name:
+            if name not in self.members:
+                raise ApiException(status=404)
+            return
+        current = self.shard_leases[name]
+        if body['metadata'].get('resourceVersion') != current.metadata.resource_version:
+            raise ApiException(status=409)
+        self.patched.append((name, body['spec']['holderIdentity']))
+        self.shard_leases[name] = lease(name, body['spec']['holderIdentity'],
+                                        version=str(int(current.metadata.resource_version) + 1))
+
+    def create_namespaced_lease(self, namespace, body):
+        name = body['metadata']['name']
+        if 'replica' in name:
+            self.members[name] = lease(name, body['spec']['holderIdentity'])
+            return
+        self.created.append(name)
+        self.shard_leases[name] = lease(name, body['spec']['holderIdentity'])
+
+
+@pytest.fixture()
+def api(monkeypatch):
+    api = FakeCoordinationApi()
+    monkeypatch.setattr(sharding.client, 'CoordinationV1Api', api)
+    monkeypatch.setattr(sharding, 'shard_count', 4)
+    monkeypatch.setattr(sharding, '_kernel_shards', {})
+    monkeypatch.setattr(sharding, 'lease_manager', None)
+    yield api
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(sharding, 'shard_count', 0)
+    monkeypatch.setattr(sharding, 'lease_manager', None)
+    assert not sharding.is_enabled()
+    assert sharding.selector('component=kernel') == 'component=kernel'
+    assert sharding.assign_shard('k1') is None
+
+
+def test_acquires_all_shards(api):
+    manager = sharding.ShardLeaseManager(logging.getLogger(), identity='me')
+    assert manager.reconcile() == [0, 1, 2, 3]
+    assert api.created == ['k8skp-shard-0', 'k8skp-shard-1', 'k8skp-shard-2', 'k8skp-shard-3']
+    assert manager.reconcile() == [0, 1, 2, 3]  # renewed
+    assert len(api.patched) == 4
+
+
+def test_assign_shard_and_selector(api, monkeypatch):
+    assert sharding.selector('component=kernel') == 'component=kernel,kernel_shard in (none)'
+    monkeypatch.setattr(sharding, 'lease_manager', sharding.ShardLeaseManager(logging.getLogger(), identity='me'))
+    sharding.lease_manager.held = {1, 3}
+    assert sharding.selector('component=kernel') == 'component=kernel,kernel_shard in (1,3)'
+    shards = [sharding.assign_shard('kernel-{}'.format(i)) for i in range(20)]
+    assert set(shards) == {1, 3}
+    assert sharding.assign_shard('kernel-7') == shards[7]  # stable for a given kernel
+
+
+def test_hand_off_retains_busy_shards(api):
+    manager = sharding.ShardLeaseManager(logging.getLogger(), identity='me')
+    manager.reconcile()
+
+    # a second replica joins, halving the fair share - only shards without kernels are handed off
+    api.members['k8skp-shard-replica-other'] = lease('k8skp-shard-replica-other', 'other')
+    sharding.register_kernel('k', 3)
+    assert manager.reconcile() == [0, 3]
+    assert ('k8skp-shard-1', None) in api.patched and ('k8skp-shard-2', None) in api.patched
+    assert sharding.held_shards() == []  # the module's manager isn't started
+
+    # the other replica acquires the released shards, which aren't taken back
+    for name in ('k8skp-shard-1', 'k8skp-shard-2'):
+        api.shard_leases[name] = lease(name, 'other', version='9')
+    assert manager.reconcile() == [0, 3]
+
+    # with four replicas, shards with kernels are retained beyond the fair share until their kernels terminate
+    sharding.register_kernel('k0', 0)
+    for identity in ('third', 'fourth'):
+        api.members['k8skp-shard-replica-' + identity] = lease('k8skp-shard-replica-' + identity, identity)
+    assert manager.reconcile() == [0, 3]
+    sharding.unregister_kernel('k')
+    assert manager.reconcile() == [0]
+    assert ('k8skp-shard-3', None) in api.patched
+
+
+def test_takes_over_expired_shards(api):
+    expired = datetime.utcnow() - timedelta(seconds=120)
+    for shard in range(4):
+        name = 'k8skp-shard-{}'.format(shard)
+        api.shard_leases[name] = lease(name, 'gone', renewed=expired)
+    api.members['k8skp-shard-replica-gone'] = lease('k8skp-shard-replica-gone', 'gone', renewed=expired)
+    manager = sharding.ShardLeaseManager(logging.getLogger(), identity='me')
+    assert manager.reconcile() == [0, 1, 2, 3]
+    assert api.created == []
@@ -0,0 +1,163 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Per-kernelspec resource usage sampling and rightsizing recommendations.
+
+When K8SKP_USAGE_SAMPLING_INTERVAL_SECS is positive, the provider periodically retrieves the usage of
+all kernel pods (those labeled 'component=kernel') from metrics.k8s.io in a single, batched LIST and
+folds each pod's CPU and memory usage into decaying histograms kept per kernelspec (via the pod's
+'kernel_name' label).  The histograms are persisted to K8SKP_USAGE_FILE from which recommended
+request and limit values can be derived - see `jupyter k8s-kernelspec recommend`.
+
+For local use and testing, K8SKP_USAGE_METRICS_FILE can name a JSON file in PodMetricsList format
+that is read in place of querying metrics.k8s.io.
+"""
+
+import asyncio
+import json
+import os
+
+from jupyter_core.paths import jupyter_data_dir
+from kubernetes import client
+
+from . import sharding
+from .admission import parse_quantity
+from .stats import LogHistogram
+
+sampling_interval = float(os.getenv('K8SKP_USAGE_SAMPLING_INTERVAL_SECS', '0'))
+usage_file = os.getenv('K8SKP_USAGE_FILE', os.path.join(jupyter_data_dir(), 'k8skp_usage.json'))
+metrics_file = os.getenv('K8SKP_USAGE_METRICS_FILE')
+half_life_hours = float(os.getenv('K8SKP_USAGE_HALF_LIFE_HOURS', '168'))
+persist_every = int(os.getenv('K8SKP_USAGE_PERSIST_EVERY', '10'))
+
+KERNEL_SELECTOR = 'component=kernel'
+
+# Recommendations: requests track typical usage, limits track peaks - each with some headroom.
+REQUEST_PERCENTILE = 90
+LIMIT_PERCENTILE = 99
+REQUEST_MARGIN = 1.15
+LIMIT_MARGIN = 1.3
+MIN_CPU = 0.01  # cores
+MIN_MEMORY = 2 ** 26  # bytes (64Mi)
+
+
+def new_usage_entry():
+    return {'samples': 0, 'cpu': LogHistogram(minimum=1e-3), 'memory': LogHistogram(minimum=2 ** 20)}
+
+
+def load_usage(path=None):
+    """Loads the persisted per-kernelspec usage histograms, returning an empty dict if none exist."""
+    path = path or usage_file
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    return {name: {'samples': entry['samples'],
+                   'cpu': LogHistogram.from_dict(entry['cpu']),
+                   'memory': LogHistogram.from_dict(entry['memory'])} for name, entry in data.items()}
+
+
+def save_usage(usage, path=None):
+    """Atomically persists the per-kernelspec usage histograms."""
+    path = path or usage_file
+    data = {name: {'samples': entry['samples'], 'cpu': entry['cpu'].to_dict(), 'memory': entry['memory'].to_dict()}
+            for name, entry in usage.items()}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+
+def fetch_pod_metrics(label_selector=KERNEL_SELECTOR):
+    """Returns the PodMetricsList (as a dict) for all kernel pods via a single LIST call."""
+    if metrics_file:
+        with open(metrics_file) as f:
+            return json.load(f)
+    return client.CustomObjectsApi().list_cluster_custom_object('metrics.k8s.io', 'v1beta1', 'pods',
+                                                                label_selector=label_selector)
+
+
+def record_sample(usage, pod_metrics, decay_factor=1.0):
+    """Folds one PodMetricsList into `usage`, returning the number of pods recorded."""
+    recorded = 0
+    for entry in usage.values():
+        entry['cpu'].decay(decay_factor)
+        entry['memory'].decay(decay_factor)
+    for item in pod_metrics.get('items', []):
+        labels = item.get('metadata', {}).get('labels') or {}
+        kernel_name = labels.get('kernel_name')
+        if not kernel_name or labels.get('spark-role') == 'executor':
+            continue
+        cpu = sum(parse_quantity(c['usage'].get('cpu')) for c in item.get('containers', []))
+        memory = sum(parse_quantity(c['usage'].get('memory')) for c in item.get('containers', []))
+        entry = usage.setdefault(kernel_name, new_usage_entry())
+        entry['cpu'].add(cpu)
+        entry['memory'].add(memory)
+        entry['samples'] += 1
+        recorded += 1
+    return recorded
+
+
+def _format_cpu(cores):
+    return "{}m".format(int(max(cores, MIN_CPU) * 1000 + 0.5))
+
+
+def _format_memory(num_bytes):
+    return "{}Mi".format(int(max(num_bytes, MIN_MEMORY) / 2 ** 20 + 0.5))
+
+
+def recommend(usage):
+    """Derives recommended request and limit values for each kernelspec in `usage`."""
+    recommendations = {}
+    for name, entry in sorted(usage.items()):
+        cpu, memory = entry['cpu'], entry['memory']
+        if cpu.total <= 0 or memory.total <= 0:
+            continue
+        recommendations[name] = {
+            'samples': entry['samples'],
+            'cpu_request': _format_cpu(cpu.percentile(REQUEST_PERCENTILE) * REQUEST_MARGIN),
+            'cpu_limit': _format_cpu(cpu.percentile(LIMIT_PERCENTILE) * LIMIT_MARGIN),
+            'memory_request': _format_memory(memory.percentile(REQUEST_PERCENTILE) * REQUEST_MARGIN),
+            'memory_limit': _format_memory(memory.percentile(LIMIT_PERCENTILE) * LIMIT_MARGIN),
+        }
+    return recommendations
+
+
+class UsageSampler(object):
+    """Periodically samples kernel pod usage into the persisted per-kernelspec histograms."""
+    def __init__(self, log, label_selector=KERNEL_SELECTOR):
+        self.log = log
+        self.label_selector = label_selector
+        self.usage = load_usage()
+        self.passes = 0
+        # Decay weights each pass such that a sample's weight halves every `half_life_hours`.
+        self.decay_factor = 0.5 ** (sampling_interval / (half_life_hours * 3600.0)) if half_life_hours > 0 else 1.0
+
+    def sample(self):
+        # Each replica only samples the kernels of the shards it owns (see sharding.py).
+        recorded = record_sample(self.usage, fetch_pod_metrics(sharding.selector(self.label_selector)),
+                                 self.decay_factor)
+        self.passes += 1
+        if self.passes % persist_every == 0:
+            save_usage(self.usage)
+        return recorded
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.sample)
+            except Exception as err:
+                self.log.warning("Error occurred sampling kernel resource usage: {}".format(err))
+            await asyncio.sleep(sampling_interval)
+
+
+_sampler_task = None
+
+
+def start(log):
+    """Starts the background usage sampler, if enabled and not already started."""
+    global _sampler_task
+    if _sampler_task is None and sampling_interval > 0:
+        _sampler_task = asyncio.ensure_future(UsageSampler(log).run())
+    return _sampler_task